@@ -2,11 +2,22 @@
 
 from .connection import (
     engine,
+    engines,
+    get_engine,
+    PRIMARY,
+    ANALYTICS,
     SessionLocal,
     Base,
     get_db,
     get_db_session,
-    test_connection
+    get_pool_status,
+    test_connection,
+    TABLE_CHANGES_CHANNEL,
+    NotificationListener,
+    get_listener,
+    subscribe,
+    subscribe_table_changes,
+    is_listening
 )
 
 from .models import (
@@ -14,9 +25,46 @@ from .models import (
     Order,
     Position,
     Universe,
+    PnLSnapshot,
     OrderStatus
 )
 
+from .bar_cache import (
+    BarCache,
+    get_bar_cache,
+    update_bar_cache
+)
+
+from .spool import (
+    WriteSpool,
+    get_write_spool,
+    get_spool_status
+)
+
+from .schema import (
+    ColumnSpec,
+    TriggerSpec,
+    IndexSpec,
+    ensure_tables,
+    ensure_columns,
+    ensure_change_triggers,
+    ensure_indexes,
+    create_partitioned_price_table,
+    ensure_partitions,
+    ensure_upcoming_partitions,
+    check_query_plans
+)
+
+from .outbox import (
+    SIGNAL_CHANNEL,
+    create_outbox_table,
+    publish_signals,
+    claim_signals,
+    ack_signals,
+    dead_letter_signal,
+    SIGNAL_MAX_ATTEMPTS
+)
+
 from .operations import (
     # Fill operations
     create_fill,
@@ -30,16 +78,20 @@ from .operations import (
     get_orders_by_symbol,
     get_orders_by_status,
     update_order_status,
+    update_order_statuses,
     get_all_orders,
 
     # Position operations
     create_position,
+    bulk_create_positions,
     get_position_by_id,
     get_positions_by_symbol,
     get_positions_by_status,
     update_position,
+    bulk_update_positions,
     delete_position,
     get_open_positions,
+    get_last_position_write,
 
     # Universe operations
     create_universe,
@@ -50,27 +102,89 @@ from .operations import (
     update_universe_status,
     delete_universe,
 
+    # P&L snapshot operations
+    create_pnl_snapshot,
+    get_latest_pnl_snapshot,
+    get_pnl_snapshots,
+
+    # Streaming operations
+    STREAM_BATCH_SIZE,
+    iter_fills,
+    iter_orders,
+    iter_positions,
+
+    # Trade analytics
+    TRADE_GROUPS,
+    get_trade_stats,
+    get_trade_stats_by,
+    get_entry_slippage,
+
     # Generic table operations
-    get_latest_entries
+    get_latest_entries,
+    get_bar_history
 )
 
 __all__ = [
     # Connection
     "engine",
+    "engines",
+    "get_engine",
+    "PRIMARY",
+    "ANALYTICS",
     "SessionLocal",
     "Base",
     "get_db",
     "get_db_session",
+    "get_pool_status",
     "test_connection",
+    "TABLE_CHANGES_CHANNEL",
+    "NotificationListener",
+    "get_listener",
+    "subscribe",
+    "subscribe_table_changes",
+    "is_listening",
 
     # Models
     "Fill",
     "Order",
     "Position",
     "Universe",
+    "PnLSnapshot",
     "OrderStatus",
 
 
+    # Bar cache
+    "BarCache",
+    "get_bar_cache",
+    "update_bar_cache",
+
+    # Write spool
+    "WriteSpool",
+    "get_write_spool",
+    "get_spool_status",
+
+    # Schema
+    "ColumnSpec",
+    "TriggerSpec",
+    "IndexSpec",
+    "ensure_tables",
+    "ensure_columns",
+    "ensure_change_triggers",
+    "ensure_indexes",
+    "create_partitioned_price_table",
+    "ensure_partitions",
+    "ensure_upcoming_partitions",
+    "check_query_plans",
+
+    # Signal outbox
+    "SIGNAL_CHANNEL",
+    "create_outbox_table",
+    "publish_signals",
+    "claim_signals",
+    "ack_signals",
+    "dead_letter_signal",
+    "SIGNAL_MAX_ATTEMPTS",
+
     # Fill operations
     "create_fill",
     "get_fill_by_id",
@@ -83,16 +197,20 @@ __all__ = [
     "get_orders_by_symbol",
     "get_orders_by_status",
     "update_order_status",
+    "update_order_statuses",
     "get_all_orders",
 
     # Position operations
     "create_position",
+    "bulk_create_positions",
     "get_position_by_id",
     "get_positions_by_symbol",
     "get_positions_by_status",
     "update_position",
+    "bulk_update_positions",
     "delete_position",
     "get_open_positions",
+    "get_last_position_write",
 
     # Universe operations
     "create_universe",
@@ -103,6 +221,24 @@ __all__ = [
     "update_universe_status",
     "delete_universe",
 
+    # P&L snapshot operations
+    "create_pnl_snapshot",
+    "get_latest_pnl_snapshot",
+    "get_pnl_snapshots",
+
+    # Streaming operations
+    "STREAM_BATCH_SIZE",
+    "iter_fills",
+    "iter_orders",
+    "iter_positions",
+
+    # Trade analytics
+    "TRADE_GROUPS",
+    "get_trade_stats",
+    "get_trade_stats_by",
+    "get_entry_slippage",
+
     # Generic table operations
-    "get_latest_entries"
+    "get_latest_entries",
+    "get_bar_history"
 ]
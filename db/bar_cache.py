@@ -0,0 +1,313 @@
+"""Columnar on-disk cache of settled bars from the price source tables.
+
+Each table gets a directory under the cache root with a meta.json describing its
+columns, and one directory per symbol holding a raw binary file per column: time as
+int64 nanoseconds since the epoch, every other column as float64. Files are only ever
+appended to and are read back with np.memmap, so readers get zero-copy views.
+
+Only bars older than the settle window are cached, since the most recent bar can still
+be revised. Newer bars are read from Postgres on demand (see get_latest_entries).
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .connection import get_engine, ANALYTICS
+from .statements import validate_table_name
+
+BAR_CACHE_DIR = os.getenv("BAR_CACHE_DIR", "")
+
+# Bars younger than this are left to Postgres, they may still change
+BAR_CACHE_SETTLE = timedelta(hours=float(os.getenv("BAR_CACHE_SETTLE_HOURS", "24")))
+
+SYMBOL_PATTERN = re.compile(r"^[A-Za-z0-9._-]+$")
+
+TIME_COLUMN = "time"
+SYMBOL_COLUMN = "symbol"
+
+
+class BarCache:
+    """Append-only, memory-mapped bar store keyed by price table and symbol."""
+
+    def __init__(self, root: str, settle: timedelta = BAR_CACHE_SETTLE):
+        self.root = Path(root)
+        self.settle = settle
+        self._meta: Dict[str, dict] = {}
+        self._maps: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _table_dir(self, table_name: str) -> Path:
+        return self.root / table_name
+
+    def _symbol_dir(self, table_name: str, symbol: str) -> Path:
+        return self._table_dir(table_name) / symbol
+
+    def meta(self, table_name: str) -> Optional[dict]:
+        """Column layout of a cached table, or None if it has not been built."""
+        meta = self._meta.get(table_name)
+        if meta is None:
+            try:
+                meta = json.loads((self._table_dir(table_name) / "meta.json").read_text())
+            except FileNotFoundError:
+                return None
+            self._meta[table_name] = meta
+        return meta
+
+    def value_columns(self, table_name: str) -> List[str]:
+        """Columns stored as float64 files (everything but symbol and time)."""
+        meta = self.meta(table_name)
+        return [c for c in meta["columns"] if c not in (SYMBOL_COLUMN, TIME_COLUMN)] if meta else []
+
+    # ===========================
+    # Reads
+    # ===========================
+
+    def read(self, table_name: str, symbol: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Memory-mapped columns for one symbol, oldest bar first.
+
+        Returns:
+            Dict of column name to read-only array ("time" is int64 ns), or None if not cached
+        """
+        meta = self.meta(table_name)
+        if meta is None or not SYMBOL_PATTERN.match(symbol):
+            return None
+
+        path = self._symbol_dir(table_name, symbol)
+        try:
+            rows = os.stat(path / "time.bin").st_size // 8
+        except FileNotFoundError:
+            return None
+        if rows == 0:
+            return None
+
+        # Reuse the maps while no rows have been appended since they were opened
+        key = (table_name, symbol)
+        cached = self._maps.get(key)
+        if cached is not None and cached[0] == rows:
+            return cached[1]
+
+        columns = {TIME_COLUMN: np.memmap(path / "time.bin", dtype=np.int64, mode="r", shape=(rows,))}
+        for column in self.value_columns(table_name):
+            columns[column] = np.memmap(path / f"{column}.bin", dtype=np.float64, mode="r", shape=(rows,))
+        self._maps[key] = (rows, columns)
+        return columns
+
+    def latest(self, table_name: str, symbol: str, n: int) -> Optional[Dict[str, np.ndarray]]:
+        """Views of the last n cached bars for a symbol."""
+        columns = self.read(table_name, symbol)
+        if columns is None:
+            return None
+        return {name: values[-n:] for name, values in columns.items()}
+
+    def last_time(self, table_name: str, symbol: str) -> Optional[datetime]:
+        """Time of the newest cached bar for a symbol."""
+        columns = self.read(table_name, symbol)
+        if columns is None:
+            return None
+        return self.to_datetime(table_name, int(columns[TIME_COLUMN][-1]))
+
+    def to_datetime(self, table_name: str, nanoseconds: int) -> datetime:
+        """Convert a cached time back to the type Postgres returns for the table."""
+        value = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=nanoseconds // 1000)
+        return value if self.meta(table_name).get("timezone") else value.replace(tzinfo=None)
+
+    def to_frame(self, table_name: str, symbol: str, columns: Dict[str, np.ndarray]):
+        """Build a DataFrame shaped like a SELECT * on the table from cached columns."""
+        import pandas as pd
+
+        times = pd.to_datetime(columns[TIME_COLUMN], utc=True)
+        data = {}
+        for column in self.meta(table_name)["columns"]:
+            if column == SYMBOL_COLUMN:
+                data[column] = symbol
+            elif column == TIME_COLUMN:
+                data[column] = times if self.meta(table_name).get("timezone") else times.tz_localize(None)
+            else:
+                data[column] = columns[column]
+        return pd.DataFrame(data, index=pd.RangeIndex(len(times)))
+
+    def symbols(self, table_name: str) -> List[str]:
+        """Symbols with cached bars for a table."""
+        path = self._table_dir(table_name)
+        if not path.exists():
+            return []
+        return sorted(p.name for p in path.iterdir() if p.is_dir())
+
+    def tables(self) -> List[str]:
+        """Tables that have been built into the cache."""
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if (p / "meta.json").exists())
+
+    # ===========================
+    # Incremental build
+    # ===========================
+
+    def _build_meta(self, connection, table_name: str) -> Optional[dict]:
+        """Reflect the table's columns, returning None if any cannot be stored as float64."""
+        schema, _, table = table_name.rpartition(".")
+        result = connection.execute(text("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = :schema AND table_name = :table
+            ORDER BY ordinal_position
+        """), {"schema": schema or "public", "table": table})
+        columns = result.fetchall()
+
+        numeric = ("double precision", "real", "numeric", "integer", "bigint", "smallint")
+        meta = {"columns": [], "timezone": False}
+        for name, data_type in columns:
+            if name == TIME_COLUMN:
+                meta["timezone"] = data_type == "timestamp with time zone"
+            elif name != SYMBOL_COLUMN and data_type not in numeric:
+                print(f"Bar cache skipping {table_name}: column {name} is {data_type}")
+                return None
+            if not SYMBOL_PATTERN.match(name):
+                return None
+            meta["columns"].append(name)
+        return meta
+
+    def _append(self, table_name: str, symbol: str, columns: Dict[str, np.ndarray]):
+        """Append rows for one symbol, writing time last so readers never see partial rows."""
+        path = self._symbol_dir(table_name, symbol)
+        path.mkdir(parents=True, exist_ok=True)
+
+        # Drop anything a previous interrupted append wrote past the committed rows
+        time_path = path / "time.bin"
+        rows = os.stat(time_path).st_size // 8 if time_path.exists() else 0
+        for column in self.value_columns(table_name):
+            column_path = path / f"{column}.bin"
+            if column_path.exists() and column_path.stat().st_size > rows * 8:
+                os.truncate(column_path, rows * 8)
+
+        for column in self.value_columns(table_name):
+            with open(path / f"{column}.bin", "ab") as f:
+                f.write(np.ascontiguousarray(columns[column], dtype=np.float64).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        with open(time_path, "ab") as f:
+            f.write(np.ascontiguousarray(columns[TIME_COLUMN], dtype=np.int64).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def update(self, table_name: str, symbols: Iterable[str], batch_size: int = 100, fetch_size: int = 50000) -> int:
+        """
+        Append settled bars newer than each symbol's last cached bar.
+
+        Args:
+            table_name: Price source table
+            symbols: Symbols to cache from it
+            batch_size: Symbols per query
+            fetch_size: Rows per round trip while streaming results
+
+        Returns:
+            Number of bars appended
+        """
+        import pandas as pd
+
+        symbols = sorted({s for s in symbols if SYMBOL_PATTERN.match(s)})
+        until = datetime.now(timezone.utc) - self.settle
+        appended = 0
+
+        try:
+            with get_engine(ANALYTICS).connect() as connection:
+                quoted_table = validate_table_name(connection, table_name)
+
+                if self.meta(table_name) is None:
+                    meta = self._build_meta(connection, table_name)
+                    if meta is None:
+                        return 0
+                    self._table_dir(table_name).mkdir(parents=True, exist_ok=True)
+                    (self._table_dir(table_name) / "meta.json").write_text(json.dumps(meta))
+                    self._meta[table_name] = meta
+
+                meta = self.meta(table_name)
+                select_columns = ", ".join(f'"{c}"' for c in meta["columns"])
+
+                for i in range(0, len(symbols), batch_size):
+                    batch = symbols[i:i + batch_size]
+                    last_times = {s: self.last_time(table_name, s) for s in batch}
+                    known = [t for t in last_times.values() if t is not None]
+                    since = min(known) if len(known) == len(batch) else None
+
+                    # Server-side cursor, so a first build of a large table is not held in memory
+                    result = connection.execute(text(f"""
+                        SELECT {select_columns} FROM {quoted_table}
+                        WHERE symbol = ANY(:symbols)
+                        AND (CAST(:since AS timestamptz) IS NULL OR time > :since)
+                        AND time < :until
+                        ORDER BY symbol, time
+                    """).execution_options(stream_results=True), {"symbols": batch, "since": since, "until": until})
+
+                    while True:
+                        rows = result.fetchmany(fetch_size)
+                        if not rows:
+                            break
+                        frame = pd.DataFrame(rows, columns=meta["columns"])
+                        frame[TIME_COLUMN] = pd.to_datetime(frame[TIME_COLUMN], utc=True).astype("datetime64[ns, UTC]")
+
+                        for symbol, group in frame.groupby(SYMBOL_COLUMN, sort=False):
+                            last = last_times.get(symbol)
+                            if last is not None:
+                                cutoff = pd.Timestamp(last if last.tzinfo else last.replace(tzinfo=timezone.utc))
+                                group = group[group[TIME_COLUMN] > cutoff]
+                            if group.empty:
+                                continue
+
+                            columns = {TIME_COLUMN: group[TIME_COLUMN].dt.tz_convert(None).astype("datetime64[ns]").to_numpy().view(np.int64)}
+                            for column in self.value_columns(table_name):
+                                columns[column] = group[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                            with self._lock:
+                                self._append(table_name, symbol, columns)
+                            last_times[symbol] = self.to_datetime(table_name, int(columns[TIME_COLUMN][-1]))
+                            appended += len(group)
+        except SQLAlchemyError as e:
+            print(f"Error updating bar cache for {table_name}: {e}")
+        except ValueError as e:
+            print(f"Rejected bar cache update: {e}")
+
+        return appended
+
+    def update_universe(self, universe: Dict[str, str]) -> int:
+        """Update the cache for a symbol -> price table map."""
+        by_table: Dict[str, List[str]] = {}
+        for symbol, table_name in universe.items():
+            if table_name:
+                by_table.setdefault(table_name, []).append(symbol)
+        return sum(self.update(table_name, symbols) for table_name, symbols in by_table.items())
+
+
+_bar_cache: Optional[BarCache] = None
+_bar_cache_lock = threading.Lock()
+
+
+def get_bar_cache() -> Optional[BarCache]:
+    """The process-wide cache at BAR_CACHE_DIR, or None when caching is disabled."""
+    global _bar_cache
+    if not BAR_CACHE_DIR:
+        return None
+    with _bar_cache_lock:
+        if _bar_cache is None:
+            _bar_cache = BarCache(BAR_CACHE_DIR)
+    return _bar_cache
+
+
+def update_bar_cache(universe: Dict[str, str]) -> int:
+    """Bring the cache up to date for a symbol -> price table map, returns bars appended."""
+    cache = get_bar_cache()
+    if cache is None:
+        return 0
+    started = time.perf_counter()
+    appended = cache.update_universe(universe)
+    print(f"Bar cache appended {appended} bars in {time.perf_counter() - started:.1f}s")
+    return appended
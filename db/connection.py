@@ -1,6 +1,25 @@
-"""Database connection module for PostgreSQL."""
+"""Database connection module for PostgreSQL.
 
+Connections are grouped into named pools, each with its own engine and sizing:
+
+- "primary" serves writes and reads that must see them (orders, fills, positions).
+- "analytics" serves bar and universe reads, and can point at a read replica.
+
+Each pool is configured with DB_<POOL>_HOST, DB_<POOL>_PORT, DB_<POOL>_NAME,
+DB_<POOL>_USER, DB_<POOL>_PASSWORD, DB_<POOL>_POOL_SIZE and DB_<POOL>_MAX_OVERFLOW,
+falling back to the unprefixed DB_* settings. Extra pools can be declared with
+DB_POOLS (comma separated); a pool that is not declared uses the primary.
+
+Change notifications (LISTEN/NOTIFY) are received on one dedicated connection by a
+background NotificationListener and dispatched to in-process subscribers, see subscribe.
+"""
+
+import json
 import os
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
@@ -16,28 +35,82 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT")
 
+# Pool names
+PRIMARY = "primary"
+ANALYTICS = "analytics"
+
+POOL_DEFAULTS = {
+    PRIMARY: {"pool_size": 10, "max_overflow": 20},
+    ANALYTICS: {"pool_size": 5, "max_overflow": 10},
+}
+
+POOL_NAMES = [PRIMARY] + [
+    name.strip() for name in os.getenv("DB_POOLS", ANALYTICS).split(",")
+    if name.strip() and name.strip() != PRIMARY
+]
+
+
+def _pool_setting(pool: str, key: str, default=None):
+    """Read DB_<POOL>_<KEY>, falling back to DB_<KEY> and then default."""
+    return os.getenv(f"DB_{pool.upper()}_{key}", os.getenv(f"DB_{key}", default))
+
+
+def _database_url(pool: str) -> str:
+    """Build the database URL for a named pool."""
+    host = _pool_setting(pool, "HOST")
+    name = _pool_setting(pool, "NAME")
+    user = _pool_setting(pool, "USER")
+    password = _pool_setting(pool, "PASSWORD")
+    port = _pool_setting(pool, "PORT")
+    return f"postgresql://{user}:{password}@{host}:{port}/{name}"
+
+
+def _create_pool_engine(pool: str):
+    """Create the SQLAlchemy engine backing a named pool."""
+    defaults = POOL_DEFAULTS.get(pool, POOL_DEFAULTS[ANALYTICS])
+    return create_engine(
+        _database_url(pool),
+        pool_size=int(os.getenv(f"DB_{pool.upper()}_POOL_SIZE", defaults["pool_size"])),
+        max_overflow=int(os.getenv(f"DB_{pool.upper()}_MAX_OVERFLOW", defaults["max_overflow"])),
+        pool_pre_ping=True,  # Verify connections before using them
+        # Fail fast when Postgres is unreachable, so hot-path writes fall back to the spool
+        connect_args={"connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5"))},
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        echo=False  # Set to True for SQL query logging
+    )
+
+
 # Create database URL
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DATABASE_URL = _database_url(PRIMARY)
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=10,
-    max_overflow=20,
-    pool_pre_ping=True,  # Verify connections before using them
-    echo=False  # Set to True for SQL query logging
-)
+# Create SQLAlchemy engines, one per named pool
+engines = {pool: _create_pool_engine(pool) for pool in POOL_NAMES}
+engine = engines[PRIMARY]
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create session factories
+session_factories = {
+    pool: sessionmaker(autocommit=False, autoflush=False, bind=pool_engine)
+    for pool, pool_engine in engines.items()
+}
+SessionLocal = session_factories[PRIMARY]
 
 # Base class for models
 Base = declarative_base()
 
 
-def get_db():
+def _declared(pool: str) -> str:
+    """The pool itself when declared, otherwise the primary (e.g. DB_POOLS without analytics)."""
+    return pool if pool in engines else PRIMARY
+
+
+def get_engine(pool: str = PRIMARY):
+    """Get the engine for a named pool."""
+    return engines[_declared(pool)]
+
+
+def get_db(pool: str = PRIMARY):
     """Get a database session."""
-    db = SessionLocal()
+    db = session_factories[_declared(pool)]()
     try:
         return db
     finally:
@@ -45,9 +118,9 @@ def get_db():
 
 
 @contextmanager
-def get_db_session():
+def get_db_session(pool: str = PRIMARY):
     """Context manager for database sessions."""
-    db = SessionLocal()
+    db = session_factories[_declared(pool)]()
     try:
         yield db
         db.commit()
@@ -58,14 +131,180 @@ def get_db_session():
         db.close()
 
 
+def get_pool_status():
+    """Checked-out, idle and overflow connection counts for every pool."""
+    status = {}
+    for pool, pool_engine in engines.items():
+        queue_pool = pool_engine.pool
+        status[pool] = {
+            "size": queue_pool.size(),
+            "checked_out": queue_pool.checkedout(),
+            "checked_in": queue_pool.checkedin(),
+            "overflow": max(queue_pool.overflow(), 0),
+            "max_overflow": queue_pool._max_overflow,
+        }
+    return status
+
+
 def test_connection():
-    """Test database connection."""
-    try:
-        from sqlalchemy import text
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT 1"))
-            print("Database connection successful!")
-            return True
-    except Exception as e:
-        print(f"Database connection failed: {e}")
-        return False
+    """Test database connection for every pool."""
+    from sqlalchemy import text
+    connected = True
+    for pool, pool_engine in engines.items():
+        try:
+            with pool_engine.connect() as connection:
+                result = connection.execute(text("SELECT 1"))
+                print(f"Database connection successful ({pool})!")
+        except Exception as e:
+            print(f"Database connection failed ({pool}): {e}")
+            connected = False
+    return connected
+
+
+# ===========================
+# LISTEN/NOTIFY
+# ===========================
+
+# Channel the trading table triggers notify on (see schema.ensure_change_triggers)
+TABLE_CHANGES_CHANNEL = "table_changes"
+
+
+class NotificationListener:
+    """
+    Background thread holding one LISTEN connection and dispatching notifications to subscribers.
+
+    Callbacks run on the listener thread with the notification payload. They are also called
+    with None whenever notifications may have been missed (on first connect, after a reconnect
+    and when a channel is first listened to), meaning anything cached should be dropped.
+    """
+
+    def __init__(self, pool: str = PRIMARY, reconnect_delay: float = 5.0, timeout: float = 1.0):
+        self.pool = pool
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+        self.listening = False  # False while disconnected, caches must not be trusted then
+
+        self._subscribers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+        self._listened: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._fairy = None
+        self._connection = None
+
+    def subscribe(self, channel: str, callback: Callable[[Optional[str]], None]):
+        """Call callback with every payload sent on channel, LISTENing within one timeout."""
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-listener", daemon=True)
+                self._thread.start()
+        return callback
+
+    def unsubscribe(self, channel: str, callback: Callable[[Optional[str]], None]):
+        with self._lock:
+            callbacks = self._subscribers.get(channel, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def stop(self):
+        self._stop.set()
+
+    def _connect(self):
+        # Detached from the pool, the connection stays in LISTEN for the listener's lifetime
+        self._fairy = get_engine(self.pool).raw_connection()
+        self._fairy.detach()
+        self._connection = self._fairy.dbapi_connection
+        self._connection.autocommit = True
+        self._listened = set()
+
+    def _close(self):
+        self.listening = False
+        if self._fairy is not None:
+            try:
+                self._fairy.close()
+            except Exception:
+                pass
+        self._fairy = None
+        self._connection = None
+
+    def _listen_new_channels(self):
+        with self._lock:
+            channels = [channel for channel in self._subscribers if channel not in self._listened]
+        for channel in channels:
+            with self._connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{channel}"')
+            self._listened.add(channel)
+        self.listening = True
+
+        # Anything cached before the LISTEN took effect may be stale
+        for channel in channels:
+            self._dispatch(channel, None)
+
+    def _dispatch(self, channel: str, payload: Optional[str]):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Error in {channel} notification subscriber: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._connection is None:
+                    self._connect()
+                self._listen_new_channels()
+
+                if select.select([self._connection], [], [], self.timeout) == ([], [], []):
+                    continue
+                self._connection.poll()
+                while self._connection.notifies:
+                    notify = self._connection.notifies.pop(0)
+                    self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                print(f"Notification listener error, reconnecting: {e}")
+                self._close()
+                self._stop.wait(self.reconnect_delay)
+        self._close()
+
+
+_listener: Optional[NotificationListener] = None
+_listener_lock = threading.Lock()
+
+
+def get_listener() -> NotificationListener:
+    """The process-wide notification listener, started on first subscription."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = NotificationListener()
+    return _listener
+
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]):
+    """Subscribe to a NOTIFY channel on the process-wide listener."""
+    return get_listener().subscribe(channel, callback)
+
+
+def subscribe_table_changes(table: str, callback: Callable[[Optional[dict]], None]):
+    """
+    Subscribe to row changes of a table with a change trigger.
+
+    The callback gets {"table", "op", "key"} per changed row, where key holds the trigger's
+    key columns, or None when changes may have been missed.
+    """
+    def on_notify(payload: Optional[str]):
+        if payload is None:
+            callback(None)
+            return
+        change = json.loads(payload)
+        if change.get("table") == table:
+            callback(change)
+    return subscribe(TABLE_CHANGES_CHANNEL, on_notify)
+
+
+def is_listening() -> bool:
+    """Whether change notifications are currently being received."""
+    return _listener is not None and _listener.listening
@@ -1,20 +1,13 @@
 """SQLAlchemy models for trading schema tables."""
 
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, Boolean, Enum, Text, text
+from sqlalchemy import Column, Integer, BigInteger, String, Numeric, Float, DateTime, Date, Boolean, Enum, Text, Index, text
 from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
-import enum
 
 from .connection import Base
 
-
-# Enum types for order_status
-class OrderStatus(str, enum.Enum):
-    """Order status enum."""
-    pending = "pending"
-    filled = "filled"
-    cancelled = "cancelled"
-    partial = "partial"
+# Enum type for order_status, defined with the domain types
+from src.Types import OrderStatus
 
 
 class Fill(Base):
@@ -89,6 +82,7 @@ class Position(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     symbol = Column(String(12), nullable=False)
     strategy_tag = Column(String(50), nullable=True)
+    account = Column(String(50), nullable=False, server_default=text("'default'"))
 
     status = Column(String(10), nullable=False)
     side = Column(String(10), nullable=False)
@@ -102,6 +96,10 @@ class Position(Base):
     close_price = Column(Numeric(18, 4), nullable=True)
     commission_close = Column(Numeric(10, 4), nullable=True, server_default=text("0"))
 
+    # Partial closes before the final one, which is close_price on the remaining quantity
+    realized_pnl = Column(Numeric(18, 4), nullable=True) # Net of the partial closes' commissions
+    closed_quantity = Column(Numeric(18, 8), nullable=True)
+
     tags = Column(JSONB, nullable=True)
     notes = Column(Text, nullable=True)
 
@@ -117,6 +115,7 @@ class Position(Base):
             "id": self.id,
             "symbol": self.symbol,
             "strategy_tag": self.strategy_tag,
+            "account": self.account,
             "status": self.status,
             "side": self.side,
             "open_time": self.open_time.isoformat() if self.open_time else None,
@@ -126,6 +125,8 @@ class Position(Base):
             "close_time": self.close_time.isoformat() if self.close_time else None,
             "close_price": float(self.close_price) if self.close_price else None,
             "commission_close": float(self.commission_close) if self.commission_close else None,
+            "realized_pnl": float(self.realized_pnl) if self.realized_pnl is not None else None,
+            "closed_quantity": float(self.closed_quantity) if self.closed_quantity is not None else None,
             "tags": self.tags,
             "notes": self.notes
         }
@@ -157,3 +158,52 @@ class Universe(Base):
             "is_active": self.is_active,
             "price_source_table": self.price_source_table
         }
+
+
+class PnLSnapshot(Base):
+    """Model for trading.pnl_snapshots table (created by schema.ensure_tables)."""
+    __tablename__ = "pnl_snapshots"
+    __table_args__ = (
+        Index("pnl_snapshots_account_taken_at_idx", "account", "taken_at"),
+        {"schema": "trading"},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    account = Column(String(50), nullable=False, server_default=text("'default'"))
+    taken_at = Column(DateTime(timezone=True), nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+
+    realized = Column(Float, nullable=False, server_default=text("0"))
+    unrealized = Column(Float, nullable=False, server_default=text("0"))
+    commission = Column(Float, nullable=False, server_default=text("0"))
+    long_exposure = Column(Float, nullable=False, server_default=text("0"))
+    short_exposure = Column(Float, nullable=False, server_default=text("0"))
+    gross_exposure = Column(Float, nullable=False, server_default=text("0"))
+    net_exposure = Column(Float, nullable=False, server_default=text("0"))
+    open_positions = Column(Integer, nullable=False, server_default=text("0"))
+    cash = Column(Float, nullable=True)
+
+    by_strategy = Column(JSONB, nullable=True)
+
+    def __repr__(self):
+        return (
+            f"<PnLSnapshot(id={self.id}, account='{self.account}', taken_at={self.taken_at}, "
+            f"realized={self.realized}, unrealized={self.unrealized})>"
+        )
+
+    def to_dict(self):
+        """Convert model to dictionary."""
+        return {
+            "id": self.id,
+            "account": self.account,
+            "taken_at": self.taken_at.isoformat() if self.taken_at else None,
+            "realized": self.realized,
+            "unrealized": self.unrealized,
+            "commission": self.commission,
+            "long_exposure": self.long_exposure,
+            "short_exposure": self.short_exposure,
+            "gross_exposure": self.gross_exposure,
+            "net_exposure": self.net_exposure,
+            "open_positions": self.open_positions,
+            "cash": self.cash,
+            "by_strategy": self.by_strategy
+        }
@@ -1,14 +1,26 @@
-"""Database operations for trading tables."""
+"""Database operations for trading tables.
 
-from typing import List, Optional, Dict, Any
-from datetime import datetime, date
-import pandas as pd
+Writes, and reads that must observe them, use the primary pool. Bar, universe and
+full-table listing reads tolerate replica lag and are routed to the analytics pool.
+Writes on the trading hot path (fills, orders, positions, P&L snapshots) go through
+the write spool, which holds them in a local file while Postgres is slow or down.
+"""
 
-from sqlalchemy import select, update, delete
+from __future__ import annotations
+
+import time
+from typing import Iterator, List, Optional, Dict, Any
+from datetime import datetime, date, timezone
+
+from sqlalchemy import bindparam, func, select, update, delete, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 
-from .connection import get_db_session
-from .models import Fill, Order, Position, Universe
+from .connection import get_db_session, get_engine, ANALYTICS
+from .models import Fill, Order, Position, Universe, PnLSnapshot
+from .bar_cache import get_bar_cache
+from .spool import get_write_spool, spool_handler, _is_unavailable
+from .statements import execute_latest_entries, execute_newer_entries, validate_table_name
 
 
 def _normalize_order_id(order_id: object) -> str:
@@ -16,30 +28,66 @@ def _normalize_order_id(order_id: object) -> str:
     return str(order_id) if order_id is not None else ""
 
 
+def _reserve_key(values: Dict[str, Any], table: str, column: str) -> Dict[str, Any]:
+    """Give a new row its primary key up front, so a replayed insert can be recognised."""
+    key = get_write_spool().reserve_id(table, column)
+    if key is not None:
+        values[column] = key
+    return values
+
+
+def _insert_row(session, model, values: Dict[str, Any]):
+    """Insert a row unless its primary key exists (a replayed write), returning it detached."""
+    row = session.scalars(insert(model).values(**values).on_conflict_do_nothing().returning(model)).first()
+    if row is not None:
+        session.expunge(row)
+    return row
+
+
+def _update_rows(session, model, key: str, rows: List[Dict[str, Any]]) -> None:
+    """
+    UPDATE rows matched on key, one executemany per distinct set of columns.
+
+    Rows whose key matches nothing are skipped. The ORM bulk update by primary key fails
+    the whole batch with StaleDataError instead.
+    """
+    table = model.__table__
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(column for column in row if column != key)), []).append(row)
+    for columns, group in groups.items():
+        if not columns:
+            continue
+        # Bound names must not clash with the column names, SQLAlchemy reserves those for SET
+        statement = (update(table)
+                     .where(table.c[key] == bindparam(f"b_{key}"))
+                     .values({column: bindparam(f"b_{column}") for column in columns}))
+        session.execute(statement, [{f"b_{column}": value for column, value in row.items()} for row in group])
+
+
 # ===== FILL OPERATIONS =====
 
 def create_fill(order_id: str, quantity: float, price: float, filled_at: Optional[datetime] = None) -> Optional[Fill]:
-    """Create a new fill record."""
+    """Create a new fill record (spooled while Postgres is unavailable)."""
+    values = _reserve_key({
+        "order_id": _normalize_order_id(order_id),
+        "quantity": quantity,
+        "price": price,
+        # Stamped now rather than by the server, which may only see the row on replay
+        "filled_at": filled_at or datetime.now(timezone.utc)
+    }, "trading.fills", "fill_id")
     try:
-        with get_db_session() as session:
-            fill = Fill(
-                order_id=_normalize_order_id(order_id),
-                quantity=quantity,
-                price=price,
-                filled_at=filled_at
-            )
-            session.add(fill)
-            session.flush()
-            session.refresh(fill)
-            # Access attributes before session closes
-            fill_id = fill.fill_id
-            session.expunge(fill)
-            return fill
+        return get_write_spool().write("create_fill", values, spooled_result=Fill(**values))
     except SQLAlchemyError as e:
         print(f"Error creating fill: {e}")
         return None
 
 
+@spool_handler("create_fill")
+def _apply_create_fill(session, values: Dict[str, Any]) -> Optional[Fill]:
+    return _insert_row(session, Fill, values)
+
+
 def get_fill_by_id(fill_id: int) -> Optional[Fill]:
     """Get a fill by its ID."""
     try:
@@ -69,7 +117,7 @@ def get_fills_by_order(order_id: str) -> List[Fill]:
 def get_all_fills(limit: Optional[int] = None) -> List[Fill]:
     """Get all fills, optionally limited."""
     try:
-        with get_db_session() as session:
+        with get_db_session(ANALYTICS) as session:
             query = session.query(Fill).order_by(Fill.filled_at.desc())
             if limit:
                 query = query.limit(limit)
@@ -91,28 +139,27 @@ def create_order(
     status: Optional[str] = "pending",
     quantity_filled: float = 0
 ) -> Optional[Order]:
-    """Create a new order record."""
+    """Create a new order record (spooled while Postgres is unavailable), None if it already exists."""
+    values = {
+        "order_id": _normalize_order_id(order_id),
+        "symbol": symbol,
+        "quantity_ordered": quantity_ordered,
+        "status": status,
+        "quantity_filled": quantity_filled,
+        "created_at": datetime.now(timezone.utc)
+    }
     try:
-        with get_db_session() as session:
-            order = Order(
-                order_id=_normalize_order_id(order_id),
-                symbol=symbol,
-                quantity_ordered=quantity_ordered,
-                status=status,
-                quantity_filled=quantity_filled
-            )
-            session.add(order)
-            session.flush()
-            session.refresh(order)
-            # Access attributes before session closes
-            _ = order.order_id
-            session.expunge(order)
-            return order
+        return get_write_spool().write("create_order", values, spooled_result=Order(**values))
     except SQLAlchemyError as e:
         print(f"Error creating order: {e}")
         return None
 
 
+@spool_handler("create_order")
+def _apply_create_order(session, values: Dict[str, Any]) -> Optional[Order]:
+    return _insert_row(session, Order, values)
+
+
 def get_order_by_id(order_id: str) -> Optional[Order]:
     """Get an order by its ID."""
     try:
@@ -153,24 +200,62 @@ def get_orders_by_status(status: str) -> List[Order]:
 
 
 def update_order_status(order_id: str, status: str, quantity_filled: Optional[float] = None) -> bool:
-    """Update order status and optionally quantity filled."""
+    """Update order status and optionally quantity filled (spooled while Postgres is unavailable)."""
+    update_data = {"status": status}
+    if quantity_filled is not None:
+        update_data["quantity_filled"] = quantity_filled
     try:
-        with get_db_session() as session:
-            update_data = {"status": status}
-            if quantity_filled is not None:
-                update_data["quantity_filled"] = quantity_filled
-
-            session.query(Order).filter(Order.order_id == _normalize_order_id(order_id)).update(update_data)
-            return True
+        return get_write_spool().write("update_order_status", {"order_id": _normalize_order_id(order_id), "updates": update_data}, spooled_result=True)
     except SQLAlchemyError as e:
         print(f"Error updating order: {e}")
         return False
 
 
+@spool_handler("update_order_status")
+def _apply_update_order_status(session, values: Dict[str, Any]) -> bool:
+    session.query(Order).filter(Order.order_id == values["order_id"]).update(values["updates"])
+    return True
+
+
+def update_order_statuses(updates: List[Dict[str, Any]]) -> bool:
+    """
+    Update status and quantity filled for many orders in one round trip.
+
+    Orders without a row (e.g. picked up from the broker, or OCO legs) are skipped.
+
+    Args:
+        updates: Dicts with "order_id", "status" and optionally "quantity_filled"
+
+    Returns:
+        False when Postgres is unavailable and the updates should be retried. Other errors
+        are raised, retrying them would fail the same way.
+    """
+    if not updates:
+        return True
+    rows = []
+    for row in updates:
+        row = {key: value for key, value in row.items() if key in {"order_id", "status", "quantity_filled"}}
+        row["order_id"] = _normalize_order_id(row.get("order_id"))
+        rows.append(row)
+    try:
+        return get_write_spool().write("update_order_statuses", {"rows": rows}, spooled_result=True)
+    except SQLAlchemyError as e:
+        print(f"Error updating orders: {e}")
+        if _is_unavailable(e):
+            return False
+        raise
+
+
+@spool_handler("update_order_statuses")
+def _apply_update_order_statuses(session, values: Dict[str, Any]) -> bool:
+    _update_rows(session, Order, "order_id", values["rows"])
+    return True
+
+
 def get_all_orders(limit: Optional[int] = None) -> List[Order]:
     """Get all orders, optionally limited."""
     try:
-        with get_db_session() as session:
+        with get_db_session(ANALYTICS) as session:
             query = session.query(Order).order_by(Order.created_at.desc())
             if limit:
                 query = query.limit(limit)
@@ -193,6 +278,7 @@ def create_position(
     open_price: float,
     quantity: float,
     strategy_tag: Optional[str] = None,
+    account: str = "default",
     commission_open: float = 0,
     close_time: Optional[datetime] = None,
     close_price: Optional[float] = None,
@@ -200,35 +286,67 @@ def create_position(
     tags: Optional[Dict[str, Any]] = None,
     notes: Optional[str] = None
 ) -> Optional[Position]:
-    """Create a new position record."""
+    """
+    Create a new position record (spooled while Postgres is unavailable, keeping its reserved id).
+
+    Returns None on error, and when the row was spooled after the reserved ids ran out; it is
+    still inserted on replay.
+    """
+    values = _reserve_key({
+        "symbol": symbol,
+        "strategy_tag": strategy_tag,
+        "account": account,
+        "status": status,
+        "side": side,
+        "open_time": open_time,
+        "open_price": open_price,
+        "quantity": quantity,
+        "commission_open": commission_open,
+        "close_time": close_time,
+        "close_price": close_price,
+        "commission_close": commission_close,
+        "tags": tags,
+        "notes": notes
+    }, "trading.positions", "id")
     try:
-        with get_db_session() as session:
-            position = Position(
-                symbol=symbol,
-                strategy_tag=strategy_tag,
-                status=status,
-                side=side,
-                open_time=open_time,
-                open_price=open_price,
-                quantity=quantity,
-                commission_open=commission_open,
-                close_time=close_time,
-                close_price=close_price,
-                commission_close=commission_close,
-                tags=tags,
-                notes=notes
-            )
-            session.add(position)
-            session.flush()
-            session.refresh(position)
-            _ = position.id
-            session.expunge(position)
-            return position
+        # Without a reserved id a spooled row cannot be referenced until it is replayed, so None is returned
+        return get_write_spool().write("create_position", values, spooled_result=Position(**values) if "id" in values else None)
     except SQLAlchemyError as e:
         print(f"Error creating position: {e}")
         return None
 
 
+@spool_handler("create_position")
+def _apply_create_position(session, values: Dict[str, Any]) -> Optional[Position]:
+    return _insert_row(session, Position, values)
+
+
+def bulk_create_positions(rows: List[Dict[str, Any]]) -> List[Position]:
+    """
+    Create many position records in one transaction.
+
+    Args:
+        rows: Dicts of create_position keyword arguments
+
+    Returns:
+        The created positions, in the order given
+    """
+    if not rows:
+        return []
+    try:
+        with get_db_session() as session:
+            positions = [Position(**row) for row in rows]
+            session.add_all(positions)
+            session.flush()
+            for position in positions:
+                _ = position.id
+                session.expunge(position)
+            return positions
+    except SQLAlchemyError as e:
+        print(f"Error creating positions: {e}")
+        return []
+
+
 def get_position_by_id(position_id: int) -> Optional[Position]:
     """Get a position by its ID."""
     try:
@@ -255,11 +373,14 @@ def get_positions_by_symbol(symbol: str) -> List[Position]:
         return []
 
 
-def get_positions_by_status(status: str) -> List[Position]:
-    """Get all positions with a specific status."""
+def get_positions_by_status(status: str, account: Optional[str] = None) -> List[Position]:
+    """Get all positions with a specific status, optionally for one account."""
     try:
         with get_db_session() as session:
-            positions = session.query(Position).filter(Position.status == status).all()
+            query = session.query(Position).filter(Position.status == status)
+            if account is not None:
+                query = query.filter(Position.account == account)
+            positions = query.all()
             for position in positions:
                 session.expunge(position)
             return positions
@@ -282,6 +403,8 @@ def update_position(position_id: int, **updates: Any) -> bool:
         "close_time",
         "close_price",
         "commission_close",
+        "realized_pnl",
+        "closed_quantity",
         "tags",
         "notes"
     }
@@ -289,14 +412,54 @@ def update_position(position_id: int, **updates: Any) -> bool:
     if not update_data:
         return False
     try:
-        with get_db_session() as session:
-            session.query(Position).filter(Position.id == position_id).update(update_data)
-            return True
+        return get_write_spool().write("update_position", {"id": position_id, "updates": update_data}, spooled_result=True)
     except SQLAlchemyError as e:
         print(f"Error updating position: {e}")
         return False
 
 
+@spool_handler("update_position")
+def _apply_update_position(session, values: Dict[str, Any]) -> bool:
+    session.query(Position).filter(Position.id == values["id"]).update(values["updates"])
+    return True
+
+
+def bulk_update_positions(updates: List[Dict[str, Any]]) -> bool:
+    """
+    Update many position records in one round trip.
+
+    Args:
+        updates: Dicts with the position "id" plus the fields to update
+    """
+    allowed_fields = {
+        "id",
+        "status",
+        "quantity",
+        "open_price",
+        "close_time",
+        "close_price",
+        "commission_close",
+        "tags",
+        "notes"
+    }
+    rows = [{key: value for key, value in row.items() if key in allowed_fields} for row in updates]
+    rows = [row for row in rows if "id" in row and len(row) > 1]
+    if not rows:
+        return True
+    try:
+        return get_write_spool().write("bulk_update_positions", {"rows": rows}, spooled_result=True)
+    except SQLAlchemyError as e:
+        print(f"Error updating positions: {e}")
+        return False
+
+
+@spool_handler("bulk_update_positions")
+def _apply_bulk_update_positions(session, values: Dict[str, Any]) -> bool:
+    # A row deleted since it was read is skipped rather than failing the batch
+    _update_rows(session, Position, "id", values["rows"])
+    return True
+
+
 def delete_position(position_id: int) -> bool:
     """Delete a position by ID."""
     try:
@@ -308,9 +471,27 @@ def delete_position(position_id: int) -> bool:
         return False
 
 
-def get_open_positions() -> List[Position]:
-    """Get all open positions."""
-    return get_positions_by_status("OPEN")
+def get_open_positions(account: Optional[str] = None) -> List[Position]:
+    """Get all open positions, optionally for one account."""
+    return get_positions_by_status("OPEN", account)
+
+
+def get_last_position_write(account: Optional[str] = None) -> Optional[datetime]:
+    """
+    Latest open or close time recorded in trading.positions, optionally for one account.
+
+    Returns None when there are no positions. Errors are raised rather than returned as
+    None, so a failed read is never taken for an empty table.
+    """
+    try:
+        with get_db_session() as session:
+            query = session.query(func.max(func.coalesce(Position.close_time, Position.open_time)))
+            if account is not None:
+                query = query.filter(Position.account == account)
+            return query.scalar()
+    except SQLAlchemyError as e:
+        print(f"Error getting last position write: {e}")
+        raise
 
 
 # ===========================
@@ -339,7 +520,7 @@ def create_universe(week_start_date: date, symbol: str, is_active: bool = True,
 def get_universe_by_snapshot_id(snapshot_id: int) -> Optional[Universe]:
     """Get a universe entry by snapshot ID."""
     try:
-        with get_db_session() as session:
+        with get_db_session(ANALYTICS) as session:
             universe = session.query(Universe).filter(Universe.snapshot_id == snapshot_id).first()
             if universe:
                 session.expunge(universe)
@@ -352,7 +533,7 @@ def get_universe_by_snapshot_id(snapshot_id: int) -> Optional[Universe]:
 def get_universe_by_week(week_start_date: date) -> List[Universe]:
     """Get all universe entries for a specific week."""
     try:
-        with get_db_session() as session:
+        with get_db_session(ANALYTICS) as session:
             universes = session.query(Universe).filter(Universe.week_start_date == week_start_date).all()
             for universe in universes:
                 session.expunge(universe)
@@ -365,7 +546,7 @@ def get_universe_by_week(week_start_date: date) -> List[Universe]:
 def get_active_universe(week_start_date: date) -> List[Universe]:
     """Get all active universe entries for a specific week."""
     try:
-        with get_db_session() as session:
+        with get_db_session(ANALYTICS) as session:
             universes = session.query(Universe).filter(
                 Universe.week_start_date == week_start_date,
                 Universe.is_active == True
@@ -381,7 +562,7 @@ def get_active_universe(week_start_date: date) -> List[Universe]:
 def get_universe_by_symbol(symbol: str) -> List[Universe]:
     """Get all universe entries for a specific symbol."""
     try:
-        with get_db_session() as session:
+        with get_db_session(ANALYTICS) as session:
             universes = session.query(Universe).filter(Universe.symbol == symbol).order_by(Universe.week_start_date.desc()).all()
             for universe in universes:
                 session.expunge(universe)
@@ -413,6 +594,413 @@ def delete_universe(snapshot_id: int) -> bool:
         return False
 
 
+# ===========================
+# P&L Snapshot Operations
+# ===========================
+
+def create_pnl_snapshot(account: str = "default", **values: Any) -> bool:
+    """Write one P&L snapshot row (see PnLSnapshot for the columns), spooled while Postgres is unavailable."""
+    allowed_fields = {
+        "taken_at",
+        "realized",
+        "unrealized",
+        "commission",
+        "long_exposure",
+        "short_exposure",
+        "gross_exposure",
+        "net_exposure",
+        "open_positions",
+        "cash",
+        "by_strategy"
+    }
+    row = _reserve_key({"account": account, **{key: value for key, value in values.items() if key in allowed_fields}}, "trading.pnl_snapshots", "id")
+    row.setdefault("taken_at", datetime.now(timezone.utc))
+    try:
+        get_write_spool().write("create_pnl_snapshot", row)
+        return True
+    except SQLAlchemyError as e:
+        print(f"Error creating P&L snapshot: {e}")
+        return False
+
+
+@spool_handler("create_pnl_snapshot")
+def _apply_create_pnl_snapshot(session, values: Dict[str, Any]) -> bool:
+    _insert_row(session, PnLSnapshot, values)
+    return True
+
+
+def get_latest_pnl_snapshot(account: str = "default") -> Optional[PnLSnapshot]:
+    """
+    Get the most recent P&L snapshot for an account.
+
+    Returns None when the account has no snapshots. Errors are raised, a failed read must
+    not be taken for a fresh account.
+    """
+    try:
+        with get_db_session() as session:
+            snapshot = session.query(PnLSnapshot).filter(PnLSnapshot.account == account).order_by(PnLSnapshot.taken_at.desc()).first()
+            if snapshot:
+                session.expunge(snapshot)
+            return snapshot
+    except SQLAlchemyError as e:
+        print(f"Error getting P&L snapshot: {e}")
+        raise
+
+
+def get_pnl_snapshots(account: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[PnLSnapshot]:
+    """Get P&L snapshots in time order, optionally for one account and within [start, end)."""
+    try:
+        with get_db_session(ANALYTICS) as session:
+            query = session.query(PnLSnapshot)
+            if account is not None:
+                query = query.filter(PnLSnapshot.account == account)
+            if start is not None:
+                query = query.filter(PnLSnapshot.taken_at >= start)
+            if end is not None:
+                query = query.filter(PnLSnapshot.taken_at < end)
+            snapshots = query.order_by(PnLSnapshot.taken_at).all()
+            for snapshot in snapshots:
+                session.expunge(snapshot)
+            return snapshots
+    except SQLAlchemyError as e:
+        print(f"Error getting P&L snapshots: {e}")
+        return []
+
+
+# ===========================
+# Streaming Operations
+# ===========================
+
+# Rows per keyset page, each page is one short query read through a server-side cursor
+STREAM_BATCH_SIZE = 5000
+
+# Attempts at a page before a streaming error is raised, each retry resumes after the last row yielded
+STREAM_RETRIES = 3
+STREAM_RETRY_DELAY = 1.0
+
+
+def _iter_keyset(
+    model,
+    filters: List[Any],
+    columns: Optional[List[str]],
+    batch_size: int,
+    description: str
+) -> Iterator[Any]:
+    """
+    Stream a model's rows in primary key order, one keyset page at a time.
+
+    Each page starts after the last key of the previous one, so no transaction stays open
+    between pages and memory holds at most one page. Without columns, detached ORM objects
+    are yielded; with columns, dicts of those columns (plus the primary key).
+
+    A failed page is retried from the last key yielded, so no row is repeated or skipped.
+    The error is raised once STREAM_RETRIES attempts have failed, rather than ending the
+    stream early as if it were complete.
+    """
+    keys = list(model.__table__.primary_key.columns)
+    key_names = [key.name for key in keys]
+    if columns is not None:
+        unknown = [column for column in columns if column not in model.__table__.columns]
+        if unknown:
+            raise ValueError(f"Unknown {model.__tablename__} columns: {unknown}")
+        selected = [model.__table__.columns[column] for column in dict.fromkeys([*key_names, *columns])]
+
+    last = None
+    failures = 0
+    while True:
+        statement = select(model) if columns is None else select(*selected)
+        statement = statement.where(*filters)
+        if last is not None:
+            statement = statement.where(tuple_(*keys) > tuple_(*last))
+        statement = statement.order_by(*keys).limit(batch_size).execution_options(yield_per=batch_size)
+
+        count = 0
+        try:
+            with get_db_session(ANALYTICS) as session:
+                try:
+                    for row in session.execute(statement).scalars() if columns is None else session.execute(statement).mappings():
+                        if columns is None:
+                            last = [getattr(row, name) for name in key_names]
+                        else:
+                            row = dict(row)
+                            last = [row[name] for name in key_names]
+                        count += 1
+                        yield row
+                finally:
+                    # Detach the page in one go before the commit would expire it, also when the caller stops early
+                    session.expunge_all()
+        except SQLAlchemyError as e:
+            failures += 1
+            if failures >= STREAM_RETRIES:
+                print(f"Error streaming {description}, giving up: {e}")
+                raise
+            print(f"Error streaming {description}, retrying from the last row: {e}")
+            time.sleep(STREAM_RETRY_DELAY * failures)
+            continue
+
+        failures = 0
+        if count < batch_size:
+            return
+
+
+def iter_fills(
+    order_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    columns: Optional[List[str]] = None,
+    batch_size: int = STREAM_BATCH_SIZE
+) -> Iterator[Any]:
+    """
+    Stream fills in fill_id order, in constant memory.
+
+    Args:
+        order_id: Only fills of this order (optional)
+        start: Only fills at or after this time (optional)
+        end: Only fills before this time (optional)
+        columns: Yield dicts of these columns instead of Fill objects (optional)
+        batch_size: Rows per page
+    """
+    filters = []
+    if order_id is not None:
+        filters.append(Fill.order_id == _normalize_order_id(order_id))
+    if start is not None:
+        filters.append(Fill.filled_at >= start)
+    if end is not None:
+        filters.append(Fill.filled_at < end)
+    return _iter_keyset(Fill, filters, columns, batch_size, "fills")
+
+
+def iter_orders(
+    status: Optional[str] = None,
+    symbol: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    columns: Optional[List[str]] = None,
+    batch_size: int = STREAM_BATCH_SIZE
+) -> Iterator[Any]:
+    """
+    Stream orders in order_id order, in constant memory.
+
+    Args:
+        status: Only orders with this status (optional)
+        symbol: Only orders for this symbol (optional)
+        start: Only orders created at or after this time (optional)
+        end: Only orders created before this time (optional)
+        columns: Yield dicts of these columns instead of Order objects (optional)
+        batch_size: Rows per page
+    """
+    filters = []
+    if status is not None:
+        filters.append(Order.status == status)
+    if symbol is not None:
+        filters.append(Order.symbol == symbol)
+    if start is not None:
+        filters.append(Order.created_at >= start)
+    if end is not None:
+        filters.append(Order.created_at < end)
+    return _iter_keyset(Order, filters, columns, batch_size, "orders")
+
+
+def iter_positions(
+    status: Optional[str] = None,
+    symbol: Optional[str] = None,
+    account: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    columns: Optional[List[str]] = None,
+    batch_size: int = STREAM_BATCH_SIZE
+) -> Iterator[Any]:
+    """
+    Stream positions in id order, in constant memory.
+
+    Args:
+        status: Only positions with this status (optional)
+        symbol: Only positions in this symbol (optional)
+        account: Only this account's positions (optional)
+        start: Only positions opened at or after this time (optional)
+        end: Only positions opened before this time (optional)
+        columns: Yield dicts of these columns instead of Position objects (optional)
+        batch_size: Rows per page
+    """
+    filters = []
+    if status is not None:
+        filters.append(Position.status == status)
+    if symbol is not None:
+        filters.append(Position.symbol == symbol)
+    if account is not None:
+        filters.append(Position.account == account)
+    if start is not None:
+        filters.append(Position.open_time >= start)
+    if end is not None:
+        filters.append(Position.open_time < end)
+    return _iter_keyset(Position, filters, columns, batch_size, "positions")
+
+
+# ===========================
+# Trade Analytics
+# ===========================
+
+# One row per closed position with its P&L, R-multiple, holding time and entry slippage.
+# Partial closes are carried in realized_pnl and closed_quantity, the final close is close_price
+# on the quantity still open. R is measured against the stop in the exit plan tags, slippage
+# against the signal price recorded when the position was opened (positive bps means a worse
+# fill than signalled).
+# Materialized so each derived column is computed once, not once per aggregate using it.
+_CLOSED_TRADES = """
+    WITH trades AS MATERIALIZED (
+        SELECT
+            symbol, strategy_tag, account, week, holding_hours,
+            partial_pnl + direction * (close_price - open_price) * quantity - commission AS pnl,
+            (partial_pnl + direction * (close_price - open_price) * quantity) / NULLIF(quantity + partial_quantity, 0)
+                / NULLIF(ABS(open_price - stop_loss_price), 0) AS r_multiple,
+            direction * (open_price - signal_price) / NULLIF(signal_price, 0) * 10000 AS slippage_bps,
+            direction * (open_price - signal_price) * (quantity + partial_quantity) AS slippage_cost
+        FROM (
+            SELECT
+                symbol,
+                COALESCE(strategy_tag, 'unattributed') AS strategy_tag,
+                account,
+                date_trunc('week', close_time)::date AS week,
+                EXTRACT(EPOCH FROM close_time - open_time)::float8 / 3600 AS holding_hours,
+                CASE WHEN side = 'SHORT' THEN -1.0 ELSE 1.0 END AS direction,
+                open_price::float8 AS open_price,
+                close_price::float8 AS close_price,
+                quantity::float8 AS quantity,
+                COALESCE(realized_pnl, 0)::float8 AS partial_pnl,
+                COALESCE(closed_quantity, 0)::float8 AS partial_quantity,
+                (COALESCE(commission_open, 0) + COALESCE(commission_close, 0))::float8 AS commission,
+                (tags ->> 'stop_loss_price')::float8 AS stop_loss_price,
+                (tags ->> 'signal_price')::float8 AS signal_price
+            FROM trading.positions
+            WHERE status = 'CLOSED'
+            AND (CAST(:account AS text) IS NULL OR account = :account)
+            AND (CAST(:strategy_tag AS text) IS NULL OR strategy_tag = :strategy_tag)
+            AND (CAST(:start AS timestamptz) IS NULL OR close_time >= :start)
+            AND (CAST(:end AS timestamptz) IS NULL OR close_time < :end)
+        ) closed
+    )
+"""
+
+_TRADE_STATS = """
+    COUNT(*) AS trades,
+    COUNT(*) FILTER (WHERE pnl > 0) AS wins,
+    COALESCE(AVG((pnl > 0)::int), 0) AS win_rate,
+    COALESCE(SUM(pnl), 0) AS total_pnl,
+    COALESCE(AVG(pnl), 0) AS average_pnl,
+    AVG(pnl) FILTER (WHERE pnl > 0) AS average_win,
+    AVG(pnl) FILTER (WHERE pnl <= 0) AS average_loss,
+    AVG(r_multiple) AS average_r_multiple,
+    AVG(holding_hours) AS average_holding_hours
+"""
+
+_TRADE_STATS_DTYPES = {
+    "trades": "int64",
+    "wins": "int64",
+    "win_rate": "float64",
+    "total_pnl": "float64",
+    "average_pnl": "float64",
+    "average_win": "float64",
+    "average_loss": "float64",
+    "average_r_multiple": "float64",
+    "average_holding_hours": "float64",
+}
+
+# Groupings the trade reports accept, all columns of _CLOSED_TRADES
+TRADE_GROUPS = ("symbol", "week", "strategy_tag", "account")
+
+
+def _trade_frame(sql: str, params: Dict[str, Any], dtypes: Dict[str, str], description: str) -> pd.DataFrame:
+    import pandas as pd
+
+    try:
+        with get_engine(ANALYTICS).connect() as connection:
+            result = connection.execute(text(sql), params)
+            return pd.DataFrame(result.fetchall(), columns=list(result.keys())).astype(dtypes)
+    except SQLAlchemyError as e:
+        print(f"Error computing {description}: {e}")
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+
+
+def _trade_filters(account: Optional[str], strategy_tag: Optional[str], start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+    return {"account": account, "strategy_tag": strategy_tag, "start": start, "end": end}
+
+
+def get_trade_stats(
+    account: Optional[str] = None,
+    strategy_tag: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> pd.DataFrame:
+    """
+    Aggregate statistics over closed positions, computed in Postgres.
+
+    Args:
+        account: Only this account's trades (optional)
+        strategy_tag: Only trades opened by this strategy (optional)
+        start: Only trades closed at or after this time (optional)
+        end: Only trades closed before this time (optional)
+
+    Returns:
+        One-row DataFrame with trades, wins, win_rate, total_pnl, average_pnl, average_win,
+        average_loss, average_r_multiple and average_holding_hours
+    """
+    return _trade_frame(f"{_CLOSED_TRADES} SELECT {_TRADE_STATS} FROM trades",
+                        _trade_filters(account, strategy_tag, start, end), _TRADE_STATS_DTYPES, "trade statistics")
+
+
+def get_trade_stats_by(
+    group_by: str,
+    account: Optional[str] = None,
+    strategy_tag: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> pd.DataFrame:
+    """
+    Closed position statistics per symbol, week (of the close), strategy_tag or account.
+
+    Returns:
+        DataFrame with the group column followed by the get_trade_stats columns, ordered by group
+    """
+    if group_by not in TRADE_GROUPS:
+        raise ValueError(f"Cannot group trades by {group_by!r}, expected one of {TRADE_GROUPS}")
+    dtypes = {group_by: "datetime64[ns]" if group_by == "week" else "string", **_TRADE_STATS_DTYPES}
+    return _trade_frame(f"{_CLOSED_TRADES} SELECT {group_by}, {_TRADE_STATS} FROM trades GROUP BY {group_by} ORDER BY {group_by}",
+                        _trade_filters(account, strategy_tag, start, end), dtypes, f"trade statistics by {group_by}")
+
+
+def get_entry_slippage(
+    group_by: str = "symbol",
+    account: Optional[str] = None,
+    strategy_tag: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> pd.DataFrame:
+    """
+    Entry fill slippage against the signal price, for closed positions that recorded one.
+
+    Returns:
+        DataFrame with the group column, trades, average_slippage_bps, worst_slippage_bps and
+        slippage_cost (dollars lost to fills worse than the signal price, net of better ones)
+    """
+    if group_by not in TRADE_GROUPS:
+        raise ValueError(f"Cannot group slippage by {group_by!r}, expected one of {TRADE_GROUPS}")
+    dtypes = {
+        group_by: "datetime64[ns]" if group_by == "week" else "string",
+        "trades": "int64",
+        "average_slippage_bps": "float64",
+        "worst_slippage_bps": "float64",
+        "slippage_cost": "float64",
+    }
+    return _trade_frame(f"""{_CLOSED_TRADES}
+        SELECT {group_by}, COUNT(*) AS trades,
+            AVG(slippage_bps) AS average_slippage_bps,
+            MAX(slippage_bps) AS worst_slippage_bps,
+            SUM(slippage_cost) AS slippage_cost
+        FROM trades WHERE slippage_bps IS NOT NULL
+        GROUP BY {group_by} ORDER BY {group_by}
+    """, _trade_filters(account, strategy_tag, start, end), dtypes, f"entry slippage by {group_by}")
+
+
 # ===========================
 # Generic Table Operations
 # ===========================
@@ -422,43 +1010,86 @@ def get_latest_entries(table_name: str, symbol: str, n: int = 10) -> pd.DataFram
     Retrieve the latest n entries from a table, filtered by symbol, sorted by time (ascending).
     
     Args:
-        table_name: Full table name as string (e.g., "trading.fills", "trading.orders")
+        table_name: Price table name, optionally schema-qualified (e.g., "market_data.daily_bars").
+            Must be a table with 'symbol' and 'time' columns.
         symbol: Symbol to filter by
         n: Number of entries to retrieve (default 10)
     
     Returns:
         DataFrame containing rows sorted by time ascending (most recent last)
     """
+    # pandas is only needed for bar reads, so defer its import until the first one
+    import pandas as pd
+
+    # Settled history comes from the on-disk bar cache when it is enabled
+    cache = get_bar_cache()
+    cached = cache.latest(table_name, symbol, n) if cache is not None else None
+
     try:
-        with get_db_session() as session:
-            from sqlalchemy import text
-            
-            # Build raw SQL query to handle arbitrary table names
+        with get_engine(ANALYTICS).connect() as connection:
+            # Table names are validated against the catalog and the query is
+            # prepared once per connection, so repeated scans skip parse/plan
             # Assumes tables have 'symbol' and 'time' columns
-            # First get n most recent, then sort ascending so latest is last row
-            query_sql = f"""
-                SELECT * FROM (
-                    SELECT * FROM {table_name}
-                    WHERE symbol = :symbol
-                    ORDER BY time DESC
-                    LIMIT :limit
-                ) AS recent
-                ORDER BY time ASC
-            """
-            
-            result = session.execute(
-                text(query_sql),
-                {"symbol": symbol, "limit": n}
-            )
-            
-            # Convert to DataFrame
-            df = pd.DataFrame([dict(row._mapping) for row in result])
+            if cached is None:
+                result = execute_latest_entries(connection, table_name, symbol, n)
+
+                # Convert to DataFrame
+                df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+                return df
+
+            # Only bars newer than the cache go to Postgres
+            last_time = cache.to_datetime(table_name, int(cached["time"][-1]))
+            result = execute_newer_entries(connection, table_name, symbol, last_time, n)
+            newer = pd.DataFrame(result.fetchall()[::-1], columns=list(result.keys()))
+
+        df = cache.to_frame(table_name, symbol, cached)
+        if newer.empty:
             return df
+        if last_time.tzinfo is not None:
+            newer["time"] = pd.to_datetime(newer["time"], utc=True)
+        return pd.concat([df, newer[df.columns]], ignore_index=True).tail(n).reset_index(drop=True)
     except SQLAlchemyError as e:
         print(f"Error retrieving latest entries from {table_name}: {e}")
         return pd.DataFrame()
+    except ValueError as e:
+        print(f"Rejected latest entries query: {e}")
+        return pd.DataFrame()
     except Exception as e:
         print(f"Error executing query on {table_name}: {e}")
         return pd.DataFrame()
 
 
+def get_bar_history(table_name: str, symbols: List[str], start: Optional[datetime] = None, end: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Retrieve every bar for a set of symbols from a price table, sorted by symbol and time.
+
+    Args:
+        table_name: Price table name, optionally schema-qualified (e.g., "market_data.daily_bars").
+            Must be a table with 'symbol', 'time', 'open', 'high', 'low' and 'close' columns.
+        symbols: Symbols to include
+        start: Only bars at or after this time (optional)
+        end: Only bars before this time (optional)
+
+    Returns:
+        DataFrame with symbol, time, open, high, low and close columns
+    """
+    import pandas as pd
+
+    columns = ["symbol", "time", "open", "high", "low", "close"]
+    try:
+        with get_engine(ANALYTICS).connect() as connection:
+            quoted_table = validate_table_name(connection, table_name)
+            result = connection.execute(text(f"""
+                SELECT symbol, time, open, high, low, close FROM {quoted_table}
+                WHERE symbol = ANY(:symbols)
+                AND (CAST(:start AS timestamptz) IS NULL OR time >= :start)
+                AND (CAST(:end AS timestamptz) IS NULL OR time < :end)
+                ORDER BY symbol, time
+            """), {"symbols": list(symbols), "start": start, "end": end})
+            return pd.DataFrame(result.fetchall(), columns=columns)
+    except SQLAlchemyError as e:
+        print(f"Error retrieving bar history from {table_name}: {e}")
+        return pd.DataFrame(columns=columns)
+    except ValueError as e:
+        print(f"Rejected bar history query: {e}")
+        return pd.DataFrame(columns=columns)
@@ -0,0 +1,151 @@
+"""Signal outbox: a Postgres-backed queue between the signal and execution workers.
+
+Signals are inserted into trading.signal_outbox and announced with NOTIFY on the same
+transaction, so a notification is only ever sent for a committed row. Consumers claim
+rows with FOR UPDATE SKIP LOCKED and acknowledge them once handled. A claimed row that
+is never acknowledged (e.g. the consumer died mid-signal) becomes claimable again after
+the visibility timeout, which gives at-least-once delivery. After SIGNAL_MAX_ATTEMPTS
+deliveries a signal is no longer claimed, and one that keeps failing is dead-lettered
+(marked processed, with its error). Each signal has a dedup key, so publishing the same
+signal twice leaves a single row. Consumers are woken through connection.subscribe(SIGNAL_CHANNEL, ...).
+"""
+
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .connection import get_engine, PRIMARY
+
+SIGNAL_CHANNEL = "signal_outbox"
+
+# Claimed rows not acknowledged within this window are delivered again
+VISIBILITY_TIMEOUT = timedelta(seconds=60)
+
+# Deliveries before a signal is no longer claimed
+SIGNAL_MAX_ATTEMPTS = 5
+
+
+def create_outbox_table() -> bool:
+    """Create trading.signal_outbox if it does not exist."""
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS trading.signal_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    dedup_key TEXT NOT NULL UNIQUE,
+                    signal_date DATE NOT NULL,
+                    payload JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    claimed_at TIMESTAMPTZ,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    processed_at TIMESTAMPTZ,
+                    error TEXT
+                )
+            """))
+            # Tables created before signals could be dead-lettered
+            connection.execute(text("ALTER TABLE trading.signal_outbox ADD COLUMN IF NOT EXISTS error TEXT"))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS signal_outbox_pending_idx
+                ON trading.signal_outbox (id) WHERE processed_at IS NULL
+            """))
+            return True
+    except SQLAlchemyError as e:
+        print(f"Error creating signal outbox: {e}")
+        return False
+
+
+def publish_signals(signals: List[Dict[str, Any]], signal_date: date) -> int:
+    """
+    Insert signals and notify listeners, in one transaction.
+
+    Args:
+        signals: Dicts with a "dedup_key" and the "payload" to deliver
+        signal_date: Trading day the signals are for
+
+    Returns:
+        Number of new rows (signals already in the outbox are skipped)
+    """
+    if not signals:
+        return 0
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            # One statement for the batch, unnest keeps the keys and payloads paired up
+            result = connection.execute(text("""
+                INSERT INTO trading.signal_outbox (dedup_key, signal_date, payload)
+                SELECT dedup_key, :signal_date, CAST(payload AS jsonb)
+                FROM unnest(CAST(:dedup_keys AS text[]), CAST(:payloads AS text[])) AS batch(dedup_key, payload)
+                ON CONFLICT (dedup_key) DO NOTHING
+                RETURNING id
+            """), {
+                "signal_date": signal_date,
+                "dedup_keys": [signal["dedup_key"] for signal in signals],
+                "payloads": [json.dumps(signal["payload"]) for signal in signals]
+            })
+            inserted = len(result.fetchall())
+            connection.execute(text("SELECT pg_notify(:channel, '')"), {"channel": SIGNAL_CHANNEL})
+            return inserted
+    except SQLAlchemyError as e:
+        print(f"Error publishing signals: {e}")
+        return 0
+
+
+def claim_signals(limit: int = 100, visibility_timeout: timedelta = VISIBILITY_TIMEOUT, max_attempts: int = SIGNAL_MAX_ATTEMPTS) -> List[Dict[str, Any]]:
+    """
+    Claim pending signals in publish order, skipping rows another consumer holds and rows
+    already delivered max_attempts times.
+
+    Returns:
+        Dicts with id, signal_date, payload and attempts (1 on first delivery)
+    """
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            result = connection.execute(text("""
+                UPDATE trading.signal_outbox
+                SET claimed_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM trading.signal_outbox
+                    WHERE processed_at IS NULL
+                    AND (claimed_at IS NULL OR claimed_at < CURRENT_TIMESTAMP - :timeout)
+                    AND attempts < :max_attempts
+                    ORDER BY id
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, signal_date, payload, attempts
+            """), {"limit": limit, "timeout": visibility_timeout, "max_attempts": max_attempts})
+            rows = [dict(row._mapping) for row in result]
+            return sorted(rows, key=lambda row: row["id"])
+    except SQLAlchemyError as e:
+        print(f"Error claiming signals: {e}")
+        return []
+
+
+def ack_signals(ids: List[int]) -> bool:
+    """Mark claimed signals as handled so they are never delivered again."""
+    if not ids:
+        return True
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            connection.execute(text(
+                "UPDATE trading.signal_outbox SET processed_at = CURRENT_TIMESTAMP WHERE id = ANY(:ids)"
+            ), {"ids": list(ids)})
+            return True
+    except SQLAlchemyError as e:
+        print(f"Error acknowledging signals: {e}")
+        return False
+
+
+def dead_letter_signal(signal_id: int, error: str) -> bool:
+    """Give up on a signal: mark it processed with the error that kept it from being handled."""
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            connection.execute(text(
+                "UPDATE trading.signal_outbox SET processed_at = CURRENT_TIMESTAMP, error = :error WHERE id = :id"
+            ), {"id": signal_id, "error": error})
+            return True
+    except SQLAlchemyError as e:
+        print(f"Error dead-lettering signal: {e}")
+        return False
@@ -0,0 +1,458 @@
+"""Column, trigger, index and partition management for the trading tables and price sources.
+
+Creates tables the engine owns, adds columns introduced after the trading tables were created, installs the triggers that
+NOTIFY row changes to in-process caches (see connection.subscribe_table_changes), declares the indexes
+the hot queries rely on, creates any that are missing without
+blocking writers (CREATE INDEX CONCURRENTLY), keeps time partitions ahead of the clock
+for partitioned price tables, and checks the hot queries' plans for sequential scans.
+"""
+
+import hashlib
+import json
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .connection import Base, get_engine, PRIMARY, ANALYTICS, TABLE_CHANGES_CHANNEL
+from .models import PnLSnapshot
+from .statements import IDENTIFIER_PATTERN, validate_table_name
+
+# Tables smaller than this are expected to be scanned, a plan check only flags larger ones
+SEQ_SCAN_MIN_ROWS = 10000
+
+
+class IndexSpec(NamedTuple):
+    """An index to maintain: key expression, optional covering columns and predicate."""
+    table: str
+    columns: str
+    include: Optional[List[str]] = None
+    where: Optional[str] = None
+    name: Optional[str] = None
+
+    def index_name(self) -> str:
+        """Explicit name, or one derived from the table and key (Postgres limits names to 63 chars)."""
+        if self.name:
+            return self.name
+        table = self.table.split(".")[-1]
+        key = "_".join(part.split()[0] for part in self.columns.split(","))
+        name = f"{table}_{key}_idx"
+        if len(name) > 63:
+            name = f"{name[:46]}_{hashlib.md5(name.encode()).hexdigest()[:12]}_idx"
+        return name
+
+
+class ColumnSpec(NamedTuple):
+    """A column added to an existing table: name and full column definition."""
+    table: str
+    name: str
+    definition: str
+
+
+# Tables created by the engine itself, from their models
+ENGINE_TABLES = [PnLSnapshot.__table__]
+
+
+TRADING_COLUMNS = [
+    ColumnSpec("trading.positions", "account", "varchar(50) NOT NULL DEFAULT 'default'"),
+    ColumnSpec("trading.positions", "realized_pnl", "numeric(18, 4)"),
+    ColumnSpec("trading.positions", "closed_quantity", "numeric(18, 8)"),
+]
+
+
+class TriggerSpec(NamedTuple):
+    """A table whose row changes are notified, with the columns identifying a changed row."""
+    table: str
+    key_columns: List[str]
+
+
+CHANGE_TRIGGERS = [
+    TriggerSpec("trading.universe", ["snapshot_id", "symbol", "week_start_date", "price_source_table"]),
+    TriggerSpec("trading.positions", ["id", "account", "symbol", "status"]),
+]
+
+
+TRADING_INDEXES = [
+    IndexSpec("trading.positions", "status", where="status = 'OPEN'", name="positions_open_idx"),
+    IndexSpec("trading.positions", "symbol"),
+    IndexSpec("trading.positions", "account", where="status = 'OPEN'", name="positions_account_open_idx"),
+    IndexSpec("trading.positions", "close_time", where="status = 'CLOSED'", name="positions_closed_idx"),
+    IndexSpec("trading.universe", "week_start_date, is_active"),
+    IndexSpec("trading.universe", "symbol"),
+    IndexSpec("trading.orders", "status"),
+    IndexSpec("trading.orders", "symbol"),
+    IndexSpec("trading.fills", "order_id"),
+]
+
+
+def _quote(table_name: str) -> str:
+    parts = table_name.split(".")
+    if len(parts) > 2 or not all(IDENTIFIER_PATTERN.match(part) for part in parts):
+        raise ValueError(f"Invalid table name: {table_name!r}")
+    return ".".join(f'"{part}"' for part in parts)
+
+
+def _split(table_name: str):
+    schema, _, table = table_name.rpartition(".")
+    return schema or "public", table
+
+
+def get_price_tables() -> List[str]:
+    """Every price source table referenced by the universe."""
+    try:
+        with get_engine(ANALYTICS).connect() as connection:
+            result = connection.execute(text(
+                "SELECT DISTINCT price_source_table FROM trading.universe WHERE price_source_table IS NOT NULL"
+            ))
+            return sorted(row[0] for row in result)
+    except SQLAlchemyError as e:
+        print(f"Error listing price tables: {e}")
+        return []
+
+
+def price_table_indexes(connection, table_name: str) -> List[IndexSpec]:
+    """
+    The (symbol, time DESC) index behind get_latest_entries, covering every other column
+    so latest-entries reads are answered from the index alone.
+    """
+    validate_table_name(connection, table_name)
+    schema, table = _split(table_name)
+    result = connection.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = :schema AND table_name = :table AND column_name NOT IN ('symbol', 'time')
+        ORDER BY ordinal_position
+    """), {"schema": schema, "table": table})
+    include = [row[0] for row in result if IDENTIFIER_PATTERN.match(row[0])]
+    return [IndexSpec(table_name, "symbol, time DESC", include=include or None)]
+
+
+def _relation_kind(connection, table_name: str) -> Optional[str]:
+    schema, table = _split(table_name)
+    return connection.execute(text("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :table
+    """), {"schema": schema, "table": table}).scalar()
+
+
+def _index_state(connection, schema: str, name: str) -> Optional[bool]:
+    """None if the index does not exist, otherwise whether it is valid."""
+    return connection.execute(text("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :name
+    """), {"schema": schema, "name": name}).scalar()
+
+
+def ensure_tables() -> bool:
+    """Create the engine-owned tables (and their indexes) that do not exist yet."""
+    try:
+        Base.metadata.create_all(get_engine(PRIMARY), tables=ENGINE_TABLES, checkfirst=True)
+        return True
+    except SQLAlchemyError as e:
+        print(f"Error ensuring tables: {e}")
+        return False
+
+
+def ensure_columns(columns: Optional[List[ColumnSpec]] = None) -> List[str]:
+    """
+    Add any declared column a table is missing, idempotently.
+
+    Returns:
+        "table.column" for every column that was added
+    """
+    added = []
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            for spec in columns if columns is not None else TRADING_COLUMNS:
+                schema, table = _split(spec.table)
+                exists = connection.execute(text("""
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = :schema AND table_name = :table AND column_name = :column
+                """), {"schema": schema, "table": table, "column": spec.name}).scalar()
+                if exists or not IDENTIFIER_PATTERN.match(spec.name):
+                    continue
+                connection.execute(text(f'ALTER TABLE {_quote(spec.table)} ADD COLUMN IF NOT EXISTS "{spec.name}" {spec.definition}'))
+                print(f"Added column {spec.table}.{spec.name}")
+                added.append(f"{spec.table}.{spec.name}")
+    except SQLAlchemyError as e:
+        print(f"Error ensuring columns: {e}")
+    return added
+
+
+def ensure_change_triggers(triggers: Optional[List[TriggerSpec]] = None) -> List[str]:
+    """
+    Install the row change triggers, idempotently.
+
+    Each insert, update or delete sends {"table", "op", "key"} on TABLE_CHANGES_CHANNEL
+    when its transaction commits, key holding the spec's key columns of the row.
+
+    Returns:
+        Tables whose trigger was (re)installed
+    """
+    installed = []
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            connection.execute(text(f"""
+                CREATE OR REPLACE FUNCTION trading.notify_table_change() RETURNS trigger AS $$
+                DECLARE
+                    row_data jsonb := CASE WHEN TG_OP = 'DELETE' THEN to_jsonb(OLD) ELSE to_jsonb(NEW) END;
+                    row_key jsonb := '{{}}'::jsonb;
+                    key_column text;
+                BEGIN
+                    FOREACH key_column IN ARRAY TG_ARGV LOOP
+                        row_key := row_key || jsonb_build_object(key_column, row_data -> key_column);
+                    END LOOP;
+                    PERFORM pg_notify('{TABLE_CHANGES_CHANNEL}', jsonb_build_object(
+                        'table', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME, 'op', TG_OP, 'key', row_key
+                    )::text);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """))
+
+            for spec in triggers if triggers is not None else CHANGE_TRIGGERS:
+                if _relation_kind(connection, spec.table) is None:
+                    print(f"Skipping change trigger: {spec.table} does not exist")
+                    continue
+                if not all(IDENTIFIER_PATTERN.match(column) for column in spec.key_columns):
+                    raise ValueError(f"Invalid key columns for {spec.table}: {spec.key_columns}")
+                _, table = _split(spec.table)
+                arguments = ", ".join(f"'{column}'" for column in spec.key_columns)
+                # Dropped and created in one transaction, so no change goes un-notified in between
+                connection.execute(text(f'DROP TRIGGER IF EXISTS "{table}_notify_change" ON {_quote(spec.table)}'))
+                connection.execute(text(f"""
+                    CREATE TRIGGER "{table}_notify_change"
+                    AFTER INSERT OR UPDATE OR DELETE ON {_quote(spec.table)}
+                    FOR EACH ROW EXECUTE FUNCTION trading.notify_table_change({arguments})
+                """))
+                installed.append(spec.table)
+    except SQLAlchemyError as e:
+        print(f"Error ensuring change triggers: {e}")
+        return []
+    return installed
+
+
+def ensure_index(connection, spec: IndexSpec) -> bool:
+    """
+    Create an index if it is missing, rebuilding it if an earlier concurrent build left it invalid.
+
+    Args:
+        connection: Connection in AUTOCOMMIT mode (concurrent builds cannot run in a transaction)
+        spec: Index to ensure
+
+    Returns:
+        True if the index was created
+    """
+    schema, _ = _split(spec.table)
+    name = spec.index_name()
+    kind = _relation_kind(connection, spec.table)
+    if kind is None:
+        print(f"Skipping index {name}: {spec.table} does not exist")
+        return False
+
+    state = _index_state(connection, schema, name)
+    if state is True:
+        return False
+    if state is False:
+        connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{schema}"."{name}"'))
+
+    # Partitioned parents cannot be indexed concurrently, the index cascades to each partition
+    concurrently = "" if kind == "p" else "CONCURRENTLY "
+    include = f" INCLUDE ({', '.join(spec.include)})" if spec.include else ""
+    where = f" WHERE {spec.where}" if spec.where else ""
+    connection.execute(text(
+        f'CREATE INDEX {concurrently}IF NOT EXISTS "{name}" ON {_quote(spec.table)} ({spec.columns}){include}{where}'
+    ))
+    print(f"Created index {schema}.{name}")
+    return True
+
+
+def ensure_indexes(price_tables: Optional[List[str]] = None) -> List[str]:
+    """
+    Apply every declared index, idempotently.
+
+    Args:
+        price_tables: Price tables to index (default: every table referenced by the universe)
+
+    Returns:
+        Names of the indexes that were created
+    """
+    if price_tables is None:
+        price_tables = get_price_tables()
+
+    created = []
+    try:
+        with get_engine(PRIMARY).connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            specs = list(TRADING_INDEXES)
+            for table_name in price_tables:
+                try:
+                    specs += price_table_indexes(connection, table_name)
+                except ValueError as e:
+                    print(f"Skipping price table index: {e}")
+
+            for spec in specs:
+                try:
+                    if ensure_index(connection, spec):
+                        created.append(spec.index_name())
+                except SQLAlchemyError as e:
+                    print(f"Error creating index {spec.index_name()}: {e}")
+    except SQLAlchemyError as e:
+        print(f"Error ensuring indexes: {e}")
+    return created
+
+
+# ===========================
+# Time Partitioning
+# ===========================
+
+def _partition_bounds(start: date, interval: str):
+    """Start of the partition containing start and the start of the next one."""
+    if interval == "year":
+        lower = date(start.year, 1, 1)
+        return lower, date(lower.year + 1, 1, 1)
+    if interval == "month":
+        lower = date(start.year, start.month, 1)
+        return lower, date(lower.year + (lower.month == 12), lower.month % 12 + 1, 1)
+    raise ValueError(f"Unsupported partition interval: {interval!r}")
+
+
+def create_partitioned_price_table(table_name: str, value_columns: Optional[List[str]] = None) -> bool:
+    """
+    Create a price table partitioned by time range, with the same layout as the bar tables.
+
+    Args:
+        table_name: New table, optionally schema-qualified
+        value_columns: Float columns after symbol and time (default: open, high, low, close, volume)
+    """
+    value_columns = value_columns or ["open", "high", "low", "close", "volume"]
+    try:
+        if not all(IDENTIFIER_PATTERN.match(column) for column in value_columns):
+            raise ValueError(f"Invalid column names: {value_columns!r}")
+        columns = ", ".join(["symbol text NOT NULL", "time timestamptz NOT NULL"] + [f"{column} float8" for column in value_columns])
+        with get_engine(PRIMARY).begin() as connection:
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {_quote(table_name)} ({columns}) PARTITION BY RANGE (time)"))
+        return True
+    except (SQLAlchemyError, ValueError) as e:
+        print(f"Error creating partitioned table {table_name}: {e}")
+        return False
+
+
+def ensure_partitions(table_name: str, start: date, end: date, interval: str = "month") -> List[str]:
+    """
+    Create the partitions of a time-partitioned table covering [start, end), idempotently.
+
+    Returns:
+        Names of the partitions covering the range
+    """
+    partitions = []
+    try:
+        with get_engine(PRIMARY).begin() as connection:
+            if _relation_kind(connection, table_name) != "p":
+                print(f"{table_name} is not partitioned, skipping partitions")
+                return []
+
+            lower, upper = _partition_bounds(start, interval)
+            while lower < end:
+                suffix = lower.strftime("%Y") if interval == "year" else lower.strftime("%Y_%m")
+                partition = f"{table_name}_{suffix}"
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {_quote(partition)} PARTITION OF {_quote(table_name)} "
+                    f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+                ))
+                partitions.append(partition)
+                lower, upper = upper, _partition_bounds(upper, interval)[1]
+    except (SQLAlchemyError, ValueError) as e:
+        print(f"Error creating partitions for {table_name}: {e}")
+    return partitions
+
+
+def ensure_upcoming_partitions(price_tables: Optional[List[str]] = None, interval: str = "month", ahead: int = 2) -> List[str]:
+    """Keep partitions in place for the current and next few periods of every partitioned price table."""
+    if price_tables is None:
+        price_tables = get_price_tables()
+
+    today = date.today()
+    end = today
+    for _ in range(ahead + 1):
+        end = _partition_bounds(end, interval)[1]
+
+    partitions = []
+    try:
+        with get_engine(PRIMARY).connect() as connection:
+            partitioned = [t for t in price_tables if _relation_kind(connection, t) == "p"]
+    except SQLAlchemyError as e:
+        print(f"Error checking partitioned tables: {e}")
+        return partitions
+
+    for table_name in partitioned:
+        partitions += ensure_partitions(table_name, today, end, interval)
+    return partitions
+
+
+# ===========================
+# Plan Checks
+# ===========================
+
+def hot_queries(price_tables: List[str]) -> Dict[str, tuple]:
+    """The queries the engine runs every scan, with representative parameters."""
+    queries = {
+        "open_positions": ("SELECT * FROM trading.positions WHERE status = 'OPEN'", {}),
+        "active_universe": (
+            "SELECT * FROM trading.universe WHERE week_start_date = :week AND is_active = TRUE",
+            {"week": date.today()}
+        ),
+        "universe_by_symbol": ("SELECT * FROM trading.universe WHERE symbol = :symbol", {"symbol": "SPY"}),
+    }
+    for table_name in price_tables:
+        queries[f"latest_entries {table_name}"] = (
+            f"SELECT * FROM {_quote(table_name)} WHERE symbol = :symbol ORDER BY time DESC LIMIT 30",
+            {"symbol": "SPY"}
+        )
+    return queries
+
+
+def _sequential_scans(plan: dict) -> List[str]:
+    """Relations read by a Seq Scan anywhere in a JSON plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(f"{plan.get('Schema', 'public')}.{plan.get('Relation Name')}")
+    for child in plan.get("Plans", []):
+        found += _sequential_scans(child)
+    return found
+
+
+def check_query_plans(price_tables: Optional[List[str]] = None, min_rows: int = SEQ_SCAN_MIN_ROWS) -> List[str]:
+    """
+    EXPLAIN the hot queries and report any that sequentially scan a table of at least min_rows.
+
+    Returns:
+        One warning per offending query, empty if every plan uses an index
+    """
+    if price_tables is None:
+        price_tables = get_price_tables()
+
+    warnings = []
+    try:
+        with get_engine(ANALYTICS).connect() as connection:
+            for name, (query, params) in hot_queries(price_tables).items():
+                try:
+                    result = connection.execute(text(f"EXPLAIN (FORMAT JSON, VERBOSE) {query}"), params).scalar()
+                    plan = (json.loads(result) if isinstance(result, str) else result)[0]["Plan"]
+                except SQLAlchemyError as e:
+                    connection.rollback()
+                    warnings.append(f"{name}: could not be explained ({e.__class__.__name__})")
+                    continue
+
+                for relation in _sequential_scans(plan):
+                    schema, table = _split(relation)
+                    rows = connection.execute(text("""
+                        SELECT c.reltuples FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                        WHERE n.nspname = :schema AND c.relname = :table
+                    """), {"schema": schema, "table": table}).scalar() or 0
+                    if rows >= min_rows:
+                        warnings.append(f"{name}: sequential scan on {relation} (~{int(rows)} rows)")
+    except SQLAlchemyError as e:
+        warnings.append(f"Plan check failed: {e}")
+    return warnings
@@ -0,0 +1,405 @@
+"""Durable local spool for trading writes while Postgres is slow or unreachable.
+
+Spoolable writes (fills, orders, positions, P&L snapshots, see operations) go straight to
+Postgres while it is healthy. A write that cannot reach the database, or takes longer than
+DB_SPOOL_LATENCY seconds, trips the spool: from then on every spoolable write is appended
+to a local file (one JSON record per line, fsynced) and the caller carries on with the
+values it asked to write. A background thread replays the file to Postgres in order once
+it answers again, and writes go direct again when the spool is drained.
+
+Replay is idempotent. Rows are inserted with primary keys reserved from their sequences
+ahead of time (see WriteSpool.reserve_id) and ON CONFLICT DO NOTHING, and updates set
+absolute values, so a batch replayed twice after a crash leaves the same rows. The replay
+position is checkpointed next to the spool file. Set DB_SPOOL_PATH to "" to disable.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError, TimeoutError as PoolTimeoutError
+
+from .connection import get_db_session, get_engine, PRIMARY
+
+SPOOL_PATH = os.getenv("DB_SPOOL_PATH", "spool/writes.spool")
+
+# Writes slower than this trip the spool, as does any write that cannot connect
+SPOOL_LATENCY = float(os.getenv("DB_SPOOL_LATENCY", "2"))
+SPOOL_RETRY_INTERVAL = float(os.getenv("DB_SPOOL_RETRY_INTERVAL", "5"))
+SPOOL_FSYNC = os.getenv("DB_SPOOL_FSYNC", "true").lower() != "false"
+
+REPLAY_BATCH_SIZE = 500
+
+# Primary keys fetched per sequence round trip, refilled at a quarter full
+RESERVE_SIZE = 200
+
+# Tables whose spooled inserts carry a reserved primary key, {table: key column}
+RESERVED_KEYS = {
+    "trading.fills": "fill_id",
+    "trading.positions": "id",
+    "trading.pnl_snapshots": "id",
+}
+
+# Applies one write inside a session, registered by operations with spool_handler
+_handlers: Dict[str, Callable[[Any, Dict[str, Any]], Any]] = {}
+
+
+def spool_handler(op: str):
+    """Register the function applying a spoolable write, called as apply(session, values)."""
+    def register(apply):
+        _handlers[op] = apply
+        return apply
+    return register
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot spool {type(value).__name__} values")
+
+
+def _decode(value: Dict[str, Any]) -> Any:
+    if len(value) == 1:
+        if "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if "$date" in value:
+            return date.fromisoformat(value["$date"])
+    return value
+
+
+def _is_unavailable(error: SQLAlchemyError) -> bool:
+    """Whether an error means the database could not be reached in time, rather than a bad write."""
+    if isinstance(error, (OperationalError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class WriteSpool:
+    """Falls back from Postgres to an append-only local file, and replays it when Postgres recovers."""
+
+    def __init__(self, path: str = SPOOL_PATH, latency: float = SPOOL_LATENCY, retry_interval: float = SPOOL_RETRY_INTERVAL):
+        self.path = Path(path)
+        self.offset_path = self.path.with_name(self.path.name + ".offset")
+        self.rejected_path = self.path.with_name(self.path.name + ".rejected")
+        self.latency = latency
+        self.retry_interval = retry_interval
+
+        self.spooled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.tripped_at: Optional[float] = None
+        self.reason: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._reserves: Dict[Tuple[str, str], Deque[int]] = {}
+        self._exhausted: set = set()
+        self._thread: Optional[threading.Thread] = None
+
+        # Records left over from an earlier run are replayed before anything is written direct
+        self.spooling = self.pending_bytes() > 0
+        if self.spooling:
+            self.reason = "records left from a previous run"
+            self.tripped_at = time.time()
+
+    # ---------- writing ----------
+
+    def write(self, op: str, values: Dict[str, Any], spooled_result: Any = None) -> Any:
+        """
+        Apply a write to Postgres, or spool it when Postgres is unavailable.
+
+        Returns:
+            The handler's result, or spooled_result when the write was spooled.
+            Errors other than unavailability (e.g. integrity errors) are raised.
+        """
+        apply = _handlers[op]
+        if not self.spooling:
+            started = time.perf_counter()
+            try:
+                with get_db_session(PRIMARY) as session:
+                    result = apply(session, values)
+            except SQLAlchemyError as e:
+                if not _is_unavailable(e):
+                    raise
+                self.trip(f"{op} failed: {e.__class__.__name__}")
+            else:
+                elapsed = time.perf_counter() - started
+                if elapsed > self.latency:
+                    # This write landed, the next ones should not wait as long
+                    self.trip(f"{op} took {elapsed:.1f}s")
+                return result
+
+        self.append(op, values)
+        return spooled_result
+
+    def append(self, op: str, values: Dict[str, Any]):
+        record = json.dumps({"op": op, "values": values, "at": time.time()}, default=_encode, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "ab")
+                # A torn record from a crash becomes its own (rejected) line instead of merging with this one
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    self._file.write(b"\n")
+            self._file.write(record.encode() + b"\n")
+            self._file.flush()
+            if SPOOL_FSYNC:
+                os.fsync(self._file.fileno())
+            self.spooling = True
+            self.spooled += 1
+        self._ensure_replayer()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def trip(self, reason: str):
+        with self._lock:
+            if not self.spooling:
+                print(f"Spooling database writes to {self.path}: {reason}")
+                self.spooling = True
+                self.tripped_at = time.time()
+                self.reason = reason
+        self._ensure_replayer()
+
+    # ---------- reserved primary keys ----------
+
+    def reserve_id(self, table: str, column: str) -> Optional[int]:
+        """
+        Take a primary key for a new row from the ids reserved ahead of time from its sequence.
+
+        Refilled while the database is healthy, so rows created while it is away still get their
+        final id. Returns None when the reserve ran dry during an outage.
+        """
+        with self._lock:
+            ids = self._reserves.setdefault((table, column), deque())
+        if len(ids) < RESERVE_SIZE // 4 and not self.spooling:
+            self._refill(table, column, ids)
+        try:
+            return ids.popleft()
+        except IndexError:
+            if (table, column) not in self._exhausted:
+                self._exhausted.add((table, column))
+                print(f"No reserved {table}.{column} values left, new rows get their id on replay")
+            return None
+
+    def _refill(self, table: str, column: str, ids: Deque[int]):
+        try:
+            with get_engine(PRIMARY).connect() as connection:
+                result = connection.execute(text(
+                    "SELECT nextval(pg_get_serial_sequence(:table, :column)) FROM generate_series(1, :count)"
+                ), {"table": table, "column": column, "count": RESERVE_SIZE - len(ids)})
+                ids.extend(row[0] for row in result)
+            self._exhausted.discard((table, column))
+        except SQLAlchemyError as e:
+            print(f"Error reserving {table}.{column} values: {e}")
+
+    def reserve_ids(self, columns: Optional[Dict[str, str]] = None):
+        """Fill the reserves up front, {table: primary key column} (default RESERVED_KEYS)."""
+        for table, column in (columns if columns is not None else RESERVED_KEYS).items():
+            with self._lock:
+                ids = self._reserves.setdefault((table, column), deque())
+            self._refill(table, column, ids)
+
+    # ---------- replay ----------
+
+    def pending_bytes(self) -> int:
+        try:
+            return max(self.path.stat().st_size - self._read_offset(), 0)
+        except FileNotFoundError:
+            return 0
+
+    def _read_offset(self) -> int:
+        try:
+            return int(self.offset_path.read_text().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset: int):
+        temporary = self.offset_path.with_name(self.offset_path.name + ".tmp")
+        temporary.write_text(str(offset))
+        os.replace(temporary, self.offset_path)
+
+    def _reject(self, line: bytes, reason: str):
+        print(f"Rejected spooled write: {reason}")
+        with open(self.rejected_path, "ab") as f:
+            f.write(line.rstrip(b"\n") + b"\n")
+        self.rejected += 1
+
+    def _apply_batch(self, batch: list) -> None:
+        with get_db_session(PRIMARY) as session:
+            for line, record in batch:
+                apply = _handlers.get(record.get("op")) if record is not None else None
+                if apply is None:
+                    self._reject(line, "unreadable record" if record is None else f"unknown write {record.get('op')!r}")
+                    continue
+                # A bad record is set aside, not allowed to block every write behind it
+                savepoint = session.begin_nested()
+                try:
+                    apply(session, record["values"])
+                    savepoint.commit()
+                except SQLAlchemyError as e:
+                    savepoint.rollback()
+                    if _is_unavailable(e):
+                        raise
+                    self._reject(line, str(e))
+
+    def replay(self, final: bool = False) -> int:
+        """
+        Replay spooled records to Postgres in order, checkpointing after each batch.
+
+        Args:
+            final: The spool is locked against appends, so an unterminated last line is a torn record
+
+        Returns:
+            Number of records applied
+        """
+        applied = 0
+        offset = self._read_offset()
+        if not self.path.exists():
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while True:
+                batch = []
+                end = offset
+                while len(batch) < REPLAY_BATCH_SIZE:
+                    line = f.readline()
+                    if not line or (not line.endswith(b"\n") and not final):
+                        break
+                    end += len(line)
+                    try:
+                        record = json.loads(line, object_hook=_decode)
+                    except ValueError:
+                        record = None
+                    batch.append((line, record))
+                if not batch:
+                    return applied
+
+                self._apply_batch(batch)
+                offset = end
+                self._write_offset(offset)
+                applied += len(batch)
+                self.replayed += len(batch)
+
+    def healthy(self) -> bool:
+        started = time.perf_counter()
+        try:
+            with get_engine(PRIMARY).connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except SQLAlchemyError:
+            return False
+        return time.perf_counter() - started <= self.latency
+
+    def recover(self) -> bool:
+        """Drain the spool if Postgres is back, and switch writes back to direct. Returns True when drained."""
+        if not self.healthy():
+            return False
+        try:
+            replayed = self.replay()
+            # Appends wait for the last records, so nothing is written direct ahead of them
+            with self._lock:
+                replayed += self.replay(final=True)
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self.path.unlink(missing_ok=True)
+                self.offset_path.unlink(missing_ok=True)
+                outage = time.time() - self.tripped_at if self.tripped_at else 0
+                self.spooling = False
+                self.tripped_at = None
+                self.reason = None
+            print(f"Database writes back to direct after {outage:.0f}s, {replayed} spooled writes replayed")
+            return True
+        except SQLAlchemyError as e:
+            print(f"Spool replay interrupted: {e.__class__.__name__}")
+            return False
+
+    def _ensure_replayer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-spool", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while self.spooling:
+            time.sleep(self.retry_interval)
+            self.recover()
+
+    def start(self):
+        """
+        Replay records left from an earlier run, before anything reads the tables they write,
+        and reserve primary keys for new rows. Keeps retrying in the background if Postgres is down.
+        """
+        if self.spooling:
+            print(f"Replaying {self.pending_bytes()} bytes of spooled database writes from {self.path}")
+            if not self.recover():
+                self._ensure_replayer()
+        if not self.spooling:
+            self.reserve_ids()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "spooling": self.spooling,
+            "reason": self.reason,
+            "spooling_seconds": time.time() - self.tripped_at if self.tripped_at else None,
+            "pending_bytes": self.pending_bytes(),
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+        }
+
+
+class DirectWrites:
+    """Stand-in when spooling is disabled: writes go straight to Postgres and errors are raised."""
+
+    spooling = False
+
+    def write(self, op: str, values: Dict[str, Any], spooled_result: Any = None) -> Any:
+        with get_db_session(PRIMARY) as session:
+            return _handlers[op](session, values)
+
+    def reserve_id(self, table: str, column: str) -> Optional[int]:
+        return None
+
+    def pending_bytes(self) -> int:
+        return 0
+
+    def reserve_ids(self, columns: Optional[Dict[str, str]] = None):
+        pass
+
+    def start(self):
+        pass
+
+    def status(self) -> Dict[str, Any]:
+        return {"spooling": False, "enabled": False}
+
+
+_write_spool = None
+_write_spool_lock = threading.Lock()
+
+
+def get_write_spool():
+    """The process-wide write spool at DB_SPOOL_PATH (direct writes when disabled)."""
+    global _write_spool
+    with _write_spool_lock:
+        if _write_spool is None:
+            _write_spool = WriteSpool(SPOOL_PATH) if SPOOL_PATH else DirectWrites()
+    return _write_spool
+
+
+def get_spool_status() -> Dict[str, Any]:
+    """Spooling state, pending bytes and write counts, for health reporting."""
+    return get_write_spool().status()
@@ -0,0 +1,155 @@
+"""Validated table identifiers and server-side prepared statements for bar reads.
+
+Price tables are referenced by name (trading.universe.price_source_table), so they
+cannot be bound as query parameters. Names are checked against a whitelist reflected
+from the catalog (tables exposing both a symbol and a time column) before being
+quoted into SQL, and each table's query is prepared once per database connection.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from typing import Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Refresh the whitelist at most this often when an unknown table is requested
+WHITELIST_REFRESH_SECONDS = 60
+
+_whitelist: Optional[Set[str]] = None
+_whitelist_loaded_at = 0.0
+_whitelist_lock = threading.Lock()
+
+
+def _load_price_tables(connection) -> Set[str]:
+    """Reflect every table or view that has symbol and time columns."""
+    result = connection.execute(text("""
+        SELECT table_schema, table_name
+        FROM information_schema.columns
+        WHERE column_name IN ('symbol', 'time')
+        GROUP BY table_schema, table_name
+        HAVING COUNT(DISTINCT column_name) = 2
+    """))
+    tables = set()
+    for schema, table in result:
+        tables.add(f"{schema}.{table}")
+        if schema == "public":
+            tables.add(table)
+    return tables
+
+
+def invalidate_price_tables() -> None:
+    """Drop the cached whitelist so it is reflected again on next use."""
+    global _whitelist
+    with _whitelist_lock:
+        _whitelist = None
+
+
+def validate_table_name(connection, table_name: str) -> str:
+    """
+    Check table_name against the whitelist and return it as a quoted identifier.
+
+    Raises:
+        ValueError: If the name is malformed or not a known price table
+    """
+    global _whitelist, _whitelist_loaded_at
+
+    parts = table_name.split(".")
+    if len(parts) > 2 or not all(IDENTIFIER_PATTERN.match(part) for part in parts):
+        raise ValueError(f"Invalid table name: {table_name!r}")
+
+    with _whitelist_lock:
+        stale = time.monotonic() - _whitelist_loaded_at > WHITELIST_REFRESH_SECONDS
+        if _whitelist is None or (table_name not in _whitelist and stale):
+            _whitelist = _load_price_tables(connection)
+            _whitelist_loaded_at = time.monotonic()
+        if table_name not in _whitelist:
+            raise ValueError(f"Unknown price table: {table_name!r}")
+
+    return ".".join(f'"{part}"' for part in parts)
+
+
+def _statement_name(prefix: str, quoted_table: str) -> str:
+    """Build a stable prepared statement name for a table (Postgres limits names to 63 chars)."""
+    return f"{prefix}_{hashlib.md5(quoted_table.encode()).hexdigest()[:16]}"
+
+
+def execute_prepared(connection, prefix: str, quoted_table: str, definition: str, arguments: str, params: dict):
+    """
+    Execute a per-table prepared statement, preparing it on this connection if needed.
+
+    Args:
+        connection: SQLAlchemy Connection
+        prefix: Statement family, e.g. "latest_entries"
+        quoted_table: Identifier returned by validate_table_name
+        definition: PREPARE clause after the name, with {table} as a placeholder
+        arguments: EXECUTE argument list in driver paramstyle, e.g. "(%(symbol)s, %(limit)s)"
+        params: Values for the arguments
+    """
+    name = _statement_name(prefix, quoted_table)
+
+    # The DBAPI connection's info dict lives as long as the server session does
+    prepared = connection.connection.info.setdefault("prepared_statements", set())
+
+    for attempt in range(2):
+        try:
+            if name not in prepared:
+                connection.exec_driver_sql(f"PREPARE {name} {definition.format(table=quoted_table)}")
+                prepared.add(name)
+            return connection.exec_driver_sql(f"EXECUTE {name} {arguments}", params)
+        except DBAPIError:
+            # Typically a cached plan invalidated by a table change, prepare it again once
+            if attempt or name not in prepared:
+                raise
+            connection.rollback()
+            connection.exec_driver_sql(f"DEALLOCATE {name}")
+            prepared.discard(name)
+
+
+LATEST_ENTRIES_DEFINITION = """(text, integer) AS
+    SELECT * FROM (
+        SELECT * FROM {table}
+        WHERE symbol = $1
+        ORDER BY time DESC
+        LIMIT $2
+    ) AS recent
+    ORDER BY time ASC
+"""
+
+
+def execute_latest_entries(connection, table_name: str, symbol: str, n: int):
+    """Run the prepared latest-entries query for a validated price table."""
+    quoted_table = validate_table_name(connection, table_name)
+    return execute_prepared(
+        connection,
+        "latest_entries",
+        quoted_table,
+        LATEST_ENTRIES_DEFINITION,
+        "(%(symbol)s, %(limit)s)",
+        {"symbol": symbol, "limit": n}
+    )
+
+
+NEWER_ENTRIES_DEFINITION = """AS
+    SELECT * FROM {table}
+    WHERE symbol = $1 AND time > $2
+    ORDER BY time DESC
+    LIMIT $3
+"""
+
+
+def execute_newer_entries(connection, table_name: str, symbol: str, after, n: int):
+    """Run the prepared query for up to n bars newer than after, most recent first."""
+    quoted_table = validate_table_name(connection, table_name)
+    return execute_prepared(
+        connection,
+        "newer_entries",
+        quoted_table,
+        NEWER_ENTRIES_DEFINITION,
+        "(%(symbol)s, %(after)s, %(limit)s)",
+        {"symbol": symbol, "after": after, "limit": n}
+    )
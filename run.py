@@ -4,6 +4,7 @@
 Run this script from the project root directory.
 """
 
+import argparse
 import sys
 from pathlib import Path
 
@@ -11,26 +12,77 @@ from pathlib import Path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+from src.Timer import PhaseTimer
+
+startup = PhaseTimer("Startup")
+
 # Now we can import from src
-from src.Engine import Engine
-from src.Strategy import SniperStrategy
-from src.Portfolio import Portfolio
-from src.Alert import send_alert
-from src.Events import MarketEvent
+with startup.phase("imports"):
+    from src.Engine import Engine
+    from src.Strategy import SniperStrategy
+    from src.Portfolio import Portfolio
+    from src.Alert import send_alert
+    from src.Events import MarketEvent
+    from src.Profiler import CascadeProfiler, PROFILE_DIR
+    from src.Recorder import StreamRecorder, STREAM_RECORD_DIR
+    from src.Health import HealthServer, HEALTH_HOST, HEALTH_PORT
+    from src.Workers import SignalWorker, SignalConsumer
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the trading engine.")
+    parser.add_argument("--mode", choices=("engine", "signals", "execution"), default="engine",
+                        help="engine runs everything in one process, signals and execution split it into two workers joined by the signal outbox")
+    parser.add_argument("--profile", choices=CascadeProfiler.MODES, help="Profile cascades and stream callbacks from startup")
+    parser.add_argument("--profile-cascades", type=int, help="Only profile this many cascades (default: all)")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR)
+    parser.add_argument("--profile-keep", type=int, default=50, help="Number of profiled cascades to keep on disk")
+    parser.add_argument("--profile-signal-cascades", type=int, default=5, help="Cascades profiled after a SIGUSR1")
+    parser.add_argument("--record", action="store_true", help="Record raw trade updates for offline replay (python -m src.Replay)")
+    parser.add_argument("--record-dir", default=STREAM_RECORD_DIR)
+    parser.add_argument("--health-host", default=HEALTH_HOST)
+    parser.add_argument("--health-port", type=int, default=HEALTH_PORT, help="Status endpoint port, 0 disables it")
+    return parser.parse_args()
 
 def main():
     """Run the trading engine."""
-    send_alert("Starting Trading Engine...")
+    args = parse_args()
+
+    if args.mode == "signals":
+        send_alert("Starting signal worker...")
+        SignalWorker(SniperStrategy()).run()
+        return
+
+    send_alert("Starting Trading Engine..." if args.mode == "engine" else "Starting execution worker...")
+
+    # Idle unless --profile is given, SIGUSR1 turns it on for the next few cascades
+    profiler = CascadeProfiler(directory=args.profile_dir, mode=args.profile or "sampling", keep=args.profile_keep)
+    profiler.install_signal_handler(cascades=args.profile_signal_cascades)
+    if args.profile:
+        profiler.enable(args.profile_cascades)
+
+    with startup.phase("engine init"):
+        engine = Engine(profiler=profiler, recorder=StreamRecorder(args.record_dir) if args.record else None)
+
+    with startup.phase("warm state"):
+        # The execution worker has no strategy, its signals come from the outbox
+        if args.mode == "engine":
+            engine.set_strategy(SniperStrategy())
 
-    engine = Engine()
+        # One portfolio per configured account, all fed by the same strategy
+        for account in engine.accounts.values():
+            engine.set_portfolio(Portfolio(account=account.name, max_positions=account.config.max_positions, allocation=account.config.allocation))
 
-    strategy = SniperStrategy()
-    portfolio = Portfolio()
+    if args.mode == "execution":
+        SignalConsumer(engine).start()
 
-    engine.set_strategy(strategy)
-    engine.set_portfolio(portfolio)
+    if args.health_port:
+        try:
+            HealthServer(engine, host=args.health_host, port=args.health_port).start()
+        except OSError as e:
+            send_alert(f"Health endpoint could not start: {str(e)}")
 
-    engine.run()
+    # Database reconciliation continues in the background once the stream is starting
+    engine.run(startup=startup)
 
 
 if __name__ == "__main__":
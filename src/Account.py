@@ -0,0 +1,67 @@
+import os
+import re
+
+from alpaca.trading.stream import TradingStream
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from src.BrokerClient import BrokerClient
+from src.ExecutionHandler import ExecutionHandler
+from src.OrderManager import OrderManager
+from src.Types import *
+
+load_dotenv()
+
+class AccountConfig(BaseModel):
+    name: str
+    api_key: str | None = None
+    secret: str | None = None
+    paper: bool = True
+    max_positions: int = 5
+    allocation: float = 1.0 # Fraction of the account's cash the portfolio sizes entries from
+
+def _account_setting(name: str, key: str, default=None):
+    # ALPACA_<NAME>_<KEY>, the default account also reads the unprefixed ALPACA_<KEY>
+    value = os.getenv(f"ALPACA_{re.sub(r'[^A-Za-z0-9]', '_', name).upper()}_{key}")
+    if value is None and name == DEFAULT_ACCOUNT:
+        value = os.getenv(f"ALPACA_{key}")
+    return value if value is not None else default
+
+def load_account_configs() -> list[AccountConfig]:
+    """
+    Accounts hosted by the engine, from ACCOUNTS (comma separated, default "default").
+    Each account is configured with ALPACA_<NAME>_API_KEY, ALPACA_<NAME>_SECRET,
+    ALPACA_<NAME>_PAPER, ALPACA_<NAME>_MAX_POSITIONS and ALPACA_<NAME>_ALLOCATION.
+    """
+    names = [name.strip() for name in os.getenv("ACCOUNTS", DEFAULT_ACCOUNT).split(",") if name.strip()]
+    return [
+        AccountConfig(name=name,
+                      api_key=_account_setting(name, "API_KEY"),
+                      secret=_account_setting(name, "SECRET"),
+                      paper=str(_account_setting(name, "PAPER", "true")).lower() != "false",
+                      max_positions=int(_account_setting(name, "MAX_POSITIONS", 5)),
+                      allocation=float(_account_setting(name, "ALLOCATION", 1.0)))
+        for name in dict.fromkeys(names)
+    ]
+
+class Account(object):
+    """
+    Everything tied to one set of broker credentials: the REST client, the trade update
+    stream, the order book and execution, and the portfolio trading the account.
+    """
+    def __init__(self, config: AccountConfig, dry_run: bool = False):
+        self.config = config
+        self.name = config.name
+
+        # A dry run never reaches the broker, so it does not need real keys
+        api_key = config.api_key or ("dry-run" if dry_run else None)
+        secret = config.secret or ("dry-run" if dry_run else None)
+        self.trading_client: BrokerClient = BrokerClient(api_key, secret, paper=config.paper)
+        self.trading_stream: TradingStream = TradingStream(api_key, secret, paper=config.paper)
+
+        self.order_manager: OrderManager = OrderManager()
+        self.execution_handler: ExecutionHandler = ExecutionHandler(self.trading_client, self.order_manager, dry_run=dry_run)
+
+        # Attached by Engine.set_portfolio
+        self.portfolio = None
+        self.reconciler = None
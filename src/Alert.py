@@ -1,17 +1,39 @@
 import requests
 from dotenv import load_dotenv
 import os
+import queue
+import threading
 
 load_dotenv()
 
 ALERT_URL = os.getenv("ALERT_URL")
 ALERT_PORT = os.getenv("ALERT_PORT")
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "true").lower() != "false"
 
-def send_alert(message):
+# Alerts are posted from a background thread so the trading path never waits on the notifier
+_alert_queue: queue.Queue = queue.Queue()
+
+def _post_alert(message):
     url = f"{ALERT_URL}:{ALERT_PORT}/notify"
     payload = {"message": message}
 
     try:
         requests.post(url, json=payload, timeout=2)
     except Exception as e:
-        print(f"Failed to send alert: {e}")
\ No newline at end of file
+        print(f"Failed to send alert: {e}")
+
+def _alert_worker():
+    while True:
+        _post_alert(_alert_queue.get())
+
+threading.Thread(target=_alert_worker, name="alerts", daemon=True).start()
+
+def set_alerts_enabled(enabled: bool):
+    # Replays and other offline runs keep the notifier quiet
+    global ALERTS_ENABLED
+    ALERTS_ENABLED = enabled
+
+def send_alert(message):
+    if not ALERTS_ENABLED:
+        return
+    _alert_queue.put(message)
\ No newline at end of file
@@ -0,0 +1,203 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from alpaca.common.exceptions import APIError
+from alpaca.trading.client import TradingClient
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+# Alpaca allows 200 requests per minute per account
+DEFAULT_RATE_PER_MINUTE = 200
+DEFAULT_BURST = 10
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+class TokenBucket(object):
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate # Tokens added per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        # Block until a token is available, returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class EndpointStats(BaseModel):
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0 # 429 responses
+    retries: int = 0
+    coalesced: int = 0 # Callers served by another caller's in-flight request
+    total_seconds: float = 0
+    max_seconds: float = 0
+
+    def record(self, seconds: float):
+        self.requests += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def mean_ms(self) -> float:
+        return self.total_seconds / self.requests * 1000 if self.requests else 0
+
+class BrokerClient(TradingClient):
+    """
+    TradingClient with a shared keep-alive connection pool, a token bucket across every
+    caller, coalescing of identical concurrent GETs and retries with jittered backoff.
+
+    All TradingClient methods go through _request, so callers use it exactly like the
+    client it wraps. Latency, retry and 429 counts are kept per endpoint (method + path
+    with order IDs collapsed).
+    """
+    def __init__(self, api_key: str, secret_key: str, paper: bool = True,
+                 rate_per_minute: float = DEFAULT_RATE_PER_MINUTE, burst: int = DEFAULT_BURST,
+                 pool_size: int = 10, max_retries: int = 3, backoff_seconds: float = 0.25):
+        super().__init__(api_key, secret_key, paper=paper)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self.endpoint_stats: dict[str, EndpointStats] = {}
+        self._stats_lock = threading.Lock()
+        self._in_flight: dict[tuple, Future] = {}
+        self._in_flight_lock = threading.Lock()
+
+    def _request(self, method, path, data=None, base_url=None, api_version=None):
+        method = method.upper()
+        endpoint = f"{method} {UUID_PATTERN.sub('{id}', path)}"
+
+        if method != "GET":
+            return self._send(method, path, data, base_url, api_version, endpoint)
+
+        # Identical reads already on the wire are shared instead of sent again
+        key = (path, repr(sorted(data.items())) if isinstance(data, dict) else data, base_url, api_version)
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            stats = self._stats(endpoint)
+            with self._stats_lock:
+                stats.coalesced += 1
+            return future.result()
+
+        try:
+            result = self._send(method, path, data, base_url, api_version, endpoint)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+
+    def _send(self, method, path, data, base_url, api_version, endpoint):
+        url = (base_url or self._base_url) + "/" + (api_version or self._api_version) + path
+        opts = {"headers": self._get_default_headers(), "allow_redirects": False}
+        if method in ("GET", "DELETE"):
+            opts["params"] = data
+        else:
+            opts["json"] = data
+
+        stats = self._stats(endpoint)
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = self._session.request(method, url, **opts)
+            except (ConnectionError, Timeout):
+                # A submission that never got a response may still have reached the broker
+                with self._stats_lock:
+                    stats.record(time.perf_counter() - started)
+                    stats.errors += 1
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                with self._stats_lock:
+                    stats.retries += 1
+                self._backoff(attempt)
+                continue
+
+            with self._stats_lock:
+                stats.record(time.perf_counter() - started)
+                if response.status_code == 429:
+                    stats.rate_limited += 1
+                if response.status_code >= 400:
+                    stats.errors += 1
+
+            try:
+                response.raise_for_status()
+            except HTTPError as http_error:
+                # A 429 is rejected before it is processed, so even an order submission is safe to resend
+                retryable = response.status_code == 429 or (response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS)
+                if retryable and attempt < self.max_retries:
+                    attempt += 1
+                    with self._stats_lock:
+                        stats.retries += 1
+                    self._backoff(attempt, response.headers.get("Retry-After"))
+                    continue
+                raise APIError(response.text, http_error)
+
+            if response.text != "":
+                return response.json()
+            return None
+
+    def _backoff(self, attempt: int, retry_after: str = None):
+        # Full jitter on an exponential base, never sooner than the server asked for
+        delay = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def _stats(self, endpoint: str) -> EndpointStats:
+        with self._stats_lock:
+            return self.endpoint_stats.setdefault(endpoint, EndpointStats())
+
+    def stats(self) -> dict[str, EndpointStats]:
+        with self._stats_lock:
+            return {endpoint: stats.model_copy() for endpoint, stats in self.endpoint_stats.items()}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.endpoint_stats = {}
+
+    def report(self) -> str:
+        lines = ["Broker API usage"]
+        for endpoint, stats in sorted(self.stats().items(), key=lambda item: -item[1].requests):
+            lines.append(
+                f"  {endpoint}: {stats.requests} requests, {stats.mean_ms():.1f} ms mean, {stats.max_seconds * 1000:.1f} ms max, "
+                f"{stats.rate_limited} rate limited, {stats.retries} retries, {stats.coalesced} coalesced"
+            )
+        return "\n".join(lines)
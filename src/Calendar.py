@@ -0,0 +1,142 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+
+from alpaca.trading.requests import GetCalendarRequest
+from pydantic import BaseModel
+from pytz import timezone as market_timezone
+
+from src.BrokerClient import BrokerClient
+
+MARKET_TZ = market_timezone("America/New_York")
+
+CALENDAR_PATH = os.getenv("CALENDAR_PATH", "state/calendar.json")
+
+# The broker calendar is fetched this often, covering this far ahead
+CALENDAR_REFRESH = timedelta(days=30)
+CALENDAR_LOOKAHEAD = timedelta(days=120)
+CALENDAR_RETRY = timedelta(hours=1) # After a failed fetch
+
+REGULAR_OPEN = time(9, 30)
+REGULAR_CLOSE = time(16, 0)
+
+class TradingSession(BaseModel):
+    date: date
+    open: datetime # Market timezone
+    close: datetime
+
+    @property
+    def early_close(self) -> bool:
+        return self.close.time() < REGULAR_CLOSE
+
+class CalendarSnapshot(BaseModel):
+    fetched_at: datetime
+    start: date
+    end: date
+    sessions: dict[date, TradingSession] = {}
+
+def _regular_session(day: date) -> TradingSession | None:
+    # Used when the broker calendar is unavailable: every weekday is a full session
+    if day.weekday() >= 5:
+        return None
+    return TradingSession(date=day,
+                          open=MARKET_TZ.localize(datetime.combine(day, REGULAR_OPEN)),
+                          close=MARKET_TZ.localize(datetime.combine(day, REGULAR_CLOSE)))
+
+class TradingCalendar(object):
+    """
+    Exchange sessions (holidays and early closes included) from the broker calendar.
+
+    The calendar is fetched once a month and kept on disk, so a restart does not need the
+    broker to know whether the market opens today. Without a client (e.g. the signal worker)
+    only the file is read, again whenever another process rewrites it. Days outside the cached
+    range fall back to regular weekday sessions.
+    """
+    def __init__(self, trading_client: BrokerClient = None, path: str = CALENDAR_PATH):
+        self.trading_client = trading_client
+        self.path = Path(path)
+        self.snapshot: CalendarSnapshot = None
+        self.loaded_mtime: float = None # Of the file the snapshot was read from or written to
+        self.failed_at: datetime = None
+
+    def load(self) -> CalendarSnapshot | None:
+        # Reads the cache when it changed on disk (e.g. refreshed by the engine), then refreshes it from the broker when due
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime is not None and mtime != self.loaded_mtime:
+            try:
+                self.snapshot = CalendarSnapshot.model_validate_json(self.path.read_bytes())
+            except Exception as e:
+                print(f"Failed to load trading calendar: {e}")
+            self.loaded_mtime = mtime
+
+        retry_due = self.failed_at is None or datetime.now(timezone.utc) - self.failed_at > CALENDAR_RETRY
+        if self.trading_client is not None and retry_due and self._stale():
+            self.refresh()
+        return self.snapshot
+
+    def _stale(self) -> bool:
+        if self.snapshot is None:
+            return True
+        return (datetime.now(timezone.utc) - self.snapshot.fetched_at > CALENDAR_REFRESH
+                or self.snapshot.end < self.today() + CALENDAR_LOOKAHEAD / 2)
+
+    def refresh(self) -> bool:
+        start = self.today() - timedelta(days=7)
+        end = self.today() + CALENDAR_LOOKAHEAD
+        try:
+            days = self.trading_client.get_calendar(GetCalendarRequest(start=start, end=end))
+        except Exception as e:
+            print(f"Failed to fetch trading calendar, using {'cached' if self.snapshot else 'regular weekday'} sessions: {e}")
+            self.failed_at = datetime.now(timezone.utc)
+            return False
+
+        sessions = {
+            day.date: TradingSession(date=day.date, open=MARKET_TZ.localize(day.open), close=MARKET_TZ.localize(day.close))
+            for day in days
+        }
+        self.snapshot = CalendarSnapshot(fetched_at=datetime.now(timezone.utc), start=start, end=end, sessions=sessions)
+        self.failed_at = None
+
+        # Write then rename so a crash never leaves a half-written calendar behind
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(self.snapshot.model_dump_json())
+        os.replace(tmp_path, self.path)
+        self.loaded_mtime = self.path.stat().st_mtime
+        return True
+
+    def today(self) -> date:
+        return datetime.now(MARKET_TZ).date()
+
+    def session(self, day: date = None) -> TradingSession | None:
+        """The session on a day (today by default), None when the market is closed."""
+        day = day if day is not None else self.today()
+        snapshot = self.load()
+        if snapshot is None or not snapshot.start <= day <= snapshot.end:
+            return _regular_session(day)
+        return snapshot.sessions.get(day)
+
+    def is_trading_day(self, day: date = None) -> bool:
+        return self.session(day) is not None
+
+    def in_session(self, now: datetime = None, grace: timedelta = timedelta(0)) -> bool:
+        """Whether the market is open, or closed less than grace ago."""
+        now = now if now is not None else datetime.now(MARKET_TZ)
+        session = self.session(now.astimezone(MARKET_TZ).date())
+        return session is not None and session.open <= now <= session.close + grace
+
+    def next_session(self, after: date = None) -> TradingSession | None:
+        day = after if after is not None else self.today()
+        for offset in range(1, 15):
+            session = self.session(day + timedelta(days=offset))
+            if session is not None:
+                return session
+        return None
+
+    def week_start(self, day: date = None) -> date:
+        """Monday of the market week, the key universe snapshots are stored under."""
+        day = day if day is not None else self.today()
+        return day - timedelta(days=day.weekday())
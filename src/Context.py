@@ -1,9 +1,11 @@
 from datetime import datetime, timezone, timedelta, date
 
-from alpaca.trading.client import TradingClient
-
+from src.BrokerClient import BrokerClient
+from src.Calendar import TradingCalendar
 from src.Events import *
 from src.Types import Position
+from src.WarmState import WarmState
+from src.OrderManager import OrderManager
 
 
 
@@ -12,9 +14,13 @@ class EventSink(object):
         pass
 
 class Context(object):
-    def __init__(self, event_sink: EventSink, trading_client: TradingClient):
+    def __init__(self, event_sink: EventSink, trading_client: BrokerClient, warm_state: WarmState = None, order_manager: OrderManager = None,
+                 calendar: TradingCalendar = None):
         self.event_sink = event_sink
         self.trading_client = trading_client
+        self.calendar = calendar if calendar is not None else TradingCalendar(trading_client)
+        self.warm_state = warm_state if warm_state is not None else WarmState()
+        self.order_manager = order_manager if order_manager is not None else OrderManager()
 
     def current_time(self) -> datetime:
         """
@@ -23,12 +29,11 @@ class Context(object):
         """
         return datetime.now(timezone.utc)
 
-    def get_start_of_week(self) -> datetime:
+    def get_start_of_week(self) -> date:
         """
-        Returns the start of the current week (Monday at 00:00:00) in UTC.
+        Returns the start of the current market week (Monday), by the exchange's date rather than the host's.
         """
-        start_of_week = date.today() - timedelta(days=date.today().weekday())
-        return start_of_week
+        return self.calendar.week_start()
 
     def get_cash(self)->float:
         account = self.trading_client.get_account()
@@ -1,74 +1,401 @@
 from dotenv import load_dotenv
+import asyncio
 import os
+import threading
+import time
+from datetime import datetime, timedelta
 
 from src.Alert import send_alert
 
-from alpaca.trading.client import TradingClient
-from alpaca.trading.stream import TradingStream
-
 from apscheduler.schedulers.background import BackgroundScheduler
 from pytz import timezone
 
 from src.Strategy import Strategy
 from src.Portfolio import Portfolio
-from src.ExecutionHandler import ExecutionHandler
+from src.Account import Account, AccountConfig, load_account_configs
+from src.Calendar import TradingCalendar
+from src.Reconciler import Reconciler
 from src.Context import Context, EventSink
-from db import create_fill, create_order
+from src.Journal import EventJournal
+from src.WarmState import WarmState, WarmStateStore
+from src.Lazy import load_lazy_modules
+from src.Timer import PhaseTimer
+from src.Profiler import CascadeProfiler
+from src.Recorder import StreamRecorder
+from db.statements import invalidate_price_tables
+from db import create_fill, create_order, get_write_spool, update_bar_cache, ensure_tables, ensure_columns, ensure_change_triggers, subscribe_table_changes, ensure_indexes, ensure_upcoming_partitions, check_query_plans
 from src.Events import *
 from src.Types import *
 
 load_dotenv()
 
-ALPACA_API_KEY = os.getenv("ALPACA_API_KEY")
-ALPACA_SECRET = os.getenv("ALPACA_SECRET")
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journal")
+WARM_STATE_PATH = os.getenv("WARM_STATE_PATH", "state/warm_state.json")
+WARM_STATE_SAVE_INTERVAL = int(os.getenv("WARM_STATE_SAVE_INTERVAL", "5")) # Seconds, cascades only mark the snapshot dirty
+
+# Session jobs, relative to the day's open and close from the trading calendar
+PRE_OPEN_LEAD = timedelta(minutes=15)
+CLOSE_REPORT_DELAY = timedelta(minutes=5)
+BAR_CACHE_DELAY = timedelta(hours=2)
+SESSION_GRACE = timedelta(minutes=15) # Intraday jobs keep running this long after the close
 
 class Engine(EventSink):
-    def __init__(self):
+    """
+    Runs one strategy for any number of broker accounts. The universe scan, bars and indicators
+    are computed once by the strategy, and its signals fan out to every account's portfolio.
+    """
+    def __init__(self, profiler: CascadeProfiler = None, recorder: StreamRecorder = None, dry_run: bool = False, accounts: list[AccountConfig] = None):
         self.strategy: Strategy = None
-        self.portfolio: Portfolio = None
 
         self.event_queue: list[Event] = []
+        # Cascades start on the stream loop, scheduler jobs and the signal consumer, and run one at a time
+        self.cascade_lock = threading.RLock()
+        self.cascade_started: float = None
+        self.last_cascade_seconds: float = None
+        self.last_cascade_at: float = None
+        self.cascade_count: int = 0
+        self.open_timer: PhaseTimer = None
+        self.journal: EventJournal = EventJournal(JOURNAL_DIR)
+        self.profiler: CascadeProfiler = profiler if profiler is not None else CascadeProfiler()
 
-        self.trading_client: TradingClient = TradingClient(ALPACA_API_KEY, ALPACA_SECRET, paper=True)
-        self.trading_stream: TradingStream = TradingStream(ALPACA_API_KEY, ALPACA_SECRET, paper=True)
+        self.warm_state_store = WarmStateStore(WARM_STATE_PATH)
+        self.warm_state: WarmState = self.warm_state_store.load() or WarmState()
+        self.warm_state_dirty = False
 
-        self.trading_stream.subscribe_trade_updates(self.handle_trading_stream_updates)
+        self.recorder: StreamRecorder = recorder
+        self.dry_run = dry_run
 
-        self.execution_handler: ExecutionHandler = ExecutionHandler(self.trading_client)
+        # The first account is the primary one, its client serves the strategy's context
+        self.accounts: dict[str, Account] = {}
+        for config in accounts if accounts is not None else load_account_configs():
+            account = Account(config, dry_run=dry_run)
+            account.trading_stream.subscribe_trade_updates(self._stream_handler(account.name))
+            self.accounts[account.name] = account
 
         self.scheduler = BackgroundScheduler()
         self.market_tz = timezone("America/New_York")
+        self.calendar = TradingCalendar(self.primary.trading_client)
+
+    @property
+    def primary(self) -> Account:
+        return next(iter(self.accounts.values()))
+
+    @property
+    def portfolio(self) -> Portfolio:
+        return self.primary.portfolio
+
+    @property
+    def portfolios(self) -> list[Portfolio]:
+        return [account.portfolio for account in self.accounts.values() if account.portfolio is not None]
+
+    @property
+    def trading_client(self):
+        return self.primary.trading_client
+
+    @property
+    def trading_stream(self):
+        return self.primary.trading_stream
+
+    def _stream_handler(self, account: str):
+        async def handler(data):
+            await self.handle_trading_stream_updates(data, account)
+        return handler
 
     def schedule_tasks(self):
+        # Jobs tied to the open and close are set each day from the trading calendar
+        self.scheduler.add_job(
+            self.schedule_session,
+            trigger="cron",
+            hour=0,
+            minute=5,
+            timezone=self.market_tz,
+            id="session_schedule"
+        )
+
+        # Bring the book in line with the broker throughout the session, off the minute the market opens
+        self.scheduler.add_job(
+            self.during_session(self.reconcile_positions),
+            trigger="cron",
+            day_of_week="mon-fri",
+            hour="9-16",
+            minute="5-55/10",
+            timezone=self.market_tz,
+            id="position_reconciliation"
+        )
+
+        # Order status changes are written to the database in batches
+        self.scheduler.add_job(
+            self.flush_orders,
+            trigger="interval",
+            seconds=5,
+            id="order_status_flush"
+        )
+
+        # The warm state snapshot is written at most once per interval, not after every cascade
+        self.scheduler.add_job(
+            self.flush_warm_state,
+            trigger="interval",
+            seconds=WARM_STATE_SAVE_INTERVAL,
+            id="warm_state_flush"
+        )
+
+        # Replacements whose cancel was never confirmed on the stream
+        self.scheduler.add_job(
+            self.check_replacements,
+            trigger="interval",
+            seconds=5,
+            id="replacement_check"
+        )
+
+        # Compact P&L rows for reporting, so nothing has to replay positions and fills
         self.scheduler.add_job(
-            self.generate_market_open_event,
+            self.during_session(self.snapshot_pnl),
             trigger="cron",
             day_of_week="mon-fri",
-            hour=9,
-            minute=30,
+            hour="9-16",
+            minute="*/15",
             timezone=self.market_tz,
-            id="market_open_event"
+            id="pnl_snapshot"
         )
 
         self.scheduler.start()
+        self.schedule_session()
+
+    def schedule_session(self):
+        # Nothing runs on market holidays, and close-relative jobs follow early closes
+        session = self.calendar.session()
+        if session is None:
+            following = self.calendar.next_session()
+            print(f"Market closed on {self.calendar.today()}, next session {following.date if following else 'unknown'}")
+            return
+
+        jobs = {
+            # Signals and exit plans are computed ahead of the bell, the open only refreshes cash and sends orders
+            "pre_open_event": (self.generate_pre_open_event, session.open - PRE_OPEN_LEAD),
+            "market_open_event": (self.generate_market_open_event, session.open),
+            "broker_usage_report": (self.report_broker_usage, session.close + CLOSE_REPORT_DELAY),
+            # Later restarts rebuild journal state from here instead of the first segment
+            "journal_checkpoint": (self.checkpoint_journal, session.close + CLOSE_REPORT_DELAY),
+            # Settled bars are appended to the on-disk cache once the day's bars are final
+            "bar_cache_update": (self.update_bar_cache, session.close + BAR_CACHE_DELAY),
+        }
+        now = datetime.now(self.market_tz)
+        for job_id, (job, run_at) in jobs.items():
+            if run_at > now:
+                self.scheduler.add_job(job, trigger="date", run_date=run_at, id=job_id, replace_existing=True)
+
+        if session.early_close:
+            send_alert(f"Early close on {session.date}: market closes at {session.close:%H:%M}")
+
+    def during_session(self, job):
+        # Intraday jobs skip holidays and the hours after an early close
+        def run():
+            if self.calendar.in_session(grace=SESSION_GRACE):
+                job()
+        run.__name__ = job.__name__
+        return run
+
+    def generate_pre_open_event(self):
+        timer = PhaseTimer("Pre-open")
+        event = MarketEvent()
+
+        try:
+            # Without a strategy (execution worker) signals arrive from the signal worker instead
+            if self.strategy is not None:
+                with timer.phase("signals"):
+                    self.strategy.prepare(event)
+            with timer.phase("exit plans"), self.cascade_lock:
+                for portfolio in self.portfolios:
+                    portfolio.prepare(event)
+        except Exception as e:
+            print(f"Error preparing market open: {str(e)}")
+            send_alert(f"Error preparing market open: {str(e)}")
+
+        send_alert(timer.report())
 
     def generate_market_open_event(self):
         event = MarketEvent()
 
-        self.handle_update(event)
+        self.open_timer = PhaseTimer("Market open")
+        try:
+            self.handle_update(event)
+        finally:
+            send_alert(self.open_timer.report())
+            self.open_timer = None
 
     def publish(self, event: Event):
         self.event_queue.append(event)
 
     def set_strategy(self, strategy: Strategy):
         self.strategy = strategy
-        self.strategy.set_context(Context(event_sink=self, trading_client=self.trading_client))
+        self.strategy.set_context(Context(event_sink=self, trading_client=self.primary.trading_client, warm_state=self.warm_state, order_manager=self.primary.order_manager,
+                                          calendar=self.calendar))
 
     def set_portfolio(self, portfolio: Portfolio):
-        self.portfolio = portfolio
-        self.portfolio.set_context(Context(event_sink=self, trading_client=self.trading_client))
-    async def handle_trading_stream_updates(self, data):
+        # Each portfolio trades the account it names, the warm state (universe, indicators) is shared
+        account = self.accounts[portfolio.account]
+        account.portfolio = portfolio
+        portfolio.set_context(Context(event_sink=self, trading_client=account.trading_client, warm_state=self.warm_state, order_manager=account.order_manager,
+                                      calendar=self.calendar))
+        portfolio.load_warm_state(self.warm_state)
+        account.reconciler = Reconciler(account.trading_client, portfolio, account.order_manager, lock=self.cascade_lock)
+
+    def warm_start(self, startup: PhaseTimer):
+        # Runs alongside the stream: the snapshot is already loaded, now catch up with the database.
+        # Each phase is guarded, one failing (e.g. the database during an outage) does not skip the rest
+
+        # Columns added since the tables were created are needed before positions are read
+        with startup.guard("schema columns"):
+            ensure_tables()
+            ensure_columns()
+            ensure_change_triggers()
+
+        # Writes spooled during an outage land before positions are read back
+        with startup.guard("write spool"):
+            get_write_spool().start()
+
+        with startup.guard("change notifications"):
+            self.watch_changes()
+
+        # Swapped in between cascades: a fill handled before the swap is already in the database view.
+        # While writes are still spooled that view is stale, and the snapshot is kept instead
+        for portfolio in self.portfolios:
+            with startup.guard(f"{portfolio.account} database positions"), self.cascade_lock:
+                if not get_write_spool().spooling:
+                    portfolio.load_open_positions()
+            with startup.guard(f"{portfolio.account} P&L"), self.cascade_lock:
+                portfolio.load_pnl()
+
+        # Recover state the database may not know about (e.g. fills written just before a crash)
+        for portfolio in self.portfolios:
+            with startup.guard(f"{portfolio.account} journal restore"):
+                state = self.journal.rebuild_state(account=portfolio.account)
+                with self.cascade_lock:
+                    portfolio.restore_state(state)
+
+        with startup.guard("broker reconciliation"):
+            self.reconcile_positions()
+
+        with startup.guard("schema"):
+            self.check_schema()
+
+        with startup.guard("bar cache"):
+            self.update_bar_cache()
+
+        with startup.guard("lazy imports"):
+            for name, seconds in load_lazy_modules().items():
+                startup.record(f"import {name}", seconds)
+
+        # Already imported by load_lazy_modules, compiles or loads the cached kernels
+        with startup.guard("indicator warmup"):
+            from src.Indicators import warmup
+            warmup()
+
+        with startup.guard("warm state save"):
+            self.save_warm_state()
+
+        for name, error in startup.errors.items():
+            send_alert(f"Warm start phase {name} failed: {error}")
+        send_alert(startup.report())
+
+    def watch_changes(self):
+        # Cached universe and exit plans are dropped as trading.universe and trading.positions change
+        subscribe_table_changes("trading.universe", self.on_universe_change)
+        if self.strategy is not None:
+            self.strategy.watch_universe()
+        for portfolio in self.portfolios:
+            portfolio.watch_positions()
+
+    def on_universe_change(self, change: dict | None):
+        # A rotated universe can point symbols at other price tables
+        invalidate_price_tables()
+        if change is not None:
+            self.warm_state.universe.pop(change["key"].get("symbol"), None)
+
+    def reconcile_positions(self):
+        for account in self.accounts.values():
+            if account.reconciler is None:
+                continue
+            try:
+                account.reconciler.run()
+            except Exception as e:
+                print(f"Error reconciling {account.name} positions with broker: {str(e)}")
+                send_alert(f"Error reconciling {account.name} positions with broker: {str(e)}")
+
+    def flush_orders(self):
+        for account in self.accounts.values():
+            account.order_manager.flush()
+
+    def check_replacements(self):
+        for account in self.accounts.values():
+            account.execution_handler.check_replacements()
+
+    def check_schema(self):
+        # Missing indexes are built concurrently, then the hot queries are checked for sequential scans
         try:
+            ensure_indexes()
+            ensure_upcoming_partitions()
+            warnings = check_query_plans()
+            if warnings:
+                send_alert("Query plan check found sequential scans:\n" + "\n".join(warnings))
+        except Exception as e:
+            print(f"Error checking database schema: {str(e)}")
+
+    def update_bar_cache(self):
+        try:
+            update_bar_cache(self.warm_state.universe)
+        except Exception as e:
+            print(f"Error updating bar cache: {str(e)}")
+
+    def checkpoint_journal(self):
+        try:
+            self.journal.checkpoint()
+        except Exception as e:
+            print(f"Error checkpointing event journal: {str(e)}")
+
+    def snapshot_pnl(self):
+        for portfolio in self.portfolios:
+            try:
+                portfolio.snapshot_pnl()
+            except Exception as e:
+                print(f"Error writing {portfolio.account} P&L snapshot: {str(e)}")
+
+    def report_broker_usage(self):
+        # Per-endpoint latency and rate limiting over the session, then start counting afresh
+        for account in self.accounts.values():
+            send_alert(f"{account.name}: {account.trading_client.report()}")
+            account.trading_client.reset_stats()
+
+    def flush_warm_state(self):
+        if self.warm_state_dirty:
+            self.save_warm_state()
+
+    def save_warm_state(self):
+        try:
+            # Taken between cascades, so the snapshot never holds half of one
+            with self.cascade_lock:
+                self.warm_state_dirty = False
+                for portfolio in self.portfolios:
+                    self.warm_state.set_positions(portfolio.account, portfolio.open_positions)
+                self.warm_state_store.save(self.warm_state)
+        except Exception as e:
+            print(f"Error saving warm state: {str(e)}")
+
+    async def handle_trading_stream_updates(self, data, account: str = DEFAULT_ACCOUNT):
+        if self.recorder is not None:
+            self.recorder.record(data, account)
+
+        with self.profiler.profile(f"stream_{data.event}"):
+            self.process_trade_update(data, account)
+
+    def process_trade_update(self, data, account: str = DEFAULT_ACCOUNT):
+        try:
+            if account not in self.accounts:
+                print(f"Ignoring trade update for unknown account {account}")
+                return
+            self.accounts[account].order_manager.on_trade_update(data)
+            self.accounts[account].execution_handler.on_trade_update(data)
+
             if data.event == "new":
                 create_order(order_id=data.order.id, symbol=data.order.symbol, quantity_ordered=float(data.order.qty), status="pending")
                 send_alert(f"New order event received from trading stream. \n {data.order.symbol} {data.order.qty} @ {data.order.limit_price if data.order.limit_price else 'MKT'}")
@@ -90,7 +417,11 @@ class Engine(EventSink):
                         quantity=float(data.qty),
                         side=normalized_side,
                         fill_price=float(data.price),
-                        commission=0.0 # Alpaca does not provide commission data
+                        commission=0.0, # Alpaca does not provide commission data
+                        order_id=str(data.order.id),
+                        order_quantity=float(data.order.qty) if data.order.qty is not None else None,
+                        final=data.event == "fill",
+                        account=account
                     )
                 )
 
@@ -99,31 +430,92 @@ class Engine(EventSink):
 
                 self.handle_update(event)
 
+            elif data.event in ("canceled", "expired", "done_for_day", "replaced") and float(data.order.filled_qty or 0) > 0:
+                # The order will not fill any further, release partial fills the portfolio is still aggregating
+                event = FillEvent(
+                    fill=Fill(
+                        symbol=data.order.symbol,
+                        quantity=0.0,
+                        side=Direction.LONG if data.order.side.upper() in ("BUY", "LONG") else Direction.SHORT,
+                        fill_price=0.0,
+                        commission=0.0,
+                        order_id=str(data.order.id),
+                        order_quantity=float(data.order.qty) if data.order.qty is not None else None,
+                        final=True,
+                        account=account
+                    )
+                )
+
+                self.handle_update(event)
+
         except Exception as e:
             print(f"Error processing trading stream update: {str(e)}")
             send_alert(f"Error processing trading stream update: {str(e)}")
 
     def handle_update(self, event: Event):
+        # The event queue and portfolios are shared by every thread that starts a cascade
+        with self.cascade_lock:
+            # Timed for the health endpoint, a cascade that never finishes is the engine stalling
+            self.cascade_started = time.perf_counter()
+            try:
+                with self.profiler.profile(f"cascade_{event.event_type.lower()}"):
+                    self.run_cascade(event)
+            finally:
+                for portfolio in self.portfolios:
+                    portfolio.end_cascade()
+                self.last_cascade_seconds = time.perf_counter() - self.cascade_started
+                self.last_cascade_at = time.time()
+                self.cascade_count += 1
+                self.cascade_started = None
+
+    def run_cascade(self, event: Event):
         # Push event to event queue
         self.event_queue.append(event)
 
         # Run until event queue is empty
         while self.event_queue:
             current_event = self.event_queue.pop(0)
+            self.journal.append(current_event)
+            started = time.perf_counter()
 
             if current_event.event_type == EventType.MARKET:
-                self.strategy.on_update(current_event)
-                self.portfolio.on_market_update(current_event)
+                if self.strategy is not None:
+                    self.strategy.on_update(current_event)
+                for portfolio in self.portfolios:
+                    portfolio.on_market_update(current_event)
             elif current_event.event_type == EventType.SIGNAL:
                 send_alert(f"{current_event.signal.strategy_id}: {current_event.signal.symbol} @ {current_event.signal.value}")
-                self.portfolio.on_signal(current_event.signal)
+                for portfolio in self.portfolios:
+                    portfolio.on_signal(current_event.signal)
             elif current_event.event_type == EventType.ORDER:
                 send_alert(f"New order submitted. \n {current_event.order.symbol} {current_event.order.quantity} @ {current_event.order.price if current_event.order.price else 'MKT'}")
-                self.execution_handler.execute_order(current_event.order)
+                self.accounts[current_event.order.account].execution_handler.execute_order(current_event.order)
             elif current_event.event_type == EventType.FILL:
-                send_alert(f"New fill received. \n {current_event.fill.symbol} {current_event.fill.quantity} @ {current_event.fill.fill_price}")
-                self.portfolio.on_fill(current_event.fill)
+                if current_event.fill.quantity > 0:
+                    send_alert(f"New fill received. \n {current_event.fill.symbol} {current_event.fill.quantity} @ {current_event.fill.fill_price}")
+                self.accounts[current_event.fill.account].portfolio.on_fill(current_event.fill)
+
+            if self.open_timer is not None:
+                self.open_timer.add(current_event.event_type, time.perf_counter() - started)
+                if current_event.event_type == EventType.ORDER and "time to first order" not in self.open_timer.phases:
+                    self.open_timer.record("time to first order", self.open_timer.elapsed())
 
-    def run(self):
+        self.journal.flush()
+        self.warm_state_dirty = True
+
+    def run(self, startup: PhaseTimer = None):
         self.schedule_tasks()
-        self.trading_stream.run()
\ No newline at end of file
+
+        startup = startup or PhaseTimer("Startup")
+        threading.Thread(target=self.warm_start, args=(startup,), daemon=True).start()
+
+        try:
+            asyncio.run(self.run_streams())
+        except KeyboardInterrupt:
+            print("keyboard interrupt, bye")
+        finally:
+            self.flush_warm_state()
+
+    async def run_streams(self):
+        # Every account's trade update stream shares one event loop
+        await asyncio.gather(*(account.trading_stream._run_forever() for account in self.accounts.values()))
\ No newline at end of file
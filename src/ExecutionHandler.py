@@ -1,13 +1,17 @@
+from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest, TakeProfitRequest, StopLossRequest
+from alpaca.trading.enums import OrderSide, TimeInForce, OrderClass
 
-from alpaca.trading.client import TradingClient
-from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest
-from alpaca.trading.enums import OrderSide, TimeInForce
+import threading
+import time
+import uuid
 
 from db import (
     create_order
 )
 
 from src.Alert import send_alert
+from src.BrokerClient import BrokerClient
+from src.OrderManager import OrderManager
 from src.Types import *
 
 POSITION_INTENT_MAP = {
@@ -17,22 +21,99 @@ POSITION_INTENT_MAP = {
     (Direction.SHORT, OrderIntent.CLOSE): "sell_to_close"
 }
 
+# Trade stream events and REST statuses after which an order holds no quantity at the broker
+FINISHED_ORDER_STATES = {"canceled", "expired", "rejected", "replaced", "done_for_day", "fill", "filled"}
+
+REPLACEMENT_TIMEOUT = 30 # Seconds to wait for a cancel's trade update before asking the broker
+
 class ExecutionHandler(object):
-    def __init__(self, trading_client: TradingClient):
+    def __init__(self, trading_client: BrokerClient, order_manager: OrderManager = None, dry_run: bool = False):
         self.trading_client = trading_client
+        self.order_manager = order_manager
+        self.dry_run = dry_run # Orders are logged and tracked under a local ID instead of being sent
+
+        # Replacements waiting for the order they replace to be canceled, by that order's ID
+        self.pending_replacements: dict[str, tuple[Order, float]] = {}
+        self._lock = threading.Lock()
+
+    def cancel_order(self, order_id: str) -> bool:
+        # Only requests the cancel, the trade stream reports when the broker has released the quantity
+        if self.dry_run:
+            return True
+        try:
+            self.trading_client.cancel_order_by_id(order_id)
+            return True
+        except Exception as e:
+            print(f"Error canceling order {order_id}: {str(e)}")
+            return False
 
     def execute_order(self, order: Order):
+        if order.replaces_order_id is not None and not self.dry_run:
+            # Submitting before the cancel lands would be rejected for the quantity the old order still holds
+            if not self.cancel_order(order.replaces_order_id):
+                send_alert(f"Could not cancel order {order.replaces_order_id} for {order.symbol}, not submitting its replacement")
+                return
+            with self._lock:
+                self.pending_replacements[order.replaces_order_id] = (order, time.monotonic())
+            return
+
+        self.submit_order(order)
+
+    def on_trade_update(self, data):
+        event = str(data.event.value if hasattr(data.event, "value") else data.event)
+        if event in FINISHED_ORDER_STATES:
+            self.release_replacement(str(data.order.id), event, float(data.order.filled_qty or 0))
+
+    def release_replacement(self, order_id: str, state: str, filled_quantity: float = 0):
+        # Submits the replacement of a finished order, less whatever the old order filled meanwhile
+        with self._lock:
+            pending = self.pending_replacements.pop(order_id, None)
+        if pending is None:
+            return
+
+        order, _ = pending
+        quantity = order.quantity - filled_quantity
+        if state in ("fill", "filled") or quantity <= 0:
+            send_alert(f"Order {order_id} for {order.symbol} filled before it was canceled, not submitting its replacement")
+            return
+        self.submit_order(order.model_copy(update={"quantity": quantity}))
+
+    def check_replacements(self):
+        # Cancels whose trade update never arrived (e.g. during a stream reconnect) are looked up directly
+        now = time.monotonic()
+        with self._lock:
+            overdue = [order_id for order_id, (_, requested) in self.pending_replacements.items() if now - requested > REPLACEMENT_TIMEOUT]
+
+        for order_id in overdue:
+            try:
+                broker_order = self.trading_client.get_order_by_id(order_id)
+            except Exception as e:
+                print(f"Error checking canceled order {order_id}: {str(e)}")
+                continue
+            status = str(broker_order.status.value if hasattr(broker_order.status, "value") else broker_order.status)
+            if status in FINISHED_ORDER_STATES:
+                self.release_replacement(order_id, status, float(broker_order.filled_qty or 0))
+
+    def submit_order(self, order: Order):
         # Execute order, and store active order in database (by alpaca ID)
         order_response = None
 
         try:
+            if self.dry_run:
+                order_id = f"dry-run-{uuid.uuid4()}"
+                print(f"Dry run order {order_id}: {order.order_intent} {order.direction} {order.symbol} {order.quantity} {order.order_type}")
+                if self.order_manager is not None:
+                    self.order_manager.track(order, order_id)
+                return
+
             if order.order_type == OrderType.MARKET:
                 market_order_data = MarketOrderRequest(
                     symbol=order.symbol,
                     qty=order.quantity,
                     side=OrderSide.BUY if order.direction == Direction.LONG else OrderSide.SELL,
                     time_in_force=TimeInForce.GTC,
-                    position_intent = POSITION_INTENT_MAP.get((order.direction, order.order_intent))
+                    position_intent = POSITION_INTENT_MAP.get((order.direction, order.order_intent)),
+                    client_order_id=order.client_order_id
                 )
 
                 order_response = self.trading_client.submit_order(
@@ -46,12 +127,47 @@ class ExecutionHandler(object):
                     side=OrderSide.BUY if order.direction == Direction.LONG else OrderSide.SELL,
                     time_in_force=TimeInForce.DAY, # Limit orders only valid for the day
                     limit_price=order.price,
-                    position_intent = POSITION_INTENT_MAP.get((order.direction, order.order_intent))
+                    position_intent = POSITION_INTENT_MAP.get((order.direction, order.order_intent)),
+                    client_order_id=order.client_order_id
                 )
 
                 order_response = self.trading_client.submit_order(
                     order_data=limit_order_data
                 )
 
+            elif order.order_type == OrderType.OCO:
+                oco_order_data = LimitOrderRequest(
+                    symbol=order.symbol,
+                    qty=order.quantity,
+                    side=OrderSide.BUY if order.direction == Direction.LONG else OrderSide.SELL,
+                    time_in_force=TimeInForce.GTC, # Exits stay working until one leg fills or the plan changes
+                    order_class=OrderClass.OCO,
+                    take_profit=TakeProfitRequest(limit_price=order.take_profit_price),
+                    stop_loss=StopLossRequest(stop_price=order.stop_loss_price),
+                    # Lets a restarted engine recognise the OCO as the position's exit
+                    position_intent = POSITION_INTENT_MAP.get((order.direction, order.order_intent))
+                )
+
+                order_response = self.trading_client.submit_order(
+                    order_data=oco_order_data
+                )
+
+            # Track the order right away instead of waiting for the stream's "new" event
+            if order_response is not None and self.order_manager is not None:
+                self.order_manager.track(order, str(order_response.id))
+
+        except Exception as e:
+            if order.client_order_id is not None and "client_order_id" in str(e):
+                # Already submitted (e.g. a signal delivered twice), track the existing order instead
+                self.track_existing(order)
+                return
+            send_alert(f"Order execution failed for {order.symbol}: {str(e)}")
+
+    def track_existing(self, order: Order):
+        try:
+            existing = self.trading_client.get_order_by_client_id(order.client_order_id)
+            print(f"Order {order.client_order_id} for {order.symbol} was already submitted as {existing.id}")
+            if self.order_manager is not None:
+                self.order_manager.sync_broker_order(existing)
         except Exception as e:
             send_alert(f"Order execution failed for {order.symbol}: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,54 @@
+from pydantic import BaseModel
+
+from src.Types import *
+
+class PendingFills(BaseModel):
+    quantity: float = 0 # Filled but not yet released
+    notional: float = 0
+    commission: float = 0
+    filled_quantity: float = 0 # Filled over the life of the order
+    next_threshold: int = 0
+
+class FillAggregator(object):
+    """
+    Accumulates partial fills per order and releases them as a single fill at the VWAP of
+    the accumulated quantity, either when the order completes or when its filled fraction
+    crosses one of the configured thresholds (e.g. (0.5, 1.0) releases at half and at full).
+    """
+    def __init__(self, thresholds: tuple[float, ...] = (1.0,)):
+        self.thresholds = sorted(thresholds)
+        self.pending: dict[str, PendingFills] = {}
+
+    def add(self, fill: Fill) -> Fill | None:
+        # Fills that cannot be tied to an order are passed through untouched
+        if fill.order_id is None:
+            return fill
+
+        pending = self.pending.setdefault(fill.order_id, PendingFills())
+        pending.quantity += fill.quantity
+        pending.notional += fill.quantity * fill.fill_price
+        pending.commission += fill.commission
+        pending.filled_quantity += fill.quantity
+
+        release = fill.final
+        if fill.order_quantity:
+            fraction = pending.filled_quantity / fill.order_quantity
+            while pending.next_threshold < len(self.thresholds) and fraction >= self.thresholds[pending.next_threshold]:
+                pending.next_threshold += 1
+                release = True
+
+        if fill.final:
+            self.pending.pop(fill.order_id)
+
+        if not release or pending.quantity <= 0:
+            return None
+
+        aggregated = fill.model_copy(update={
+            "quantity": pending.quantity,
+            "fill_price": pending.notional / pending.quantity,
+            "commission": pending.commission
+        })
+        pending.quantity = 0
+        pending.notional = 0
+        pending.commission = 0
+        return aggregated
\ No newline at end of file
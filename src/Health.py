@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from db import get_pool_status, get_spool_status
+
+HEALTH_HOST = os.getenv("HEALTH_HOST", "127.0.0.1")
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8080"))
+
+# Unhealthy past these, long enough not to trip on a single slow cascade at the open
+MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", "5"))
+MAX_CASCADE_SECONDS = float(os.getenv("HEALTH_MAX_CASCADE_SECONDS", "60"))
+
+class LoopLagMonitor(object):
+    """
+    Measures how late the trading stream's event loop runs a callback scheduled from another
+    thread. A blocked loop shows up as a growing lag on the pending probe, not just a late result.
+    """
+    def __init__(self, stream, interval: float = 1.0):
+        self.stream = stream
+        self.interval = interval
+        self.lag: float = None
+        self.max_lag: float = 0.0
+        self._pending: float = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _probe(self, scheduled: float):
+        self.lag = time.perf_counter() - scheduled
+        self.max_lag = max(self.max_lag, self.lag)
+        self._pending = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            loop = getattr(self.stream, "_loop", None)
+            if loop is None or loop.is_closed() or self._pending is not None:
+                continue
+            self._pending = time.perf_counter()
+            try:
+                loop.call_soon_threadsafe(self._probe, self._pending)
+            except RuntimeError:
+                # The loop closed between the check and the call
+                self._pending = None
+
+    def current_lag(self) -> float:
+        # A probe still waiting to run is at least as late as its age
+        pending = self._pending
+        if pending is not None:
+            return max(time.perf_counter() - pending, self.lag or 0.0)
+        return self.lag
+
+class HealthServer(object):
+    """
+    Local HTTP status endpoint for a running engine. GET /health returns a JSON report and
+    answers 503 when the engine looks stalled, so docker's healthcheck can restart it.
+    """
+    def __init__(self, engine, host: str = HEALTH_HOST, port: int = HEALTH_PORT):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.loop_monitor = LoopLagMonitor(engine.trading_stream)
+        self.started_at = time.time()
+        self._server: ThreadingHTTPServer = None
+
+    def start(self):
+        health = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/health"):
+                    self.send_error(404)
+                    return
+                try:
+                    status = health.status()
+                    code = 200 if status["healthy"] else 503
+                except Exception as e:
+                    status = {"healthy": False, "problems": [f"Error building health report: {str(e)}"]}
+                    code = 500
+                body = json.dumps(status, default=str).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # The healthcheck polls constantly, keep it out of the engine's output
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.loop_monitor.start()
+        print(f"Health endpoint listening on http://{self.host}:{self.port}/health")
+
+    def stop(self):
+        self.loop_monitor.stop()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stream_status(self) -> dict:
+        # Every account's stream runs on the same event loop
+        accounts = {
+            name: {
+                "running": bool(getattr(account.trading_stream, "_running", False)),
+                "connected": getattr(account.trading_stream, "_ws", None) is not None,
+            }
+            for name, account in self.engine.accounts.items()
+        }
+        return {
+            "running": all(account["running"] for account in accounts.values()),
+            "connected": all(account["connected"] for account in accounts.values()),
+            "accounts": accounts,
+            "loop_lag_seconds": self.loop_monitor.current_lag(),
+            "max_loop_lag_seconds": self.loop_monitor.max_lag,
+        }
+
+    def scheduler_status(self) -> dict:
+        scheduler = self.engine.scheduler
+        return {
+            "running": scheduler.running,
+            "jobs": {job.id: job.next_run_time for job in scheduler.get_jobs()},
+        }
+
+    def cascade_status(self) -> dict:
+        started = self.engine.cascade_started
+        return {
+            "event_queue_depth": len(self.engine.event_queue),
+            "running_seconds": time.perf_counter() - started if started is not None else None,
+            "last_duration_seconds": self.engine.last_cascade_seconds,
+            "last_finished_at": self.engine.last_cascade_at,
+            "count": self.engine.cascade_count,
+        }
+
+    def status(self) -> dict:
+        stream = self.stream_status()
+        scheduler = self.scheduler_status()
+        cascade = self.cascade_status()
+
+        try:
+            pools = get_pool_status()
+        except Exception as e:
+            pools = {"error": str(e)}
+
+        # Spooling keeps the engine trading, so it is reported but does not fail the check
+        try:
+            spool = get_spool_status()
+        except Exception as e:
+            spool = {"error": str(e)}
+
+        problems = []
+        if not stream["running"] or not stream["connected"]:
+            down = [name for name, account in stream["accounts"].items() if not account["running"] or not account["connected"]]
+            problems.append(f"Trading stream is not connected: {', '.join(down)}")
+        if stream["loop_lag_seconds"] is not None and stream["loop_lag_seconds"] > MAX_LOOP_LAG:
+            problems.append(f"Event loop lag {stream['loop_lag_seconds']:.1f}s")
+        if not scheduler["running"]:
+            problems.append("Scheduler is not running")
+        if cascade["running_seconds"] is not None and cascade["running_seconds"] > MAX_CASCADE_SECONDS:
+            problems.append(f"Cascade running for {cascade['running_seconds']:.0f}s")
+
+        # Give the stream time to connect before reporting it down
+        starting = time.time() - self.started_at < MAX_CASCADE_SECONDS
+        return {
+            "healthy": not problems or starting,
+            "problems": problems,
+            "time": datetime.now(timezone.utc),
+            "uptime_seconds": time.time() - self.started_at,
+            "dry_run": self.engine.dry_run,
+            "stream": stream,
+            "scheduler": scheduler,
+            "cascade": cascade,
+            "db_pools": pools,
+            "db_spool": spool,
+        }
@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+from numba import njit
+
+# Kernels take contiguous float64 arrays: 1-D for one symbol's bars, 2-D as (symbols x bars).
+# They reproduce pandas_ta_classic (RMA = ewm(alpha=1/length, adjust=True, min_periods=length),
+# first true range NaN). NaN bars are skipped rather than decayed over, which matches running
+# pandas_ta on the symbol's series with those bars absent.
+
+def as_array(values) -> np.ndarray:
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+@njit(cache=True)
+def rma(values, length):
+    out = np.full(values.shape[0], np.nan)
+    decay = 1.0 - 1.0 / length
+    weighted = np.nan
+    old_weight = 1.0
+    observations = 0
+    for i in range(values.shape[0]):
+        value = values[i]
+        if value != value:
+            continue
+        observations += 1
+        if weighted != weighted:
+            weighted = value
+            old_weight = 1.0
+        else:
+            old_weight *= decay
+            weighted = (old_weight * weighted + value) / (old_weight + 1.0)
+            old_weight += 1.0
+        if observations >= length:
+            out[i] = weighted
+    return out
+
+@njit(cache=True)
+def rsi(close, length):
+    gains = np.full(close.shape[0], np.nan)
+    losses = np.full(close.shape[0], np.nan)
+    previous = np.nan
+    for i in range(close.shape[0]):
+        value = close[i]
+        if value != value:
+            continue
+        if previous == previous:
+            change = value - previous
+            gains[i] = change if change > 0 else 0.0
+            losses[i] = -change if change < 0 else 0.0
+        previous = value
+
+    gain_average = rma(gains, length)
+    loss_average = rma(losses, length)
+    out = np.full(close.shape[0], np.nan)
+    for i in range(close.shape[0]):
+        total = gain_average[i] + loss_average[i]
+        if total > 0:
+            out[i] = 100.0 * gain_average[i] / total
+    return out
+
+@njit(cache=True)
+def true_range(high, low, close):
+    out = np.full(close.shape[0], np.nan)
+    previous = np.nan
+    for i in range(close.shape[0]):
+        if close[i] != close[i]:
+            continue
+        if previous == previous:
+            out[i] = max(high[i] - low[i], abs(high[i] - previous), abs(previous - low[i]))
+        previous = close[i]
+    return out
+
+@njit(cache=True)
+def atr(high, low, close, length):
+    return rma(true_range(high, low, close), length)
+
+@njit(cache=True)
+def rsi_2d(close, length):
+    out = np.empty(close.shape)
+    for j in range(close.shape[0]):
+        out[j] = rsi(close[j], length)
+    return out
+
+@njit(cache=True)
+def atr_2d(high, low, close, length):
+    out = np.empty(close.shape)
+    for j in range(close.shape[0]):
+        out[j] = atr(high[j], low[j], close[j], length)
+    return out
+
+def warmup() -> float:
+    # Compile (or load from the numba cache) every kernel before the first scan needs it
+    start = time.perf_counter()
+    values = np.linspace(1.0, 2.0, 8)
+    panel = np.vstack([values, values])
+    rsi(values, 2)
+    atr(values, values, values, 2)
+    rsi_2d(panel, 2)
+    atr_2d(panel, panel, panel, 2)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    # Time the kernels against pandas_ta: python -m src.Indicators (tests/test_indicators.py checks they match)
+    import pandas as pd
+    import pandas_ta_classic as ta
+
+    warmup()
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(size=500))
+
+    window = close[-30:].copy()
+    start = time.perf_counter()
+    for _ in range(10000):
+        rsi(window, 2)
+    print(f"rsi(2) on 30 bars: {(time.perf_counter() - start) / 10000 * 1e6:.1f} us")
+    start = time.perf_counter()
+    for _ in range(1000):
+        ta.rsi(pd.Series(window), length=2)
+    print(f"pandas_ta rsi(2) on 30 bars: {(time.perf_counter() - start) / 1000 * 1e6:.1f} us")
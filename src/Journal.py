@@ -0,0 +1,305 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+from pydantic import BaseModel
+
+from src.Events import *
+from src.Types import *
+
+# Record layout: magic | payload length | crc32 of payload | write time (ns since epoch) | payload
+RECORD_HEADER = struct.Struct("<HIIq")
+RECORD_MAGIC = 0xE7E7
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+SEGMENT_SUFFIX = ".journal"
+
+CHECKPOINT_FILE = "checkpoint.json"
+ALL_ACCOUNTS = "*" # Checkpoint key of the fold over every account
+# Segments folded into the checkpoint are kept this long for debugging replays
+JOURNAL_RETENTION = timedelta(days=int(os.getenv("JOURNAL_RETENTION_DAYS", "7")))
+
+EVENT_CLASSES = {
+    EventType.MARKET: MarketEvent,
+    EventType.SIGNAL: SignalEvent,
+    EventType.ORDER: OrderEvent,
+    EventType.FILL: FillEvent
+}
+
+class JournalState(BaseModel):
+    open_positions: dict[str, Position] = {}
+    pending_orders: dict[str, list[Order]] = {}
+
+class JournalCheckpoint(BaseModel):
+    # Every record before (segment, offset) is folded into states
+    segment: int = 0
+    offset: int = 0
+    taken_at: datetime = None
+    states: dict[str, JournalState] = {} # By account, ALL_ACCOUNTS for the unfiltered fold
+
+class EventJournal(object):
+    """
+    Append-only, memory-mapped log of every event handled by the engine.
+
+    The journal is split into fixed-size segments. Each record is checksummed so a
+    torn write at the tail of a segment (e.g. after a crash) is detected and dropped.
+    A checkpoint holds the state folded up to a point, so rebuilds only read what follows it.
+    """
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap: mmap.mmap = None
+        self._segment_index = 0
+        self._offset = 0
+
+        segments = self._segments()
+        self._open_segment(self._index_of(segments[-1]) if segments else 0)
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def _index_of(self, path: Path) -> int:
+        return int(path.stem)
+
+    def _segment_path(self, index: int) -> Path:
+        return self.directory / f"{index:08d}{SEGMENT_SUFFIX}"
+
+    def _open_segment(self, index: int):
+        path = self._segment_path(index)
+        self._file = open(path, "a+b")
+
+        # Preallocate the segment so the mapping never has to grow
+        self._file.seek(0, 2)
+        if self._file.tell() < self.segment_size:
+            self._file.truncate(self.segment_size)
+
+        self._mmap = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._segment_index = index
+        self._offset = 0
+
+        # Find the end of the valid records, anything after a bad record is overwritten
+        for offset, _, _ in self._scan(self._mmap):
+            self._offset = offset
+
+    def _rotate(self):
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+        self._open_segment(self._segment_index + 1)
+
+    def _scan(self, buffer, offset: int = 0) -> Iterator[tuple[int, int, bytes]]:
+        # Yields (end offset, write time ns, payload) for every valid record in the buffer after offset
+        limit = len(buffer)
+        while offset + RECORD_HEADER.size <= limit:
+            magic, length, checksum, written_ns = RECORD_HEADER.unpack_from(buffer, offset)
+            start = offset + RECORD_HEADER.size
+            if magic != RECORD_MAGIC or start + length > limit:
+                return
+
+            payload = bytes(buffer[start:start + length])
+            if zlib.crc32(payload) != checksum:
+                return
+
+            offset = start + length
+            yield offset, written_ns, payload
+
+    def append(self, event: Event):
+        payload = event.model_dump_json().encode()
+        record_size = RECORD_HEADER.size + len(payload)
+        if record_size > self.segment_size:
+            raise ValueError(f"Event of {record_size} bytes does not fit in a journal segment")
+
+        with self._lock:
+            if self._offset + record_size > self.segment_size:
+                self._rotate()
+
+            start = self._offset + RECORD_HEADER.size
+            self._mmap[start:start + len(payload)] = payload
+            RECORD_HEADER.pack_into(self._mmap, self._offset, RECORD_MAGIC, len(payload), zlib.crc32(payload), time.time_ns())
+            self._offset += record_size
+
+    def flush(self):
+        with self._lock:
+            self._mmap.flush()
+
+    def close(self):
+        with self._lock:
+            self._mmap.flush()
+            self._mmap.close()
+            self._file.close()
+
+    def records(self, start: datetime = None, end: datetime = None) -> Iterator[tuple[datetime, Event]]:
+        """
+        Iterates over journaled events in write order as (write time, event) pairs,
+        optionally restricted to the window [start, end).
+        """
+        start_ns = int(start.timestamp() * 1e9) if start else None
+        end_ns = int(end.timestamp() * 1e9) if end else None
+
+        for path in self._segments():
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for _, written_ns, payload in self._scan(buffer):
+                        if start_ns is not None and written_ns < start_ns:
+                            continue
+                        if end_ns is not None and written_ns >= end_ns:
+                            return
+
+                        data = json.loads(payload)
+                        event = EVENT_CLASSES[data["event_type"]].model_validate(data)
+                        yield datetime.fromtimestamp(written_ns / 1e9, tz=timezone.utc), event
+
+    def replay(self, handler: Callable[[Event], None], start: datetime = None, end: datetime = None, event_types: set[EventType] = None) -> int:
+        """
+        Re-drives journaled events through handler (e.g. a debugging Engine's handle_update).
+        Returns the number of events replayed.
+        """
+        count = 0
+        for _, event in self.records(start=start, end=end):
+            if event_types and event.event_type not in event_types:
+                continue
+            handler(event)
+            count += 1
+        return count
+
+    def _records_after(self, segment: int, offset: int) -> Iterator[tuple[int, int, datetime, Event]]:
+        # (segment, end offset, write time, event) for every record after a checkpoint position
+        for path in self._segments():
+            index = self._index_of(path)
+            if index < segment:
+                continue
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for end, written_ns, payload in self._scan(buffer, offset if index == segment else 0):
+                        data = json.loads(payload)
+                        event = EVENT_CLASSES[data["event_type"]].model_validate(data)
+                        yield index, end, datetime.fromtimestamp(written_ns / 1e9, tz=timezone.utc), event
+
+    def load_checkpoint(self) -> JournalCheckpoint:
+        try:
+            return JournalCheckpoint.model_validate_json((self.directory / CHECKPOINT_FILE).read_bytes())
+        except FileNotFoundError:
+            return JournalCheckpoint()
+        except Exception as e:
+            # Folding from the first segment still gives the right state, only slower
+            print(f"Failed to load journal checkpoint, rebuilding from the start: {e}")
+            return JournalCheckpoint()
+
+    def checkpoint(self, prune: bool = True) -> JournalCheckpoint:
+        """
+        Folds the records written since the last checkpoint into a new one. With prune, segments
+        wholly before it that are older than JOURNAL_RETENTION are deleted.
+        """
+        with self._lock:
+            self._mmap.flush()
+            segment, offset = self._segment_index, self._offset
+
+        checkpoint = self.load_checkpoint()
+        states = {key: state.model_copy(deep=True) for key, state in checkpoint.states.items()}
+        states.setdefault(ALL_ACCOUNTS, JournalState())
+
+        for index, end, written_at, event in self._records_after(checkpoint.segment, checkpoint.offset):
+            if (index, end) > (segment, offset):
+                break
+            if event.event_type == EventType.MARKET:
+                keys = list(states)
+            else:
+                account = event.order.account if event.event_type == EventType.ORDER else event.fill.account if event.event_type == EventType.FILL else None
+                keys = [ALL_ACCOUNTS] + ([account] if account is not None else [])
+            for key in keys:
+                self._fold(states.setdefault(key, JournalState()), written_at, event)
+
+        checkpoint = JournalCheckpoint(segment=segment, offset=offset, taken_at=datetime.now(timezone.utc), states=states)
+
+        # Write then rename so a crash never leaves a half-written checkpoint behind
+        path = self.directory / CHECKPOINT_FILE
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(checkpoint.model_dump_json())
+        os.replace(tmp_path, path)
+
+        if prune:
+            expired = time.time() - JOURNAL_RETENTION.total_seconds()
+            for path in self._segments():
+                if self._index_of(path) < segment and path.stat().st_mtime < expired:
+                    path.unlink()
+        return checkpoint
+
+    def rebuild_state(self, account: str = None) -> JournalState:
+        """
+        Rebuilds open positions and working orders by folding over the journal from the
+        last checkpoint, mirroring the position logic in Portfolio.on_fill. With an account,
+        only that account's orders and fills are folded in.
+        """
+        checkpoint = self.load_checkpoint()
+        state = checkpoint.states.get(account if account is not None else ALL_ACCOUNTS, JournalState()).model_copy(deep=True)
+
+        for _, _, written_at, event in self._records_after(checkpoint.segment, checkpoint.offset):
+            if account is not None:
+                if event.event_type == EventType.ORDER and event.order.account != account:
+                    continue
+                if event.event_type == EventType.FILL and event.fill.account != account:
+                    continue
+            self._fold(state, written_at, event)
+
+        return state
+
+    def _fold(self, state: JournalState, written_at: datetime, event: Event):
+        if event.event_type == EventType.MARKET:
+            # Limit orders are only valid for the day, so drop those from earlier sessions
+            for symbol, orders in list(state.pending_orders.items()):
+                orders = [order for order in orders if order.order_type != OrderType.LIMIT]
+                if orders:
+                    state.pending_orders[symbol] = orders
+                else:
+                    state.pending_orders.pop(symbol)
+
+        elif event.event_type == EventType.ORDER:
+            state.pending_orders.setdefault(event.order.symbol, []).append(event.order)
+
+        elif event.event_type == EventType.FILL:
+            fill = event.fill
+            position = state.open_positions.get(fill.symbol)
+
+            # Raw (possibly partial) fills are journaled, so fold them into quantity and VWAP
+            if fill.quantity <= 0:
+                # Marks the end of a partially filled order
+                intent = OrderIntent.CLOSE if position is not None and fill.side != position.side else OrderIntent.OPEN
+            elif position is None and fill.side == Direction.LONG:
+                state.open_positions[fill.symbol] = Position(symbol=fill.symbol,
+                                                             side=fill.side,
+                                                             quantity=fill.quantity,
+                                                             entry_price=fill.fill_price,
+                                                             entry_time=written_at)
+                intent = OrderIntent.OPEN
+            elif position is not None and fill.side == position.side:
+                quantity = position.quantity + fill.quantity
+                position.entry_price = (position.quantity * position.entry_price + fill.quantity * fill.fill_price) / quantity
+                position.quantity = quantity
+                intent = OrderIntent.OPEN
+            elif position is not None:
+                position.quantity -= fill.quantity
+                if position.quantity <= 0:
+                    state.open_positions.pop(fill.symbol)
+                intent = OrderIntent.CLOSE
+            else:
+                return
+
+            if not fill.final:
+                return
+
+            orders = [order for order in state.pending_orders.get(fill.symbol, []) if order.order_intent != intent]
+            if orders:
+                state.pending_orders[fill.symbol] = orders
+            else:
+                state.pending_orders.pop(fill.symbol, None)
@@ -0,0 +1,44 @@
+import importlib
+import threading
+import time
+import types
+
+_lazy_modules: list["LazyModule"] = []
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a heavy module that is only imported on first attribute access.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._module: types.ModuleType = None
+        self.load_seconds: float = None
+
+    def load(self) -> types.ModuleType:
+        with self._lock:
+            if self._module is None:
+                start = time.perf_counter()
+                self._module = importlib.import_module(self.__name__)
+                self.load_seconds = time.perf_counter() - start
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+def lazy_import(name: str) -> LazyModule:
+    module = LazyModule(name)
+    _lazy_modules.append(module)
+    return module
+
+def load_lazy_modules() -> dict[str, float]:
+    """
+    Imports every module registered through lazy_import, returning load time per module
+    (0 for modules that were already loaded).
+    """
+    timings = {}
+    for module in _lazy_modules:
+        already_loaded = module._module is not None
+        module.load()
+        timings[module.__name__] = 0.0 if already_loaded else module.load_seconds
+    return timings
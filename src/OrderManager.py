@@ -0,0 +1,214 @@
+import threading
+from datetime import datetime, timezone
+
+from db import update_order_statuses
+
+from src.Types import *
+
+# Trade stream events mapped onto the order lifecycle, events not listed leave the status unchanged
+TRADE_EVENT_STATUS = {
+    "pending_new": OrderStatus.pending,
+    "accepted": OrderStatus.pending,
+    "new": OrderStatus.pending,
+    "partial_fill": OrderStatus.partial,
+    "fill": OrderStatus.filled,
+    "canceled": OrderStatus.cancelled,
+    "expired": OrderStatus.cancelled,
+    "rejected": OrderStatus.cancelled,
+    "replaced": OrderStatus.cancelled,
+    "done_for_day": OrderStatus.cancelled
+}
+
+# Broker order statuses (as returned by get_orders) mapped onto the order lifecycle
+BROKER_ORDER_STATUS = {
+    "partially_filled": OrderStatus.partial,
+    "filled": OrderStatus.filled,
+    "canceled": OrderStatus.cancelled,
+    "expired": OrderStatus.cancelled,
+    "replaced": OrderStatus.cancelled,
+    "rejected": OrderStatus.cancelled,
+    "done_for_day": OrderStatus.cancelled
+}
+
+class OrderManager(object):
+    """
+    In-memory book of broker orders keyed by Alpaca order ID.
+
+    Tracks each order's status, cumulative filled quantity and average fill price from the
+    trade stream, indexes working orders by symbol, and writes status changes to the
+    database in batches.
+    """
+    def __init__(self, flush_batch_size: int = 50):
+        self.orders: dict[str, TrackedOrder] = {}
+        self.working_by_symbol: dict[str, dict[str, TrackedOrder]] = {}
+        self.flush_batch_size = flush_batch_size
+
+        self._dirty: set[str] = set()
+        self._lock = threading.RLock()
+
+    def track(self, order: Order, order_id: str) -> TrackedOrder:
+        # Register an order as soon as the broker accepts the submission
+        with self._lock:
+            tracked = self.orders.get(order_id)
+            if tracked is None:
+                tracked = TrackedOrder(order_id=order_id,
+                                       symbol=order.symbol,
+                                       quantity=order.quantity,
+                                       direction=order.direction,
+                                       order_type=order.order_type,
+                                       order_intent=order.order_intent,
+                                       price=order.price if order.price is not None else order.take_profit_price,
+                                       stop_price=order.stop_loss_price,
+                                       updated_at=datetime.now(timezone.utc))
+                self._store(tracked)
+            return tracked
+
+    def on_trade_update(self, data) -> TrackedOrder:
+        broker_order = data.order
+        order_id = str(broker_order.id)
+
+        with self._lock:
+            tracked = self.orders.get(order_id)
+            if tracked is None:
+                tracked = self._from_broker_order(broker_order)
+
+            status = TRADE_EVENT_STATUS.get(data.event, tracked.status)
+            filled_quantity = float(broker_order.filled_qty) if broker_order.filled_qty is not None else tracked.filled_quantity
+            average_fill_price = float(broker_order.filled_avg_price) if broker_order.filled_avg_price is not None else tracked.average_fill_price
+
+            changed = status != tracked.status or filled_quantity != tracked.filled_quantity
+            tracked = tracked.model_copy(update={
+                "status": status,
+                "filled_quantity": filled_quantity,
+                "average_fill_price": average_fill_price,
+                "updated_at": data.timestamp
+            })
+            self._store(tracked)
+
+            if changed:
+                self._dirty.add(order_id)
+            should_flush = len(self._dirty) >= self.flush_batch_size
+
+        if should_flush:
+            self.flush()
+        return tracked
+
+    def sync_broker_order(self, broker_order) -> bool:
+        # Apply an order snapshot from the REST API, returns True if anything changed
+        order_id = str(broker_order.id)
+        filled_quantity = float(broker_order.filled_qty) if broker_order.filled_qty is not None else 0
+
+        # Every status not in the map is a working state
+        status = str(broker_order.status.value if hasattr(broker_order.status, "value") else broker_order.status)
+        status = BROKER_ORDER_STATUS.get(status, OrderStatus.partial if filled_quantity > 0 else OrderStatus.pending)
+
+        with self._lock:
+            tracked = self.orders.get(order_id)
+            if tracked is None:
+                if status not in (OrderStatus.pending, OrderStatus.partial):
+                    return False
+                tracked = self._from_broker_order(broker_order)
+            elif tracked.status == status and tracked.filled_quantity == filled_quantity:
+                return False
+
+            tracked = tracked.model_copy(update={
+                "status": status,
+                "filled_quantity": filled_quantity,
+                "average_fill_price": float(broker_order.filled_avg_price) if broker_order.filled_avg_price is not None else tracked.average_fill_price,
+                "updated_at": broker_order.updated_at
+            })
+            self._store(tracked)
+            self._dirty.add(order_id)
+            return True
+
+    def all_working_orders(self) -> list[TrackedOrder]:
+        with self._lock:
+            return [order for orders in self.working_by_symbol.values() for order in orders.values()]
+
+    def _from_broker_order(self, broker_order) -> TrackedOrder:
+        side = str(broker_order.side.value if hasattr(broker_order.side, "value") else broker_order.side).upper()
+        order_type = str(broker_order.order_type.value if hasattr(broker_order.order_type, "value") else broker_order.order_type).upper()
+        intent = str(broker_order.position_intent.value if hasattr(broker_order.position_intent, "value") else broker_order.position_intent)
+        order_class = str(broker_order.order_class.value if hasattr(broker_order.order_class, "value") else broker_order.order_class)
+        if order_class == "oco":
+            order_type = OrderType.OCO.value
+
+        # OCO legs are nested under the take profit order when requested with nested=True
+        stop_price = broker_order.stop_price
+        for leg in broker_order.legs or []:
+            if leg.stop_price is not None:
+                stop_price = leg.stop_price
+
+        return TrackedOrder(order_id=str(broker_order.id),
+                            symbol=broker_order.symbol,
+                            quantity=float(broker_order.qty) if broker_order.qty is not None else 0,
+                            direction=Direction.LONG if side in ("BUY", "LONG") else Direction.SHORT,
+                            order_type=OrderType(order_type) if order_type in OrderType.__members__ else None,
+                            # OCO orders are only ever exits, also when submitted without a position intent
+                            order_intent=OrderIntent.OPEN if intent.endswith("open") else OrderIntent.CLOSE if intent.endswith("close") or order_class == "oco" else None,
+                            price=float(broker_order.limit_price) if broker_order.limit_price is not None else None,
+                            stop_price=float(stop_price) if stop_price is not None else None)
+
+    def _store(self, tracked: TrackedOrder):
+        self.orders[tracked.order_id] = tracked
+
+        working = self.working_by_symbol.setdefault(tracked.symbol, {})
+        if tracked.is_working():
+            working[tracked.order_id] = tracked
+        else:
+            working.pop(tracked.order_id, None)
+            if not working:
+                self.working_by_symbol.pop(tracked.symbol, None)
+
+    def get(self, order_id: str) -> TrackedOrder | None:
+        return self.orders.get(str(order_id))
+
+    def working_orders(self, symbol: str, order_intent: OrderIntent = None) -> list[TrackedOrder]:
+        with self._lock:
+            orders = list(self.working_by_symbol.get(symbol, {}).values())
+        if order_intent is not None:
+            orders = [order for order in orders if order.order_intent == order_intent]
+        return orders
+
+    def has_working_order(self, symbol: str, order_intent: OrderIntent = None) -> bool:
+        return len(self.working_orders(symbol, order_intent)) > 0
+
+    def flush(self) -> int:
+        # Write all pending status changes in one batch, keeping them queued if the write fails
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty = self._dirty
+            self._dirty = set()
+            updates = [
+                {
+                    "order_id": order_id,
+                    "status": self.orders[order_id].status.value,
+                    "quantity_filled": self.orders[order_id].filled_quantity
+                }
+                for order_id in dirty
+            ]
+
+        try:
+            written = update_order_statuses(updates)
+        except Exception:
+            # Something in the batch can never be written, find it so it does not block the rest
+            return self._flush_each(updates)
+        if not written:
+            with self._lock:
+                self._dirty |= dirty
+            return 0
+        return len(updates)
+
+    def _flush_each(self, updates: list[dict]) -> int:
+        written = 0
+        for update in updates:
+            try:
+                if update_order_statuses([update]):
+                    written += 1
+                else:
+                    with self._lock:
+                        self._dirty.add(update["order_id"])
+            except Exception as e:
+                print(f"Dropping status update for order {update['order_id']}: {e}")
+        return written
\ No newline at end of file
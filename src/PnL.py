@@ -0,0 +1,164 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.Types import *
+
+UNATTRIBUTED = "unattributed"
+
+class StrategyPnL(BaseModel):
+    realized: float = 0
+    unrealized: float = 0
+    gross_exposure: float = 0
+    open_positions: int = 0
+
+class PnLSnapshot(BaseModel):
+    taken_at: datetime
+    realized: float = 0
+    unrealized: float = 0
+    commission: float = 0
+    long_exposure: float = 0
+    short_exposure: float = 0
+    gross_exposure: float = 0
+    net_exposure: float = 0
+    open_positions: int = 0
+    by_strategy: dict[str, StrategyPnL] = {}
+
+class PnLTracker(object):
+    """
+    Mark-to-market P&L and exposure, updated incrementally on every fill and price.
+
+    Each symbol owns a slot in parallel arrays (signed quantity, average price, last price,
+    strategy index), so a snapshot is a handful of vector operations however many symbols
+    have been traded. Realized P&L is accumulated per strategy as positions are reduced.
+    """
+    def __init__(self, capacity: int = 64):
+        self.slots: dict[str, int] = {}
+        self.strategies: list[str] = []
+        self.strategy_slots: dict[str, int] = {}
+
+        self.quantity = np.zeros(capacity) # Signed, long positive
+        self.average_price = np.zeros(capacity)
+        self.last_price = np.full(capacity, np.nan)
+        self.strategy = np.zeros(capacity, dtype=np.int64)
+
+        self.realized: dict[str, float] = {}
+        self.commission = 0.0
+
+    def _strategy_index(self, strategy: str | None) -> int:
+        strategy = strategy or UNATTRIBUTED
+        index = self.strategy_slots.get(strategy)
+        if index is None:
+            index = self.strategy_slots[strategy] = len(self.strategies)
+            self.strategies.append(strategy)
+        return index
+
+    def _slot(self, symbol: str) -> int:
+        slot = self.slots.get(symbol)
+        if slot is None:
+            slot = self.slots[symbol] = len(self.slots)
+            if slot >= len(self.quantity):
+                grow = len(self.quantity)
+                self.quantity = np.concatenate([self.quantity, np.zeros(grow)])
+                self.average_price = np.concatenate([self.average_price, np.zeros(grow)])
+                self.last_price = np.concatenate([self.last_price, np.full(grow, np.nan)])
+                self.strategy = np.concatenate([self.strategy, np.zeros(grow, dtype=np.int64)])
+        return slot
+
+    def set_position(self, symbol: str, quantity: float, average_price: float, strategy: str | None = None):
+        # Seed or overwrite a position from the book (startup, reconciliation), realized P&L is untouched
+        slot = self._slot(symbol)
+        self.quantity[slot] = quantity
+        self.average_price[slot] = average_price
+        self.strategy[slot] = self._strategy_index(strategy)
+        if np.isnan(self.last_price[slot]):
+            self.last_price[slot] = average_price
+
+    def sync_positions(self, positions: dict[str, Position]):
+        # Flatten symbols no longer held, then seed everything that is
+        self.quantity[:] = 0
+        for symbol, position in positions.items():
+            signed = position.quantity if position.side == Direction.LONG else -position.quantity
+            self.set_position(symbol, signed, position.entry_price, position.strategy)
+
+    def on_fill(self, symbol: str, side: Direction, quantity: float, price: float, commission: float = 0, strategy: str | None = None) -> float | None:
+        # Returns the P&L the fill realized, None when it only opened or added
+        slot = self._slot(symbol)
+        held = self.quantity[slot]
+        signed = quantity if side == Direction.LONG else -quantity
+        self.last_price[slot] = price
+        self.commission += commission
+
+        if held == 0 or np.sign(held) == np.sign(signed):
+            # Opening or adding, the average price moves to the combined VWAP
+            if held == 0:
+                self.strategy[slot] = self._strategy_index(strategy)
+            total = held + signed
+            self.average_price[slot] = (held * self.average_price[slot] + signed * price) / total
+            self.quantity[slot] = total
+            return None
+
+        # Reducing, closing or flipping: realize the closed part against the average price
+        closed = min(abs(signed), abs(held))
+        pnl = closed * (price - self.average_price[slot]) * np.sign(held)
+        name = self.strategies[self.strategy[slot]]
+        self.realized[name] = self.realized.get(name, 0.0) + float(pnl)
+
+        remaining = held + signed
+        self.quantity[slot] = remaining
+        if remaining != 0 and np.sign(remaining) != np.sign(held):
+            self.average_price[slot] = price
+            self.strategy[slot] = self._strategy_index(strategy)
+        return float(pnl)
+
+    def on_price(self, symbol: str, price: float):
+        slot = self.slots.get(symbol)
+        if slot is not None and price is not None and price > 0:
+            self.last_price[slot] = price
+
+    def on_prices(self, prices: dict[str, float]):
+        for symbol, price in prices.items():
+            self.on_price(symbol, price)
+
+    def snapshot(self) -> PnLSnapshot:
+        n = len(self.slots)
+        quantity = self.quantity[:n]
+        price = np.where(np.isnan(self.last_price[:n]), self.average_price[:n], self.last_price[:n])
+        unrealized = (price - self.average_price[:n]) * quantity
+        value = price * quantity
+        strategy = self.strategy[:n]
+        held = quantity != 0
+
+        count = len(self.strategies)
+        by_unrealized = np.bincount(strategy, weights=unrealized, minlength=count)
+        by_exposure = np.bincount(strategy, weights=np.abs(value), minlength=count)
+        by_positions = np.bincount(strategy, weights=held, minlength=count)
+
+        by_strategy = {}
+        for index, name in enumerate(self.strategies):
+            if by_positions[index] or name in self.realized:
+                by_strategy[name] = StrategyPnL(realized=self.realized.get(name, 0.0),
+                                                unrealized=float(by_unrealized[index]),
+                                                gross_exposure=float(by_exposure[index]),
+                                                open_positions=int(by_positions[index]))
+        for name, realized in self.realized.items():
+            by_strategy.setdefault(name, StrategyPnL(realized=realized))
+
+        return PnLSnapshot(taken_at=datetime.now(timezone.utc),
+                           realized=sum(self.realized.values()),
+                           unrealized=float(unrealized.sum()),
+                           commission=self.commission,
+                           long_exposure=float(value[value > 0].sum()),
+                           short_exposure=float(np.abs(value[value < 0]).sum()),
+                           gross_exposure=float(np.abs(value).sum()),
+                           net_exposure=float(value.sum()),
+                           open_positions=int(held.sum()),
+                           by_strategy=by_strategy)
+
+    def restore(self, snapshot: PnLSnapshot):
+        # Carry realized P&L over from the last persisted snapshot, on top of fills applied since startup
+        for name, pnl in snapshot.by_strategy.items():
+            if pnl.realized:
+                self.realized[name] = self.realized.get(name, 0.0) + pnl.realized
+        self.commission += snapshot.commission
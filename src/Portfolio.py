@@ -1,87 +1,246 @@
+from __future__ import annotations
+
 from src.Context import Context
 from src.Types import *
 from src.Events import OrderEvent, MarketEvent
+from src.Journal import JournalState
+from src.FillAggregator import FillAggregator
+from src.PnL import PnLTracker, PnLSnapshot
 
 from src.Alert import send_alert
-from datetime import timedelta
-import pandas_ta_classic as ta
+from datetime import date, timedelta
+from src.Lazy import lazy_import
+from src.WarmState import WarmState
 
 import math
 
 from db.operations import create_position, update_position, get_open_positions
 from db import get_universe_by_symbol, get_position_by_id
-from db import models, get_latest_entries
+from db import models, get_latest_entries, subscribe_table_changes, create_pnl_snapshot, get_latest_pnl_snapshot, get_last_position_write, get_write_spool
+
+indicators = lazy_import("src.Indicators")
 
 class Portfolio(object):
-    def __init__(self):
+    def __init__(self, fill_thresholds: tuple[float, ...] = (1.0,), account: str = DEFAULT_ACCOUNT, max_positions: int = 5, allocation: float = 1.0):
         self.context: Context = None
+        self.account = account
         self.open_positions: dict[str, Position] = {}
-        self.max_positions = 5
+        self.pending_orders: dict[str, list[Order]] = {} # Orders in flight as of the last journaled event
+        self.max_positions = max_positions
+        self.allocation = allocation # Fraction of the account's cash entries are sized from
+        self.cash: float = None # Read at the market event, cleared when its cascade ends
+        self.last_cash: float = None # Last balance read, recorded with P&L snapshots
+
+        # Exit orders built by the pre-open job
+        self.staged_exits: dict[str, list[Order]] = {}
+        self.staged_for: date = None
+
+        # By default a position is created or updated once per order, when it is completely filled
+        self.fill_aggregator = FillAggregator(thresholds=fill_thresholds)
+
+        # Position IDs whose database row changed since their exit plan was loaded
+        self.stale_exit_plans: set[str] = set()
+
+        # Realized and mark-to-market P&L, kept up to date on every fill and price
+        self.pnl = PnLTracker()
+        self.pnl_restored = False # Snapshots wait for the restore, or the next one would start from a partial total
+        self.entry_signals: dict[str, Signal] = {} # Signal behind each entry order in flight
 
+    def load_warm_state(self, state: WarmState):
+        # Start from the last snapshot, load_open_positions replaces it with the database view
+        self.open_positions = dict(state.positions_for(self.account))
+        self.pnl.sync_positions(self.open_positions)
+
+    def load_open_positions(self):
         # Retrieve open positions from database and populate self.open_positions
-        open_positions_from_db = get_open_positions()
+        open_positions_from_db = get_open_positions(account=self.account)
+        open_positions = {}
         for position in open_positions_from_db:
-            self.open_positions[position.symbol] = Position(symbol=position.symbol, position_id=str(position.id), side=position.side, quantity=position.quantity, entry_price=position.open_price)
+            open_positions[position.symbol] = Position(symbol=position.symbol, position_id=str(position.id), side=position.side, quantity=position.quantity, entry_price=position.open_price, entry_time=position.open_time,
+                                                       strategy=position.strategy_tag, realized_pnl=float(position.realized_pnl or 0),
+                                                       closed_quantity=float(position.closed_quantity or 0))
+            if position.tags:
+                self.apply_exit_tags(open_positions[position.symbol], position.tags)
+        self.open_positions = open_positions
+        self.pnl.sync_positions(self.open_positions)
+
+    def load_pnl(self) -> bool:
+        # Realized P&L carries over from the last snapshot, open positions are marked afresh.
+        # Spooled snapshots are not readable yet, the restore is retried once they have landed
+        if self.pnl_restored:
+            return True
+        spool = get_write_spool()
+        if spool.spooling or spool.pending_bytes() > 0:
+            return False
+
+        try:
+            snapshot = get_latest_pnl_snapshot(account=self.account)
+        except Exception:
+            return False
+        if snapshot is not None:
+            self.pnl.restore(PnLSnapshot.model_validate(snapshot.to_dict()))
+        self.pnl_restored = True
+        return True
+
+    def snapshot_pnl(self) -> PnLSnapshot | None:
+        if not self.load_pnl():
+            return None
+        snapshot = self.pnl.snapshot()
+        create_pnl_snapshot(account=self.account, cash=self.last_cash, **snapshot.model_dump())
+        return snapshot
+
+    def restore_state(self, state: JournalState):
+        # The database is authoritative for positions it knows about. The journal only fills in positions
+        # opened after its last position write (e.g. a fill journaled just before a crash); older ones
+        # missing from the database were closed since, manually or by reconciliation
+        last_write = get_last_position_write(account=self.account)
+        for symbol, position in state.open_positions.items():
+            if symbol in self.open_positions:
+                continue
+            if last_write is not None and position.entry_time is not None and position.entry_time <= last_write:
+                continue
 
-    def create_exits(self, position: Position):
+            new_position: models.Position = create_position(
+                symbol=position.symbol,
+                status='OPEN',
+                side=position.side,
+                open_time=position.entry_time,
+                open_price=position.entry_price,
+                quantity=position.quantity,
+                account=self.account,
+                notes="Restored from event journal"
+            )
+            if new_position is None:
+                continue
 
-        # Exit conditions
-        position_from_db = get_position_by_id(position.position_id)
-        position_tags = position_from_db.tags
+            send_alert(f"Restored open position for {symbol} ({self.account}) from event journal")
+            self.open_positions[symbol] = position.model_copy(update={"position_id": str(new_position.id)})
+            self.calculate_exit(self.open_positions[symbol])
+
+        self.pending_orders = state.pending_orders
+        self.pnl.sync_positions(self.open_positions)
+
+    def watch_positions(self):
+        subscribe_table_changes("trading.positions", self.on_position_change)
 
-        # 1. Position has been open for more than 5 days
+    def on_position_change(self, change: dict | None):
+        # Exit levels edited outside the engine are picked up the next time exits are planned
+        if change is None:
+            self.stale_exit_plans.update(position.position_id for position in list(self.open_positions.values()))
+        elif change["key"].get("account") == self.account:
+            self.stale_exit_plans.add(str(change["key"].get("id")))
+
+    def load_exit_plan(self, position: Position):
+        # Positions loaded without an exit plan pick it up from the tags written by calculate_exit
+        if position.position_id is None:
+            return
+        position_from_db = get_position_by_id(position.position_id)
+        position_tags = position_from_db.tags if position_from_db is not None else None
+        if position_tags:
+            self.apply_exit_tags(position, position_tags)
+
+    def apply_exit_tags(self, position: Position, position_tags: dict):
+        if position_tags.get("exit_date") is not None:
+            position.exit_date = datetime.strptime(position_tags["exit_date"], "%Y-%m-%d").date()
+        if position_tags.get("take_profit_price") is not None:
+            position.take_profit_price = float(position_tags["take_profit_price"])
+        if position_tags.get("stop_loss_price") is not None:
+            position.stop_loss_price = float(position_tags["stop_loss_price"])
+        if position_tags.get("signal_price") is not None:
+            position.signal_price = float(position_tags["signal_price"])
+
+    def plan_exits(self, position: Position) -> list[Order]:
+        # Exits are broker-side orders that stay working, so only return orders when the plan needs to change
+        if position.exit_date is None or position.position_id in self.stale_exit_plans:
+            self.stale_exit_plans.discard(position.position_id)
+            self.load_exit_plan(position)
+
+        exit_direction = Direction.SHORT if position.side == Direction.LONG else Direction.LONG
+        working_exits = self.context.order_manager.working_orders(position.symbol, OrderIntent.CLOSE)
+        live_exit = next((order for order in working_exits if order.order_type == OrderType.OCO), None)
+
+        # A market exit is already on its way
+        if any(order.order_type == OrderType.MARKET for order in working_exits):
+            return []
+
+        # 1. Position has been open for more than 5 days, replace the take profit / stop loss with a market exit
         today = self.context.current_time().date()
-        if today >= datetime.strptime(position_tags["exit_date"], "%Y-%m-%d").date():
-            order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.MARKET, direction=Direction.SHORT if position.side == Direction.LONG else Direction.LONG, order_intent=OrderIntent.CLOSE)
+        if position.exit_date is not None and today >= position.exit_date:
+            order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.MARKET, direction=exit_direction, order_intent=OrderIntent.CLOSE,
+                          replaces_order_id=live_exit.order_id if live_exit else None)
+            return [order]
+
+        # 2. Take profit at >= 1 atr from entry price, 3. stop loss at <= 2 atr from entry price
+        if position.take_profit_price is None or position.stop_loss_price is None:
+            return []
+
+        if live_exit is not None and live_exit.quantity == position.quantity and live_exit.price == position.take_profit_price and live_exit.stop_price == position.stop_loss_price:
+            return []
+
+        order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.OCO, direction=exit_direction, order_intent=OrderIntent.CLOSE,
+                      take_profit_price=position.take_profit_price, stop_loss_price=position.stop_loss_price,
+                      replaces_order_id=live_exit.order_id if live_exit else None)
+        return [order]
+
+    def send_exits(self, orders: list[Order]):
+        for order in orders:
+            if order.order_type == OrderType.OCO:
+                send_alert(f"Creating exit order for {order.symbol}: take profit at {order.take_profit_price}, stop loss at {order.stop_loss_price}")
+            elif order.order_type == OrderType.MARKET:
+                send_alert(f"Creating time exit order for {order.symbol}")
             self.send_order(order)
 
-        # 2. Position has gained >= 1 atr from entry price
-        if position.side == Direction.LONG:
-            if position_tags and "take_profit_price" in position_tags and position_tags["take_profit_price"] is not None:
-                # Make exit limit order at take profit price
-                order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.LIMIT, direction=Direction.SHORT, order_intent=OrderIntent.CLOSE, price=float(position_tags["take_profit_price"]))
+    def create_exits(self, position: Position):
+        self.send_exits(self.plan_exits(position))
 
-                send_alert(f"Creating take profit order for {position.symbol} at {position_tags['take_profit_price']}")
-                self.send_order(order)
+    def prepare(self, event: MarketEvent):
+        # Build exit orders ahead of the open so the market event only has to send them
+        self.staged_exits = {symbol: self.plan_exits(position) for symbol, position in self.open_positions.items()}
+        self.staged_for = self.context.current_time().date()
 
-        elif position.side == Direction.SHORT:
-            if position_tags and "take_profit_price" in position_tags and position_tags["take_profit_price"] is not None:
-                # Make exit limit order at take profit price
-                order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.LIMIT, direction=Direction.LONG, order_intent=OrderIntent.CLOSE, price=float(position_tags["take_profit_price"]))
-                self.send_order(order)
+    def on_market_update(self, event: MarketEvent):
+        # Refresh cash once per market event, signals in the same cascade are sized from it
+        self.cash = self.last_cash = self.context.get_cash()
 
-        # 3. Stop loss, <= 2 atr from entry price
-        if position.side == Direction.LONG:
-            if position_tags and "stop_loss_price" in position_tags and position_tags["stop_loss_price"] is not None:
-                # Make exit market order
-                order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.MARKET, direction=Direction.SHORT, order_intent=OrderIntent.CLOSE, price=float(position_tags["stop_loss_price"]))
+        staged_exits = self.staged_exits if self.staged_for == self.context.current_time().date() else {}
+        self.staged_exits = {}
+        self.staged_for = None
 
-                send_alert(f"Creating stop loss order for {position.symbol} at {position_tags['stop_loss_price']}")
-                self.send_order(order)
-        elif position.side == Direction.SHORT:
-            if position_tags and "stop_loss_price" in position_tags and position_tags["stop_loss_price"] is not None:
-                # Make exit market order
-                order = Order(symbol=position.symbol, quantity=position.quantity, order_type=OrderType.MARKET, direction=Direction.LONG, order_intent=OrderIntent.CLOSE, price=float(position_tags["stop_loss_price"]))
-                self.send_order(order)
+        for symbol, position in self.open_positions.items():
+            orders = staged_exits.get(symbol)
 
-    def on_market_update(self, event: MarketEvent):
-        for _, position in self.open_positions.items():
-            self.create_exits(position)
+            # Replan if the position changed since the exits were staged
+            if orders is None or any(order.quantity != position.quantity for order in orders):
+                orders = self.plan_exits(position)
+            self.send_exits(orders)
+
+        send_alert(f"Market update. Current open positions ({self.account}): {list(self.open_positions.keys())}")
 
-        send_alert(f"Market update. Current open positions: {list(self.open_positions.keys())}")
+    def end_cascade(self):
+        # Cash is only valid for the cascade it was read in, signals in a later one read it again
+        self.cash = None
 
     def on_signal(self, signal: Signal):
         if len(self.open_positions) >= self.max_positions:
-            send_alert(f"Received signal for {signal.symbol} but max positions already open. Ignoring signal.")
+            send_alert(f"Received signal for {signal.symbol} but max positions already open in {self.account}. Ignoring signal.")
+            return
+
+        if self.context.order_manager.has_working_order(signal.symbol, OrderIntent.OPEN):
+            send_alert(f"Received signal for {signal.symbol} but an entry order is already working in {self.account}. Ignoring signal.")
             return
 
         if signal.strategy_id == "SniperStrategy":
-            cash = self.context.get_cash()
+            if self.cash is None:
+                self.cash = self.last_cash = self.context.get_cash()
+            cash = self.cash * self.allocation
             remaining_spots = self.max_positions - len(self.open_positions)
             cash_per_position = int(cash / remaining_spots)
             quantity = int(cash_per_position / signal.value)
 
-            order = Order(symbol=signal.symbol, quantity=quantity, order_type=OrderType.LIMIT, direction=Direction.LONG, order_intent=OrderIntent.OPEN, price=round(signal.value, 2))
+            # A redelivered signal maps to the same client order ID, so the broker refuses it a second time
+            order = Order(symbol=signal.symbol, quantity=quantity, order_type=OrderType.LIMIT, direction=Direction.LONG, order_intent=OrderIntent.OPEN, price=round(signal.value, 2),
+                          client_order_id=signal.signal_id)
+            self.entry_signals[signal.symbol] = signal
             self.send_order(order)
 
     def calculate_exit(self, position: Position) -> None:
@@ -90,10 +249,17 @@ class Portfolio(object):
         take_profit_price = None
         stop_loss_price = None
 
-        table_name = get_universe_by_symbol(position.symbol)[-1].price_source_table
-        latest_data = get_latest_entries(table_name=table_name, symbol=position.symbol, n=30)
+        # Reuse the ATR computed by today's scan when there is one, otherwise fetch bars
+        scanned = self.context.warm_state.indicators.get(position.symbol)
+        if scanned is not None and scanned.as_of == self.context.current_time().date():
+            atr = scanned.atr
+        else:
+            table_name = self.context.warm_state.universe.get(position.symbol)
+            if table_name is None:
+                table_name = get_universe_by_symbol(position.symbol)[0].price_source_table
+            latest_data = get_latest_entries(table_name=table_name, symbol=position.symbol, n=30)
 
-        atr = ta.atr(latest_data["high"], latest_data["low"], latest_data["close"], length=14).iloc[-1]
+            atr = indicators.atr(indicators.as_array(latest_data["high"]), indicators.as_array(latest_data["low"]), indicators.as_array(latest_data["close"]), 14)[-1]
 
         if position.side == Direction.LONG:
             take_profit_price = position.entry_price + atr
@@ -108,16 +274,39 @@ class Portfolio(object):
             "take_profit_price": round(take_profit_price, 2),
             "stop_loss_price": round(stop_loss_price, 2)
         }
+        # The tags are rewritten whole, keep the entry's signal price for the slippage report
+        if position.signal_price is not None:
+            metadata["signal_price"] = position.signal_price
+
+        self.update_position_row(position, tags=metadata)
 
-        update_position(
-            position_id=int(position.position_id),
-            tags=metadata
-        )
+        self.apply_exit_tags(position, metadata)
+
+    def update_position_row(self, position: Position, **updates):
+        # A position opened while writes were spooled has no row id until reconciliation binds it
+        if position.position_id is None:
+            return
+        update_position(position_id=int(position.position_id), **updates)
 
     def on_fill(self, fill: Fill):
-        # Add the fill to the open positions if it is an opening fill, otherwise remove it from the open positions
-        # TODO: Once we support partial fills, include fill.side as well
-        if fill.symbol not in self.open_positions and fill.side == Direction.LONG:
+        # Partial fills are aggregated per order, positions only change once a fill is released
+        fill = self.fill_aggregator.add(fill)
+        if fill is None:
+            return
+
+        position = self.open_positions.get(fill.symbol)
+        signal = self.entry_signals.get(fill.symbol) if position is None else None
+        strategy = position.strategy if position is not None else signal.strategy_id if signal is not None else None
+        realized = self.pnl.on_fill(fill.symbol, fill.side, fill.quantity, fill.fill_price, fill.commission, strategy=strategy)
+        if realized is not None:
+            # Persisted per realizing fill so a restart restores it, not just the last periodic snapshot
+            self.snapshot_pnl()
+
+        # Add the fill to the open positions if it is an opening fill, otherwise reduce or close the position
+        if position is None and fill.side == Direction.LONG:
+            self.entry_signals.pop(fill.symbol, None)
+            signal_price = signal.value if signal is not None else None
+
             # Create database entry
             new_position: models.Position = create_position(
                 symbol=fill.symbol,
@@ -125,24 +314,64 @@ class Portfolio(object):
                 side=fill.side,
                 open_time=self.context.current_time(),
                 open_price=fill.fill_price,
-                quantity=fill.quantity
+                quantity=fill.quantity,
+                strategy_tag=strategy,
+                account=self.account,
+                tags={"signal_price": signal_price} if signal_price is not None else None
             )
+            if new_position is None:
+                send_alert(f"Could not record the {fill.symbol} position ({self.account}) in the database, it is tracked without an id until reconciliation")
 
             self.open_positions[fill.symbol] = Position(symbol=fill.symbol,
-                                                        position_id=str(new_position.id),
+                                                        position_id=str(new_position.id) if new_position is not None else None,
                                                         side=fill.side,
                                                         quantity=fill.quantity,
                                                         entry_price=fill.fill_price,
-                                                        entry_time=self.context.current_time())
+                                                        entry_time=self.context.current_time(),
+                                                        strategy=strategy,
+                                                        signal_price=signal_price)
 
             self.calculate_exit(self.open_positions[fill.symbol])
             self.create_exits(self.open_positions[fill.symbol])
 
-        elif fill.side != self.open_positions[fill.symbol].side:
+        elif position is not None and fill.side == position.side:
+            # Later release of an entry order filling across thresholds, extend the position at the combined VWAP
+            quantity = position.quantity + fill.quantity
+            entry_price = (position.quantity * position.entry_price + fill.quantity * fill.fill_price) / quantity
+
+            self.update_position_row(
+                position,
+                quantity=quantity,
+                open_price=entry_price
+            )
+
+            self.open_positions[fill.symbol] = position.model_copy(update={"quantity": quantity, "entry_price": entry_price})
+
+            self.calculate_exit(self.open_positions[fill.symbol])
+            self.create_exits(self.open_positions[fill.symbol])
+
+        elif position is not None and fill.quantity < position.quantity:
+            # Partial close, keep the remainder open. The closed part's P&L is recorded on the row,
+            # quantity and close_price alone only describe the final close
+            quantity = position.quantity - fill.quantity
+            direction = 1 if position.side == Direction.LONG else -1
+            realized_pnl = position.realized_pnl + direction * (fill.fill_price - position.entry_price) * fill.quantity - fill.commission
+            closed_quantity = position.closed_quantity + fill.quantity
+
+            self.update_position_row(
+                position,
+                quantity=quantity,
+                realized_pnl=realized_pnl,
+                closed_quantity=closed_quantity
+            )
+
+            self.open_positions[fill.symbol] = position.model_copy(update={"quantity": quantity, "realized_pnl": realized_pnl,
+                                                                          "closed_quantity": closed_quantity})
+
+        elif position is not None:
             # Update database entry
-            # TODO: Add logic to handle partial fills (for now we are assuming all fills are complete fills)
-            update_position(
-                position_id=int(self.open_positions[fill.symbol].position_id),
+            self.update_position_row(
+                position,
                 status='CLOSED',
                 close_time=self.context.current_time(),
                 close_price=fill.fill_price,
@@ -152,7 +381,8 @@ class Portfolio(object):
             self.open_positions.pop(fill.symbol)
 
     def send_order(self, order: Order):
-        order_event = OrderEvent(order=order)
+        # Routed by the engine to this portfolio's account
+        order_event = OrderEvent(order=order.model_copy(update={"account": self.account}))
         self.context.event_sink.publish(order_event)
 
     def set_context(self, context: Context):
@@ -0,0 +1,148 @@
+import cProfile
+import itertools
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+class StackSampler(object):
+    """
+    Samples one thread's Python stack at a fixed interval into collapsed-stack counts
+    ("root;caller;leaf count" per line), the input format of flamegraph.pl and speedscope.
+    """
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path: Path):
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+
+class CascadeProfiler(object):
+    """
+    Profiles engine cascades and stream callbacks, one pair of files per profiled call.
+
+    "sampling" mode only runs the stack sampler (collapsed stacks, low overhead).
+    "deterministic" mode also runs cProfile and writes a .pstats file next to it.
+    The profiler is idle until enabled, either for good or for the next N cascades
+    (e.g. from SIGUSR1), and keeps only the most recent files.
+    """
+    MODES = ("sampling", "deterministic")
+
+    def __init__(self, directory: str = PROFILE_DIR, mode: str = "sampling", keep: int = 50, interval: float = 0.001):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.keep = keep
+        self.interval = interval
+
+        self.remaining: int = 0 # Cascades left to profile, None profiles every cascade
+        self._sequence = itertools.count()
+        self._written: deque[list[Path]] = deque()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def active(self) -> bool:
+        return self.remaining is None or self.remaining > 0
+
+    def enable(self, cascades: int = None):
+        # Profile the next N cascades, or every cascade when cascades is None
+        with self._lock:
+            self.remaining = cascades
+
+    def disable(self):
+        with self._lock:
+            self.remaining = 0
+
+    def install_signal_handler(self, cascades: int = 5, signum: int = signal.SIGUSR1):
+        # kill -USR1 <pid> profiles the next few cascades of a running engine
+        def handler(received, frame):
+            self.enable(cascades)
+            print(f"Profiling the next {cascades} cascades into {self.directory}")
+        signal.signal(signum, handler)
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self.remaining is None:
+                return True
+            if self.remaining > 0:
+                self.remaining -= 1
+                return True
+            return False
+
+    @contextmanager
+    def profile(self, name: str):
+        # Only the outermost call on a thread is profiled, stream callbacks wrap whole cascades
+        depth = getattr(self._local, "depth", 0)
+        if depth or not self.active or not self._claim():
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        self._local.depth = 1
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        profiler = cProfile.Profile() if self.mode == "deterministic" else None
+        started = time.perf_counter()
+
+        sampler.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            sampler.stop()
+            self._local.depth = 0
+            try:
+                self._write(name, time.perf_counter() - started, sampler, profiler)
+            except Exception as e:
+                print(f"Error writing profile for {name}: {str(e)}")
+
+    def _write(self, name: str, seconds: float, sampler: StackSampler, profiler: cProfile.Profile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}_{next(self._sequence):06d}_{name}_{int(seconds * 1000)}ms"
+
+        files = [self.directory / f"{stem}.collapsed"]
+        sampler.write(files[0])
+        if profiler is not None:
+            files.append(self.directory / f"{stem}.pstats")
+            profiler.dump_stats(files[1])
+
+        # Rotate, keeping the files of the most recent profiled calls
+        with self._lock:
+            self._written.append(files)
+            while len(self._written) > self.keep:
+                for path in self._written.popleft():
+                    path.unlink(missing_ok=True)
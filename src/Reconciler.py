@@ -0,0 +1,225 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from alpaca.trading.enums import QueryOrderStatus
+from alpaca.trading.requests import GetOrdersRequest
+from pydantic import BaseModel
+
+from db import bulk_create_positions, bulk_update_positions, get_open_positions, get_write_spool
+
+from src.Alert import send_alert
+from src.BrokerClient import BrokerClient
+from src.Lazy import lazy_import
+from src.OrderManager import OrderManager
+from src.Portfolio import Portfolio
+from src.Types import *
+
+pd = lazy_import("pandas")
+
+class ReconciliationReport(BaseModel):
+    account: str = DEFAULT_ACCOUNT
+    inserted: list[str] = [] # Held at the broker, missing from the database
+    closed: list[str] = [] # Open in the database, not held at the broker
+    quantity_updated: list[str] = []
+    memory_added: list[str] = []
+    memory_removed: list[str] = []
+    deferred: list[str] = [] # Skipped because entries or fills are still in flight
+    skipped: str | None = None # Why nothing was reconciled
+    orders_synced: list[str] = []
+    duration_seconds: float = 0
+
+    def has_changes(self) -> bool:
+        return any([self.inserted, self.closed, self.quantity_updated, self.memory_added, self.memory_removed, self.orders_synced])
+
+    def summary(self) -> str:
+        lines = [f"{self.account} reconciliation finished in {self.duration_seconds * 1000:.1f} ms"]
+        for name in ("inserted", "closed", "quantity_updated", "memory_added", "memory_removed", "deferred", "orders_synced"):
+            values = getattr(self, name)
+            if values:
+                lines.append(f"  {name}: {', '.join(values)}")
+        return "\n".join(lines)
+
+class Reconciler(object):
+    """
+    Brings the in-memory book and trading.positions in line with what the broker holds.
+
+    Pulls all broker positions and open orders in one call each, diffs them against the
+    portfolio and the database in a single merge, and applies the fixes with bulk writes.
+    """
+    def __init__(self, trading_client: BrokerClient, portfolio: Portfolio, order_manager: OrderManager, lock: threading.RLock = None):
+        self.trading_client = trading_client
+        self.portfolio = portfolio
+        self.order_manager = order_manager
+        # The engine's cascade lock, held while the book is diffed and fixed
+        self.lock = lock if lock is not None else threading.RLock()
+
+    def sync_orders(self, report: ReconciliationReport):
+        # One call for every open order, legs of OCO exits nested under their parent
+        open_orders = self.trading_client.get_orders(filter=GetOrdersRequest(status=QueryOrderStatus.OPEN, nested=True, limit=500))
+        open_ids = {str(order.id) for order in open_orders}
+        broker_orders = list(open_orders)
+
+        # Orders we think are working but the broker has finished, only fetched when there are any
+        finished = [order for order in self.order_manager.all_working_orders() if order.order_id not in open_ids]
+        if finished:
+            after = min((order.updated_at for order in finished if order.updated_at is not None), default=None)
+            after = after - timedelta(minutes=1) if after is not None else datetime.now(timezone.utc) - timedelta(days=1)
+            finished_ids = {order.order_id for order in finished}
+            closed_orders = self.trading_client.get_orders(filter=GetOrdersRequest(status=QueryOrderStatus.CLOSED, after=after, limit=500))
+            broker_orders += [order for order in closed_orders if str(order.id) in finished_ids]
+
+        for broker_order in broker_orders:
+            if self.order_manager.sync_broker_order(broker_order):
+                report.orders_synced.append(str(broker_order.id))
+        if report.orders_synced:
+            self.order_manager.flush()
+
+    def working_symbols(self) -> set[str]:
+        # Resting OCO exits are expected on every position, anything else in flight may still change it
+        return {
+            order.symbol for order in self.order_manager.all_working_orders()
+            if order.order_type != OrderType.OCO or order.status == OrderStatus.partial
+        }
+
+    def run(self) -> ReconciliationReport:
+        start = time.perf_counter()
+        report = ReconciliationReport(account=self.portfolio.account)
+
+        # Spooled writes have not reached trading.positions, so the database view would be stale
+        spool = get_write_spool()
+        if spool.spooling or spool.pending_bytes() > 0:
+            report.skipped = "database writes are spooled"
+            print(f"Skipping {self.portfolio.account} reconciliation: {report.skipped}")
+            return report
+
+        self.sync_orders(report)
+
+        # Broker and database reads happen outside the cascade lock, so a slow call never holds up a cascade.
+        # Positions a cascade changes while they are read are deferred to the next run
+        before = dict(self.portfolio.open_positions)
+        broker_positions = self.trading_client.get_all_positions()
+        db_positions = get_open_positions(account=self.portfolio.account)
+
+        # Cascades wait while the book is diffed and fixed
+        with self.lock:
+            working_symbols = self.working_symbols()
+            current = self.portfolio.open_positions
+            working_symbols |= {symbol for symbol in before.keys() | current.keys() if before.get(symbol) is not current.get(symbol)}
+
+            broker = pd.DataFrame(
+                [(p.symbol, abs(float(p.qty)), "SHORT" if str(p.side.value if hasattr(p.side, "value") else p.side) == "short" else "LONG", float(p.avg_entry_price)) for p in broker_positions],
+                columns=["symbol", "broker_quantity", "broker_side", "broker_price"]
+            )
+            database = pd.DataFrame(
+                [(p.symbol, p.id, float(p.quantity), float(p.open_price), p.open_time) for p in db_positions],
+                columns=["symbol", "position_id", "db_quantity", "db_price", "db_open_time"]
+            ).drop_duplicates("symbol", keep="last")
+            memory = pd.DataFrame(
+                [(symbol, position.quantity) for symbol, position in self.portfolio.open_positions.items()],
+                columns=["symbol", "memory_quantity"]
+            )
+
+            book = broker.merge(database, on="symbol", how="outer").merge(memory, on="symbol", how="outer")
+
+            # Symbols with orders in flight are left alone, the stream will settle them
+            deferred = book["symbol"].isin(working_symbols)
+            report.deferred = sorted(book.loc[deferred, "symbol"])
+            book = book.loc[~deferred]
+
+            held = book["broker_quantity"].notna()
+            in_db = book["position_id"].notna()
+            in_memory = book["memory_quantity"].notna()
+
+            now = datetime.now(timezone.utc)
+
+            # Database drift
+            to_insert = book.loc[held & ~in_db]
+            to_close = book.loc[~held & in_db]
+            to_resize = book.loc[held & in_db & (book["broker_quantity"] != book["db_quantity"])]
+
+            created = bulk_create_positions([
+                {
+                    "symbol": row.symbol,
+                    "status": "OPEN",
+                    "side": row.broker_side,
+                    "open_time": now,
+                    "open_price": row.broker_price,
+                    "quantity": row.broker_quantity,
+                    "account": self.portfolio.account,
+                    "notes": "Created by reconciliation"
+                }
+                for row in to_insert.itertuples()
+            ])
+            report.inserted = [position.symbol for position in created]
+            position_ids = dict(zip(book.loc[in_db, "symbol"], book.loc[in_db, "position_id"].astype(int)))
+            position_ids.update({position.symbol: position.id for position in created})
+
+            updates = [
+                {"id": int(row.position_id), "status": "CLOSED", "close_time": now, "notes": "Closed by reconciliation"}
+                for row in to_close.itertuples()
+            ] + [
+                {"id": int(row.position_id), "quantity": row.broker_quantity}
+                for row in to_resize.itertuples()
+            ]
+            if bulk_update_positions(updates):
+                report.closed = list(to_close["symbol"])
+                report.quantity_updated = list(to_resize["symbol"])
+
+            # In-memory drift, the broker is the source of truth
+            for row in book.loc[~held & in_memory].itertuples():
+                self.portfolio.open_positions.pop(row.symbol, None)
+                report.memory_removed.append(row.symbol)
+
+            rebound = [] # Opened while writes were spooled, their rows are only known now
+            for row in book.loc[held].itertuples():
+                if row.symbol not in position_ids:
+                    continue
+                position = self.portfolio.open_positions.get(row.symbol)
+                if position is not None and position.position_id is None:
+                    rebound.append(row.symbol)
+                if position is not None and position.quantity == row.broker_quantity and position.position_id == str(position_ids[row.symbol]):
+                    continue
+
+                if position is None:
+                    known = pd.notna(row.position_id)
+                    position = Position(symbol=row.symbol,
+                                        side=Direction(row.broker_side),
+                                        quantity=row.broker_quantity,
+                                        entry_price=row.db_price if known else row.broker_price,
+                                        entry_time=row.db_open_time if known else now)
+                    report.memory_added.append(row.symbol)
+                self.portfolio.open_positions[row.symbol] = position.model_copy(update={
+                    "position_id": str(position_ids[row.symbol]),
+                    "quantity": row.broker_quantity
+                })
+
+            # The book may have changed under the P&L tracker, and the broker's prices are the freshest marks
+            self.portfolio.pnl.sync_positions(self.portfolio.open_positions)
+            self.portfolio.pnl.on_prices({p.symbol: float(p.current_price) for p in broker_positions if p.current_price is not None})
+
+        # Positions the database did not know about need exit levels. Bars may be read, so the plan is
+        # computed on a copy outside the lock, then applied to whatever a cascade has left of the position
+        for symbol in report.inserted + rebound:
+            try:
+                with self.lock:
+                    position = self.portfolio.open_positions.get(symbol)
+                if position is None:
+                    continue
+                planned = position.model_copy()
+                self.portfolio.calculate_exit(planned)
+                with self.lock:
+                    position = self.portfolio.open_positions.get(symbol)
+                    if position is not None and position.position_id == planned.position_id:
+                        self.portfolio.open_positions[symbol] = position.model_copy(update={
+                            "exit_date": planned.exit_date,
+                            "take_profit_price": planned.take_profit_price,
+                            "stop_loss_price": planned.stop_loss_price
+                        })
+            except Exception as e:
+                print(f"Error calculating exit for reconciled position {symbol}: {str(e)}")
+
+        report.duration_seconds = time.perf_counter() - start
+        if report.has_changes():
+            send_alert(report.summary())
+        return report
\ No newline at end of file
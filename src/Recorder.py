@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+import msgpack
+
+from src.Types import DEFAULT_ACCOUNT
+
+STREAM_RECORD_DIR = os.getenv("STREAM_RECORD_DIR", "recordings")
+
+class StreamRecorder(object):
+    """
+    Appends every raw trade update to a msgpack file, one {"t": received ns, "u": update}
+    map per message (plus "a", the account, for any but the default account), so a session
+    can be replayed offline message for message.
+    """
+    def __init__(self, directory: str = STREAM_RECORD_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.msgpack"
+        self.messages = 0
+
+        self._file = open(self.path, "ab")
+        self._lock = threading.Lock()
+
+    def record(self, data, account: str = DEFAULT_ACCOUNT):
+        try:
+            record = {"t": time.time_ns(), "u": data.model_dump(mode="json", exclude_none=True)}
+            if account != DEFAULT_ACCOUNT:
+                record["a"] = account
+            record = msgpack.packb(record)
+            with self._lock:
+                self._file.write(record)
+                self._file.flush() # Keep the recording complete up to the last message if the engine dies
+                self.messages += 1
+        except Exception as e:
+            print(f"Error recording trade update: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def read_recording(path: str) -> Iterator[tuple[int, dict, str]]:
+    # Yields (received ns, raw update, account), stopping quietly at a truncated last record
+    with open(path, "rb") as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        for record in unpacker:
+            yield record["t"], record["u"], record.get("a", DEFAULT_ACCOUNT)
@@ -1,17 +1,53 @@
+from __future__ import annotations
+
 from src.Types import *
 from src.Events import MarketEvent, SignalEvent
 from src.Context import *
 
-import pandas as pd
-import pandas_ta_classic as ta
+from src.Lazy import lazy_import
+from src.WarmState import IndicatorState
+
+pd = lazy_import("pandas")
+indicators = lazy_import("src.Indicators")
 
 from db.operations import get_active_universe, get_latest_entries
+from db import subscribe_table_changes, is_listening
 
 class Strategy(object):
     def __init__(self, name):
         self.name = name
         self.context: Context = None
 
+        # Active universe kept between scans while trading.universe changes are being notified
+        self.universe: list = None
+        self.universe_week: date = None
+        self.universe_version = 0
+        self.watching_universe = False
+
+    def watch_universe(self):
+        subscribe_table_changes("trading.universe", self.on_universe_change)
+        self.watching_universe = True
+
+    def on_universe_change(self, change: dict | None):
+        self.universe_version += 1
+        self.universe = None
+
+    def get_universe(self, week_start: date) -> list:
+        if self.watching_universe and is_listening() and self.universe is not None and self.universe_week == week_start:
+            return self.universe
+
+        # A change notified while querying leaves the result uncached
+        version = self.universe_version
+        universe = get_active_universe(week_start)
+        if version == self.universe_version:
+            self.universe = universe
+            self.universe_week = week_start
+        return universe
+
+    def prepare(self, event: MarketEvent):
+        # Precompute ahead of the market event, nothing is staged by default
+        pass
+
     def on_update(self, event: MarketEvent):
         pass
 
@@ -26,20 +62,51 @@ class SniperStrategy(Strategy):
     def __init__(self):
         super().__init__(name="SniperStrategy")
 
+        # Signals computed by the pre-open job, published as-is at the open
+        self.staged_signals: list[Signal] = []
+        self.staged_for: date = None
+
     def check_entry_criteria(self, latest_data: pd.DataFrame) -> bool:
         # Returns target entry price
-        rsi = ta.rsi(latest_data["close"], length=2)
+        rsi = indicators.rsi(indicators.as_array(latest_data["close"]), 2)
+
+        return bool(rsi[-1] <= 10)
 
-        return rsi.iloc[-1] <= 10
+    def calculate_atr(self, latest_data: pd.DataFrame) -> float:
+        atr = indicators.atr(indicators.as_array(latest_data["high"]), indicators.as_array(latest_data["low"]), indicators.as_array(latest_data["close"]), 14)
+        return atr[-1]
 
     def calculate_entry_price(self, latest_data: pd.DataFrame) -> float:
-        atr = ta.atr(latest_data["high"], latest_data["low"], latest_data["close"], length=14)
-        return latest_data["close"].iloc[-1] - atr.iloc[-1]
+        return latest_data["close"].iloc[-1] - self.calculate_atr(latest_data)
+
+    def prepare(self, event: MarketEvent):
+        self.staged_signals = self.scan()
+        self.staged_for = self.context.current_time().date()
 
     def on_update(self, event: MarketEvent):
+        if self.staged_for == self.context.current_time().date():
+            signals = self.staged_signals
+        else:
+            signals = self.scan()
+
+        self.staged_signals = []
+        self.staged_for = None
+
+        for signal in signals:
+            self.send_signal(signal)
+
+    def scan(self) -> list[Signal]:
+        signals = []
+
         # Retrieve current stock universe
         current_week = self.context.get_start_of_week()
-        universe = get_active_universe(current_week)
+        universe = self.get_universe(current_week)
+
+        # Keep the universe in the warm state so fills can be handled without a universe lookup
+        warm_state = self.context.warm_state
+        warm_state.universe_week = current_week
+        warm_state.universe = {stock.symbol: stock.price_source_table for stock in universe}
+        today = self.context.current_time().date()
 
         # For each stock, check if it meets entry criteria, if it does send a signal to enter position
         for stock in universe:
@@ -54,7 +121,12 @@ class SniperStrategy(Strategy):
 
             # Check if entry criteria is met, if it is send signal to enter position
             if self.check_entry_criteria(latest_data):
-                entry_price = self.calculate_entry_price(latest_data)
+                close = float(latest_data["close"].iloc[-1])
+                atr = float(self.calculate_atr(latest_data))
+                entry_price = close - atr
+                warm_state.indicators[symbol] = IndicatorState(as_of=today, close=close, atr=atr)
 
                 signal = Signal(strategy_id=self.name, symbol=symbol, value=entry_price)
-                self.send_signal(signal)
\ No newline at end of file
+                signals.append(signal)
+
+        return signals
\ No newline at end of file
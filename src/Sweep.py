@@ -0,0 +1,406 @@
+import argparse
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numba import njit
+from pydantic import BaseModel
+
+from src.Indicators import atr_2d, rsi_2d
+
+SWEEP_PANEL_DIR = os.getenv("SWEEP_PANEL_DIR", "cache/panel")
+
+# Live SniperStrategy / Portfolio rules, the sweep always includes them
+LIVE_PARAMETERS = {
+    "rsi_length": 2,
+    "rsi_threshold": 10.0,
+    "atr_length": 14,
+    "entry_offset": 1.0,
+    "take_profit": 1.0,
+    "stop_loss": 2.0,
+    "hold_days": 5
+}
+
+DEFAULT_GRID = {
+    "rsi_length": [2, 3, 4],
+    "rsi_threshold": [5.0, 10.0, 15.0, 20.0],
+    "atr_length": [10, 14, 20],
+    "entry_offset": [0.5, 1.0, 1.5],
+    "take_profit": [0.5, 1.0, 2.0],
+    "stop_loss": [1.0, 2.0, 3.0],
+    "hold_days": [3, 5, 7, 10]
+}
+
+# Parameters that only change the simulation, indicators are computed once per (rsi_length, atr_length)
+RULE_PARAMETERS = ["rsi_threshold", "entry_offset", "take_profit", "stop_loss", "hold_days"]
+
+# Per-combination accumulators returned by the simulation kernel
+STAT_TRADES, STAT_WINS, STAT_SUM, STAT_SUM_SQUARES, STAT_GROSS_PROFIT, STAT_GROSS_LOSS, STAT_BARS_HELD = range(7)
+STAT_COUNT = 7
+
+class BarPanel(object):
+    """
+    Daily OHLC bars for a set of symbols aligned on a common calendar.
+
+    Arrays are (symbols x days) so each symbol's history is contiguous for the per-symbol
+    loops in the kernels. Days a symbol has no bar are NaN. Saved as one .npy file per
+    column and loaded memory-mapped, so sweep workers share the pages instead of copies.
+    """
+    COLUMNS = ("open", "high", "low", "close")
+
+    def __init__(self, symbols: np.ndarray, days: np.ndarray, open: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray):
+        self.symbols = symbols
+        self.days = days # Days since 1970-01-01
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+
+    @classmethod
+    def from_bars(cls, bars: pd.DataFrame) -> "BarPanel":
+        bars = bars.assign(day=(pd.to_datetime(bars["time"], utc=True).dt.floor("D") - pd.Timestamp(0, tz="UTC")).dt.days)
+        bars = bars.drop_duplicates(["symbol", "day"], keep="last")
+
+        symbols = np.sort(bars["symbol"].unique())
+        days = np.sort(bars["day"].unique()).astype(np.int64)
+        rows = np.searchsorted(symbols, bars["symbol"].to_numpy())
+        cols = np.searchsorted(days, bars["day"].to_numpy())
+
+        columns = {}
+        for name in cls.COLUMNS:
+            values = np.full((len(symbols), len(days)), np.nan)
+            values[rows, cols] = bars[name].to_numpy(dtype=np.float64)
+            columns[name] = values
+        return cls(symbols.astype(str), days, **columns)
+
+    @classmethod
+    def from_database(cls, universe: dict[str, str], start: datetime = None, end: datetime = None, chunk_size: int = 100) -> "BarPanel":
+        from db import get_bar_history
+
+        by_table: dict[str, list[str]] = {}
+        for symbol, table_name in universe.items():
+            by_table.setdefault(table_name, []).append(symbol)
+
+        frames = []
+        for table_name, symbols in by_table.items():
+            for i in range(0, len(symbols), chunk_size):
+                frames.append(get_bar_history(table_name, symbols[i:i + chunk_size], start=start, end=end))
+        return cls.from_bars(pd.concat(frames, ignore_index=True))
+
+    @classmethod
+    def from_cache(cls, universe: dict[str, str], start: datetime = None) -> "BarPanel":
+        # Built from the on-disk bar cache alone, so no database is needed
+        from db import get_bar_cache
+
+        cache = get_bar_cache()
+        frames = []
+        for symbol, table_name in universe.items():
+            columns = cache.read(table_name, symbol)
+            if columns is None:
+                continue
+            frame = pd.DataFrame({name: columns[name] for name in ("time",) + cls.COLUMNS})
+            frame["time"] = pd.to_datetime(frame["time"], utc=True)
+            frame["symbol"] = symbol
+            frames.append(frame if start is None else frame[frame["time"] >= pd.Timestamp(start)])
+        return cls.from_bars(pd.concat(frames, ignore_index=True))
+
+    def save(self, directory: str):
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "symbols.npy", self.symbols)
+        np.save(path / "days.npy", self.days)
+        for name in self.COLUMNS:
+            np.save(path / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, directory: str) -> "BarPanel":
+        path = Path(directory)
+        return cls(np.load(path / "symbols.npy"),
+                   np.load(path / "days.npy"),
+                   **{name: np.load(path / f"{name}.npy", mmap_mode="r") for name in cls.COLUMNS})
+
+    def index_of(self, day: date) -> int:
+        # First bar at or after the given date
+        return int(np.searchsorted(self.days, (day - date(1970, 1, 1)).days))
+
+    def date_of(self, index: int) -> date:
+        return date(1970, 1, 1) + timedelta(days=int(self.days[min(index, len(self.days) - 1)]))
+
+@njit(cache=True)
+def _simulate(open_, high, low, close, days, rsi, atr, rules, start, end):
+    """
+    Run the entry/exit rules for every rule combination over bars [start, end).
+
+    A signal on bar t (RSI <= threshold) places a limit at close - offset * ATR for bar
+    t + 1, filled at the better of the limit and the open. The exit is an OCO at fill +
+    take_profit * ATR / fill - stop_loss * ATR, watched from the bar after the fill, with the
+    stop checked first when both are inside a bar's range, and a time exit at the open of
+    the first bar hold_days calendar days after the fill. One position per symbol; capital
+    and max position limits are not modelled.
+    """
+    stats = np.zeros((rules.shape[0], STAT_COUNT))
+    for k in range(rules.shape[0]):
+        threshold = rules[k, 0]
+        offset = rules[k, 1]
+        take_profit = rules[k, 2]
+        stop_loss = rules[k, 3]
+        hold_days = rules[k, 4]
+        for j in range(close.shape[0]):
+            t = start
+            while t < end - 1:
+                signal_atr = atr[j, t]
+                if not (rsi[j, t] <= threshold) or not (signal_atr > 0):
+                    t += 1
+                    continue
+
+                entry = t + 1
+                limit = close[j, t] - offset * signal_atr
+                if not (low[j, entry] <= limit):
+                    t += 1
+                    continue
+
+                fill = min(limit, open_[j, entry]) if open_[j, entry] == open_[j, entry] else limit
+                take_profit_price = fill + take_profit * signal_atr
+                stop_loss_price = fill - stop_loss * signal_atr
+                exit_day = days[entry] + hold_days
+
+                exit_price = np.nan
+                s = entry + 1
+                while s < end:
+                    bar_open = open_[j, s]
+                    if bar_open == bar_open:
+                        if days[s] >= exit_day or bar_open <= stop_loss_price or bar_open >= take_profit_price:
+                            exit_price = bar_open
+                            break
+                        if low[j, s] <= stop_loss_price:
+                            exit_price = stop_loss_price
+                            break
+                        if high[j, s] >= take_profit_price:
+                            exit_price = take_profit_price
+                            break
+                    s += 1
+
+                if s >= end:
+                    # Still open at the end of the window, marked at the last close
+                    s = end - 1
+                    while s > entry and close[j, s] != close[j, s]:
+                        s -= 1
+                    exit_price = close[j, s] if close[j, s] == close[j, s] else fill
+
+                trade_return = exit_price / fill - 1.0
+                stats[k, STAT_TRADES] += 1
+                stats[k, STAT_SUM] += trade_return
+                stats[k, STAT_SUM_SQUARES] += trade_return * trade_return
+                stats[k, STAT_BARS_HELD] += s - entry
+                if trade_return > 0:
+                    stats[k, STAT_WINS] += 1
+                    stats[k, STAT_GROSS_PROFIT] += trade_return
+                else:
+                    stats[k, STAT_GROSS_LOSS] -= trade_return
+
+                # The exit bar's close can signal the next entry
+                t = max(s, t + 1)
+    return stats
+
+class SweepTask(BaseModel):
+    rsi_length: int
+    atr_length: int
+    rules: list[list[float]] # Rows of RULE_PARAMETERS
+    windows: list[tuple[int, int]]
+
+_panel: BarPanel = None
+
+def _init_worker(panel_dir: str):
+    global _panel
+    _panel = BarPanel.load(panel_dir)
+
+def _run_task(task: SweepTask) -> tuple[SweepTask, np.ndarray]:
+    panel = _panel
+    rsi = rsi_2d(np.asarray(panel.close), task.rsi_length)
+    atr = atr_2d(np.asarray(panel.high), np.asarray(panel.low), np.asarray(panel.close), task.atr_length)
+    rules = np.asarray(task.rules, dtype=np.float64)
+    stats = np.stack([
+        _simulate(np.asarray(panel.open), np.asarray(panel.high), np.asarray(panel.low), np.asarray(panel.close), panel.days, rsi, atr, rules, start, end)
+        for start, end in task.windows
+    ])
+    return task, stats
+
+def _add_years(day: date, years: int) -> date:
+    # Feb 29 lands on Feb 28 in years without one, where date.replace raises
+    return (pd.Timestamp(day) + pd.DateOffset(years=years)).date()
+
+def walk_forward_windows(panel: BarPanel, train_years: int, test_years: int) -> list[tuple[str, int, int]]:
+    # Anchored on the first bar, folds step forward by the test length
+    windows = [("full", 0, len(panel.days))]
+    if not train_years:
+        return windows
+
+    first = panel.date_of(0)
+    fold = 0
+    while True:
+        train_start = _add_years(first, fold * test_years)
+        test_start = _add_years(first, fold * test_years + train_years)
+        test_end = _add_years(first, fold * test_years + train_years + test_years)
+        if panel.index_of(test_start) >= len(panel.days):
+            break
+        windows.append((f"train_{fold}", panel.index_of(train_start), panel.index_of(test_start)))
+        windows.append((f"test_{fold}", panel.index_of(test_start), panel.index_of(test_end)))
+        fold += 1
+    return windows
+
+def summarize(stats: np.ndarray) -> dict[str, np.ndarray]:
+    trades = stats[..., STAT_TRADES]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = stats[..., STAT_SUM] / trades
+        variance = stats[..., STAT_SUM_SQUARES] / trades - mean ** 2
+        std = np.sqrt(np.maximum(variance * trades / np.maximum(trades - 1, 1), 0))
+        return {
+            "trades": trades.astype(np.int64),
+            "win_rate": stats[..., STAT_WINS] / trades,
+            "mean_return": mean,
+            "std_return": std,
+            "profit_factor": stats[..., STAT_GROSS_PROFIT] / stats[..., STAT_GROSS_LOSS],
+            "bars_held": stats[..., STAT_BARS_HELD] / trades,
+            # t-statistic of the mean trade return, rewards edges that hold over many trades
+            "score": np.where(trades > 1, mean / std * np.sqrt(trades), np.nan)
+        }
+
+def run_sweep(panel_dir: str, grid: dict[str, list], train_years: int = 0, test_years: int = 1, workers: int = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    panel = BarPanel.load(panel_dir)
+    windows = walk_forward_windows(panel, train_years, test_years)
+    workers = workers or os.cpu_count()
+
+    combinations = list(itertools.product(*(grid[name] for name in RULE_PARAMETERS)))
+    groups = list(itertools.product(grid["rsi_length"], grid["atr_length"]))
+
+    # Split each indicator group so every worker has several tasks to balance over
+    chunk_size = max(1, math.ceil(len(groups) * len(combinations) / (workers * 4)))
+    tasks = [
+        SweepTask(rsi_length=rsi_length, atr_length=atr_length, rules=[list(c) for c in combinations[i:i + chunk_size]], windows=[(start, end) for _, start, end in windows])
+        for rsi_length, atr_length in groups
+        for i in range(0, len(combinations), chunk_size)
+    ]
+
+    # Compile (or load the cached kernels) once before the workers fork
+    _init_worker(panel_dir)
+    _run_task(SweepTask(rsi_length=2, atr_length=2, rules=[list(combinations[0])], windows=[(0, min(len(panel.days), 10))]))
+
+    frames = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(panel_dir,)) as executor:
+        for future in as_completed([executor.submit(_run_task, task) for task in tasks]):
+            task, stats = future.result()
+            rules = np.asarray(task.rules)
+            for w, (label, start, end) in enumerate(windows):
+                frame = pd.DataFrame(rules, columns=RULE_PARAMETERS)
+                frame.insert(0, "atr_length", task.atr_length)
+                frame.insert(0, "rsi_length", task.rsi_length)
+                frame.insert(0, "window", label)
+                for name, values in summarize(stats[w]).items():
+                    frame[name] = values
+                frames.append(frame)
+
+    results = pd.concat(frames, ignore_index=True)
+    results["hold_days"] = results["hold_days"].astype(np.int64)
+    parameters = ["rsi_length", "atr_length"] + RULE_PARAMETERS
+
+    # Pick the best combination on each training window and report how it did out of sample
+    selections = []
+    for label, start, end in windows:
+        if not label.startswith("train_"):
+            continue
+        fold = label.split("_")[1]
+        train = results[results["window"] == label].dropna(subset=["score"])
+        if train.empty:
+            continue
+        best = train.loc[train["score"].idxmax(), parameters]
+        test = results[(results["window"] == f"test_{fold}") & (results[parameters] == best.values).all(axis=1)].iloc[0]
+        selections.append({
+            "fold": int(fold),
+            "train_start": panel.date_of(start),
+            "test_start": panel.date_of(end),
+            **best.to_dict(),
+            "train_score": train["score"].max(),
+            "test_score": test["score"],
+            "test_trades": test["trades"],
+            "test_mean_return": test["mean_return"]
+        })
+
+    selections = pd.DataFrame(selections)
+    if not selections.empty:
+        selections[["rsi_length", "atr_length", "hold_days"]] = selections[["rsi_length", "atr_length", "hold_days"]].astype(np.int64)
+    return results.sort_values(["window", "score"], ascending=[True, False]), selections
+
+def build_panel(panel_dir: str, start: datetime = None, symbols: list[str] = None, offline: bool = False):
+    from db import get_active_universe, get_bar_cache, get_universe_by_symbol
+
+    if offline:
+        cache = get_bar_cache()
+        if cache is None:
+            raise ValueError("Offline panels need BAR_CACHE_DIR set")
+        universe = {symbol: table_name for table_name in cache.tables() for symbol in cache.symbols(table_name) if not symbols or symbol in symbols}
+        panel = BarPanel.from_cache(universe, start=start)
+        panel.save(panel_dir)
+        return panel
+
+    # Current universe by default, which carries survivorship bias for older windows
+    if symbols:
+        # Rows come newest week first, so [0] is the table the symbol trades from now
+        universe = {symbol: get_universe_by_symbol(symbol)[0].price_source_table for symbol in symbols}
+    else:
+        week = date.today() - timedelta(days=date.today().weekday())
+        universe = {stock.symbol: stock.price_source_table for stock in get_active_universe(week)}
+
+    panel = BarPanel.from_database(universe, start=start)
+    panel.save(panel_dir)
+    return panel
+
+def parse_values(value: str, cast) -> list:
+    return [cast(item) for item in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep and walk-forward test of the SniperStrategy rules (python -m src.Sweep)")
+    parser.add_argument("--panel-dir", default=SWEEP_PANEL_DIR)
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the bar panel from the database")
+    parser.add_argument("--start", type=date.fromisoformat, help="First date loaded into the panel")
+    parser.add_argument("--symbols", type=lambda value: value.split(","))
+    parser.add_argument("--offline", action="store_true", help="Build the panel from the bar cache without a database")
+    for name, values in DEFAULT_GRID.items():
+        cast = int if isinstance(values[0], int) else float
+        parser.add_argument(f"--{name.replace('_', '-')}", type=lambda value, cast=cast: parse_values(value, cast), default=values)
+    parser.add_argument("--train-years", type=int, default=0, help="Walk-forward training length, 0 runs the full period only")
+    parser.add_argument("--test-years", type=int, default=1)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", default="sweep_results.csv")
+    parser.add_argument("--walk-forward-output", default="sweep_walk_forward.csv")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.refresh or not (Path(args.panel_dir) / "days.npy").exists():
+        start = datetime.combine(args.start, datetime.min.time(), tzinfo=timezone.utc) if args.start else None
+        panel = build_panel(args.panel_dir, start=start, symbols=args.symbols, offline=args.offline)
+        print(f"Built panel of {len(panel.symbols)} symbols x {len(panel.days)} days in {time.perf_counter() - started:.1f}s")
+
+    grid = {name: getattr(args, name) for name in DEFAULT_GRID}
+    for name, value in LIVE_PARAMETERS.items():
+        if value not in grid[name]:
+            grid[name] = grid[name] + [value]
+
+    results, selections = run_sweep(args.panel_dir, grid, args.train_years, args.test_years, args.workers)
+    results.to_csv(args.output, index=False, float_format="%.6g")
+    if not selections.empty:
+        selections.to_csv(args.walk_forward_output, index=False, float_format="%.6g")
+
+    combinations = math.prod(len(values) for values in grid.values())
+    print(f"Swept {combinations} combinations over {results['window'].nunique()} windows in {time.perf_counter() - started:.1f}s")
+    print(results[results["window"] == "full"].head(10).to_string(index=False))
+    if not selections.empty:
+        print(selections.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+
+class PhaseTimer(object):
+    """
+    Records wall-clock duration of named phases, e.g. the stages of engine startup.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.errors: dict[str, str] = {} # Phases run with guard that failed
+
+    @contextmanager
+    def phase(self, name: str):
+        # Repeated phases accumulate, e.g. time spent handling every signal in a cascade
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def guard(self, name: str):
+        # A timed phase whose failure is recorded instead of raised, so the phases after it still run
+        with self.phase(name):
+            try:
+                yield
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"{self.name} phase {name} failed: {str(e)}")
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        lines = [f"{self.name}: {self.elapsed() * 1000:.1f} ms"]
+        for name, seconds in self.phases.items():
+            lines.append(f"  {name}: {seconds * 1000:.1f} ms" + (" (failed)" if name in self.errors else ""))
+        return "\n".join(lines)
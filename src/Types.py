@@ -1,6 +1,9 @@
 from enum import Enum
 from pydantic import BaseModel, Field
-from datetime import datetime
+from datetime import date, datetime
+
+# Account used when a single set of broker credentials is configured
+DEFAULT_ACCOUNT = "default"
 
 class EventType(str, Enum):
     MARKET = "MARKET"
@@ -15,11 +18,19 @@ class Direction(str, Enum):
 class OrderType(str, Enum):
     MARKET = "MARKET"
     LIMIT = "LIMIT"
+    OCO = "OCO" # Take profit limit and stop loss stop, one cancels the other
 
 class OrderIntent(str, Enum):
     OPEN = "OPEN"
     CLOSE = "CLOSE"
 
+class OrderStatus(str, Enum):
+    # The trading.order_status enum, db.models shares it
+    pending = "pending"
+    filled = "filled"
+    cancelled = "cancelled"
+    partial = "partial"
+
 class Bar(BaseModel):
     symbol: str
     timestamp: float
@@ -31,11 +42,20 @@ class Bar(BaseModel):
 
 class Position(BaseModel):
     symbol: str
-    position_id: str = None
+    position_id: str | None = None # None until the database row exists, see Reconciler
     quantity: float
     side: Direction
     entry_price: float
     entry_time: datetime = None
+    strategy: str | None = None # Strategy whose signal opened the position (positions.strategy_tag)
+    signal_price: float | None = None # Entry price the signal asked for, to measure slippage against
+    # Partial closes so far (positions.realized_pnl, closed_quantity), net of their commissions
+    realized_pnl: float = 0.0
+    closed_quantity: float = 0.0
+    # Exit plan, see Portfolio.calculate_exit
+    exit_date: date | None = None
+    take_profit_price: float | None = None
+    stop_loss_price: float | None = None
 
 class Fill(BaseModel):
     symbol: str
@@ -43,6 +63,10 @@ class Fill(BaseModel):
     side: Direction
     fill_price: float
     commission: float
+    order_id: str | None = None # Alpaca order ID
+    order_quantity: float | None = None # Total quantity of the order being filled
+    final: bool = True # False for partial fills that leave the order working
+    account: str = DEFAULT_ACCOUNT # Account whose stream reported the fill
 
 class Order(BaseModel):
     order_id: str | None = None # Alpaca order ID
@@ -52,8 +76,31 @@ class Order(BaseModel):
     direction: Direction
     price: float | None = None
     order_intent: OrderIntent | None = None
+    take_profit_price: float | None = None # OCO only
+    stop_loss_price: float | None = None # OCO only
+    replaces_order_id: str | None = None # Working order to cancel before this one is submitted
+    account: str = DEFAULT_ACCOUNT # Account the order is sent from
+    client_order_id: str | None = None # Sent to the broker, which rejects a second order with the same ID
 
 class Signal(BaseModel):
     strategy_id: str
     symbol: str
-    value: float = 0 # Optional field to represent strength of signal, can be used for position sizing
\ No newline at end of file
+    value: float = 0 # Optional field to represent strength of signal, can be used for position sizing
+    signal_id: str | None = None # Set when delivered through the outbox, the same signal always has the same ID
+
+class TrackedOrder(BaseModel):
+    order_id: str # Alpaca order ID
+    symbol: str
+    quantity: float
+    direction: Direction
+    order_type: OrderType | None = None
+    order_intent: OrderIntent | None = None
+    price: float | None = None
+    stop_price: float | None = None
+    status: OrderStatus = OrderStatus.pending
+    filled_quantity: float = 0
+    average_fill_price: float | None = None
+    updated_at: datetime | None = None
+
+    def is_working(self) -> bool:
+        return self.status in (OrderStatus.pending, OrderStatus.partial)
\ No newline at end of file
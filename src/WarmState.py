@@ -0,0 +1,55 @@
+import os
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from src.Types import *
+
+class IndicatorState(BaseModel):
+    as_of: date
+    close: float
+    atr: float
+
+class WarmState(BaseModel):
+    """
+    State the engine needs the moment it starts: open positions, the symbol -> price table
+    map of the current universe and the most recent indicator values per symbol.
+    """
+    saved_at: datetime = None
+    open_positions: dict[str, Position] = {} # Default account
+    account_positions: dict[str, dict[str, Position]] = {} # Every other account
+    universe_week: date = None
+    universe: dict[str, str] = {}
+    indicators: dict[str, IndicatorState] = {}
+
+    def positions_for(self, account: str) -> dict[str, Position]:
+        return self.open_positions if account == DEFAULT_ACCOUNT else self.account_positions.get(account, {})
+
+    def set_positions(self, account: str, positions: dict[str, Position]):
+        if account == DEFAULT_ACCOUNT:
+            self.open_positions = dict(positions)
+        else:
+            self.account_positions[account] = dict(positions)
+
+class WarmStateStore(object):
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def load(self) -> WarmState | None:
+        try:
+            return WarmState.model_validate_json(self.path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Failed to load warm state snapshot: {e}")
+            return None
+
+    def save(self, state: WarmState):
+        state.saved_at = datetime.now(timezone.utc)
+
+        # Write then rename so a crash never leaves a half-written snapshot behind
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(state.model_dump_json())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,165 @@
+import collections
+import threading
+import time
+from datetime import date
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from pytz import timezone
+
+from db import SIGNAL_CHANNEL, subscribe, ensure_change_triggers, create_outbox_table, publish_signals, claim_signals, ack_signals, dead_letter_signal, SIGNAL_MAX_ATTEMPTS
+
+from src.Alert import send_alert
+from src.Calendar import TradingCalendar
+from src.Context import Context, EventSink
+from src.Events import *
+from src.Strategy import Strategy
+from src.Timer import PhaseTimer
+from src.Types import *
+
+MARKET_TZ = timezone("America/New_York")
+
+def market_date() -> date:
+    return datetime.now(MARKET_TZ).date()
+
+class OutboxSink(EventSink):
+    """
+    Collects the strategy's signals and publishes them to the signal outbox in one transaction.
+    The dedup key is the trading day, strategy and symbol, so a rerun scan publishes nothing new.
+    """
+    def __init__(self):
+        self.pending: list[Signal] = []
+
+    def publish(self, event: Event):
+        if event.event_type == EventType.SIGNAL:
+            self.pending.append(event.signal)
+
+    def flush(self) -> int:
+        signals, self.pending = self.pending, []
+        signal_date = market_date()
+        rows = []
+        for signal in signals:
+            signal_id = f"{signal_date.isoformat()}:{signal.strategy_id}:{signal.symbol}"
+            rows.append({"dedup_key": signal_id, "payload": signal.model_copy(update={"signal_id": signal_id}).model_dump(mode="json")})
+        return publish_signals(rows, signal_date)
+
+class SignalWorker(object):
+    """
+    Runs the strategy's scans in their own process and hands the signals to the execution
+    worker through the outbox, so a slow scan never holds the GIL while fills are handled.
+    """
+    def __init__(self, strategy: Strategy):
+        self.strategy = strategy
+        self.sink = OutboxSink()
+        # Reads the calendar the execution worker's engine keeps on disk
+        self.calendar = TradingCalendar()
+        self.strategy.set_context(Context(event_sink=self.sink, trading_client=None, calendar=self.calendar))
+        self.scheduler = BlockingScheduler()
+
+    def prepare(self):
+        if not self.calendar.is_trading_day():
+            return
+        timer = PhaseTimer("Signal worker pre-open")
+        try:
+            with timer.phase("signals"):
+                self.strategy.prepare(MarketEvent())
+        except Exception as e:
+            print(f"Error preparing signals: {str(e)}")
+            send_alert(f"Error preparing signals: {str(e)}")
+        send_alert(timer.report())
+
+    def publish(self):
+        if not self.calendar.is_trading_day():
+            return
+        timer = PhaseTimer("Signal worker open")
+        published = 0
+        try:
+            with timer.phase("signals"):
+                self.strategy.on_update(MarketEvent())
+            with timer.phase("outbox"):
+                published = self.sink.flush()
+        except Exception as e:
+            print(f"Error publishing signals: {str(e)}")
+            send_alert(f"Error publishing signals: {str(e)}")
+        send_alert(f"{timer.report()}\n  {published} signals published")
+
+    def run(self):
+        create_outbox_table()
+        ensure_change_triggers()
+        self.strategy.watch_universe()
+
+        # Same times as the engine's pre-open and market open jobs
+        self.scheduler.add_job(self.prepare, trigger="cron", day_of_week="mon-fri", hour=9, minute=15, timezone=MARKET_TZ, id="pre_open_signals")
+        self.scheduler.add_job(self.publish, trigger="cron", day_of_week="mon-fri", hour=9, minute=30, timezone=MARKET_TZ, id="market_open_signals")
+        self.scheduler.start()
+
+class SignalConsumer(object):
+    """
+    Delivers outbox signals to the execution worker's engine.
+
+    Woken by NOTIFY and polling as a fallback, it claims pending signals, runs each through
+    a cascade and acknowledges it afterwards. A signal that was handled but not acknowledged
+    is delivered again; it maps to the same client order ID, so the broker rejects the repeat.
+    """
+    def __init__(self, engine, poll_interval: float = 5.0, batch_size: int = 100):
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.delivered = 0
+
+        # Handled IDs whose ack write failed, skipped rather than handled twice in-process
+        self._handled: collections.deque[int] = collections.deque(maxlen=10000)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="signal-consumer", daemon=True)
+
+    def start(self):
+        create_outbox_table()
+        # Also called when the LISTEN starts or reconnects, so signals published meanwhile are drained
+        subscribe(SIGNAL_CHANNEL, lambda payload: self._wakeup.set())
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                while self.drain() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Error consuming signals: {str(e)}")
+                time.sleep(self.poll_interval)
+            self._wakeup.wait(self.poll_interval)
+
+    def drain(self) -> int:
+        rows = claim_signals(limit=self.batch_size)
+        handled = []
+        for row in rows:
+            try:
+                self.handle(row)
+                handled.append(row["id"])
+            except Exception as e:
+                # Left unacknowledged, it is delivered again after the visibility timeout, until it has used its attempts
+                print(f"Error handling outbox signal {row['id']}: {str(e)}")
+                if row["attempts"] >= SIGNAL_MAX_ATTEMPTS:
+                    dead_letter_signal(row["id"], str(e))
+                    send_alert(f"Gave up on outbox signal {row['id']} after {row['attempts']} attempts: {str(e)}")
+        if not ack_signals(handled):
+            self._handled.extend(handled)
+        return len(rows)
+
+    def handle(self, row: dict):
+        if row["id"] in self._handled:
+            return
+
+        # Entry prices are only good for the session they were computed for
+        if row["signal_date"] != market_date():
+            print(f"Dropping outbox signal {row['id']} from {row['signal_date']}")
+            return
+
+        # Called from the consumer thread, handle_update waits for any stream or scheduler cascade
+        signal = Signal.model_validate(row["payload"])
+        self.engine.handle_update(SignalEvent(signal=signal))
+        self.delivered += 1
@@ -0,0 +1,15 @@
+import pytest
+
+@pytest.fixture
+def direct_writes(monkeypatch):
+    # Straight to Postgres, as with DB_SPOOL_PATH unset, so a failed write is not spooled away
+    import db.spool as spool
+    from db import get_db_session
+    from sqlalchemy import text
+
+    try:
+        with get_db_session() as session:
+            session.execute(text("SELECT 1"))
+    except Exception as e:
+        pytest.skip(f"database unavailable: {e}")
+    monkeypatch.setattr(spool, "_write_spool", spool.DirectWrites())
@@ -0,0 +1,32 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from src.Calendar import MARKET_TZ, CalendarSnapshot, TradingCalendar, TradingSession
+
+def write_snapshot(path, start: date, end: date, sessions: dict[date, TradingSession], mtime: float):
+    snapshot = CalendarSnapshot(fetched_at=datetime.now(timezone.utc), start=start, end=end, sessions=sessions)
+    path.write_text(snapshot.model_dump_json())
+    os.utime(path, (mtime, mtime))
+
+def session(day: date, close_hour: int = 16) -> TradingSession:
+    return TradingSession(date=day, open=MARKET_TZ.localize(datetime(day.year, day.month, day.day, 9, 30)),
+                          close=MARKET_TZ.localize(datetime(day.year, day.month, day.day, close_hour)))
+
+def test_reads_the_file_again_when_another_process_rewrites_it(tmp_path):
+    # The signal worker has no broker client, the engine refreshes the file it reads
+    path = tmp_path / "calendar.json"
+    monday = date(2026, 11, 23)
+    friday = monday + timedelta(days=4)
+    write_snapshot(path, monday, friday, {monday: session(monday)}, mtime=1_000_000)
+
+    calendar = TradingCalendar(path=str(path))
+    assert calendar.session(monday).close.hour == 16
+    assert calendar.session(friday) is None # A holiday in the first snapshot
+
+    write_snapshot(path, monday, friday, {monday: session(monday), friday: session(friday, close_hour=13)}, mtime=2_000_000)
+    assert calendar.session(friday).early_close
+
+def test_missing_file_falls_back_to_weekdays(tmp_path):
+    calendar = TradingCalendar(path=str(tmp_path / "missing.json"))
+    assert calendar.is_trading_day(date(2026, 11, 23))
+    assert not calendar.is_trading_day(date(2026, 11, 22))
@@ -0,0 +1,26 @@
+import pytest
+
+try:
+    # db builds its pools from DB_* (usually .env) at import
+    import src.Engine as engine_module
+    from src.Account import AccountConfig
+    from src.Events import MarketEvent
+    from src.Profiler import CascadeProfiler
+except Exception as e:
+    pytest.skip(f"database settings unavailable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_module, "JOURNAL_DIR", str(tmp_path / "journal"))
+    monkeypatch.setattr(engine_module, "WARM_STATE_PATH", str(tmp_path / "warm_state.json"))
+    profiler = CascadeProfiler(directory=str(tmp_path / "profiles"))
+    return engine_module.Engine(profiler=profiler, dry_run=True, accounts=[AccountConfig(name="default", api_key="key", secret="secret")])
+
+def test_cascade_runs_and_is_profiled_by_event_type(engine, tmp_path):
+    # The cascade is named from the event type, a plain string on every event
+    engine.profiler.enable(cascades=1)
+    engine.handle_update(MarketEvent())
+
+    assert engine.cascade_count == 1
+    assert engine.cascade_started is None and engine.last_cascade_seconds is not None
+    assert [path.name for path in (tmp_path / "profiles").iterdir() if "_cascade_market_" in path.name]
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import Indicators as indicators
+
+ta = pytest.importorskip("pandas_ta_classic")
+
+LENGTHS = (2, 5, 14)
+
+def bars(count: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=count))
+    return close + rng.random(count), close - rng.random(count), close
+
+def reference(result: pd.Series | None, count: int) -> np.ndarray:
+    # pandas_ta returns None instead of an all-NaN series when there are too few bars
+    return np.full(count, np.nan) if result is None else result.to_numpy(dtype=np.float64)
+
+def reference_rsi(close: np.ndarray, length: int) -> np.ndarray:
+    return reference(ta.rsi(pd.Series(close), length=length), len(close))
+
+def reference_atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, length: int) -> np.ndarray:
+    return reference(ta.atr(pd.Series(high), pd.Series(low), pd.Series(close), length=length), len(close))
+
+def assert_matches(ours: np.ndarray, theirs: np.ndarray):
+    np.testing.assert_array_equal(np.isnan(ours), np.isnan(theirs), err_msg="warm-up bars differ")
+    np.testing.assert_allclose(ours, theirs, rtol=1e-9, atol=1e-9)
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_rsi_matches_pandas_ta(length):
+    _, _, close = bars(300)
+    assert_matches(indicators.rsi(close, length), reference_rsi(close, length))
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_atr_matches_pandas_ta(length):
+    high, low, close = bars(300)
+    assert_matches(indicators.atr(high, low, close, length), reference_atr(high, low, close, length))
+
+@pytest.mark.parametrize("length", LENGTHS)
+@pytest.mark.parametrize("extra", (-1, 0, 1, 2))
+def test_short_series(length, extra):
+    # Around the first bar with enough history, including series too short for any value
+    high, low, close = bars(length + extra, seed=length)
+    assert_matches(indicators.rsi(close, length), reference_rsi(close, length))
+    assert_matches(indicators.atr(high, low, close, length), reference_atr(high, low, close, length))
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_nan_bars_are_skipped(length):
+    # A NaN bar matches pandas_ta on the series without it, and is NaN itself
+    high, low, close = bars(120, seed=length)
+    missing = np.zeros(len(close), dtype=bool)
+    missing[[0, 7, 8, 30, 31, 32, 77]] = True
+    high[missing] = low[missing] = close[missing] = np.nan
+    present = ~missing
+
+    ours = indicators.rsi(close, length)
+    assert np.isnan(ours[missing]).all()
+    assert_matches(ours[present], reference_rsi(close[present], length))
+
+    ours = indicators.atr(high, low, close, length)
+    assert np.isnan(ours[missing]).all()
+    assert_matches(ours[present], reference_atr(high[present], low[present], close[present], length))
+
+def test_all_nan_series():
+    close = np.full(20, np.nan)
+    assert np.isnan(indicators.rsi(close, 14)).all()
+    assert np.isnan(indicators.atr(close, close, close, 14)).all()
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_panel_kernels_match_rows(length):
+    panel = [bars(60, seed=seed) for seed in range(3)]
+    high, low, close = (indicators.as_array(np.vstack([symbol[i] for symbol in panel])) for i in range(3))
+
+    rsi = indicators.rsi_2d(close, length)
+    atr = indicators.atr_2d(high, low, close, length)
+    for j in range(close.shape[0]):
+        np.testing.assert_array_equal(rsi[j], indicators.rsi(close[j], length))
+        np.testing.assert_array_equal(atr[j], indicators.atr(high[j], low[j], close[j], length))
@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+
+try:
+    # db builds its pools from DB_* (usually .env) at import
+    from db import create_order, get_db_session, get_order_by_id
+    from sqlalchemy import text
+    from src.OrderManager import OrderManager
+    from src.Types import Direction, Order, OrderIntent, OrderStatus, OrderType
+except Exception as e:
+    pytest.skip(f"database settings unavailable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def order_ids():
+    ids = []
+    yield ids
+    with get_db_session() as session:
+        session.execute(text("DELETE FROM trading.orders WHERE order_id = ANY(:ids)"), {"ids": ids})
+
+def test_flush_skips_orders_without_a_row(direct_writes, order_ids):
+    # Orders picked up from the broker, or OCO legs, are tracked without a trading.orders row
+    recorded, unrecorded = str(uuid.uuid4()), str(uuid.uuid4())
+    order_ids.extend([recorded, unrecorded])
+    assert create_order(order_id=recorded, symbol="AAA", quantity_ordered=10) is not None
+
+    manager = OrderManager()
+    order = Order(symbol="AAA", quantity=10, order_type=OrderType.LIMIT, direction=Direction.LONG, order_intent=OrderIntent.OPEN, price=1.0)
+    for order_id in (recorded, unrecorded):
+        tracked = manager.track(order, order_id)
+        manager._store(tracked.model_copy(update={"status": OrderStatus.filled, "filled_quantity": 10}))
+        manager._dirty.add(order_id)
+
+    assert manager.flush() == 2
+    assert not manager._dirty
+    assert get_order_by_id(recorded).status == OrderStatus.filled.value
+    assert get_order_by_id(unrecorded) is None
+
+def test_flush_drops_only_updates_that_cannot_be_written(direct_writes, order_ids):
+    good, bad = str(uuid.uuid4()), str(uuid.uuid4())
+    order_ids.extend([good, bad])
+    for order_id in (good, bad):
+        create_order(order_id=order_id, symbol="AAA", quantity_ordered=10)
+
+    manager = OrderManager()
+    order = Order(symbol="AAA", quantity=10, order_type=OrderType.LIMIT, direction=Direction.LONG, order_intent=OrderIntent.OPEN, price=1.0)
+    manager._store(manager.track(order, good).model_copy(update={"status": OrderStatus.partial, "filled_quantity": 4}))
+    manager._dirty.add(good)
+    manager._store(manager.track(order, bad).model_copy(update={"filled_quantity": "not a number"}))
+    manager._dirty.add(bad)
+
+    assert manager.flush() == 1
+    assert not manager._dirty
+    assert get_order_by_id(good).status == OrderStatus.partial.value
@@ -0,0 +1,45 @@
+import uuid
+
+import pytest
+
+try:
+    # db builds its pools from DB_* (usually .env) at import
+    import src.Workers as workers
+    from db import SIGNAL_MAX_ATTEMPTS, claim_signals, create_outbox_table, get_db_session, publish_signals
+    from sqlalchemy import text
+except Exception as e:
+    pytest.skip(f"database settings unavailable: {e}", allow_module_level=True)
+
+class FailingEngine(object):
+    def handle_update(self, event):
+        raise RuntimeError("cannot size the entry")
+
+@pytest.fixture
+def signal_id(direct_writes):
+    create_outbox_table()
+    key = f"test-{uuid.uuid4()}"
+    publish_signals([{"dedup_key": key, "payload": {"strategy_id": "test", "symbol": "AAA", "value": 1.0}}], workers.market_date())
+    with get_db_session() as session:
+        signal_id = session.execute(text("SELECT id FROM trading.signal_outbox WHERE dedup_key = :key"), {"key": key}).scalar_one()
+        # Other pending signals count as claimed for the visibility timeout, so only this one is delivered
+        session.execute(text("UPDATE trading.signal_outbox SET claimed_at = CURRENT_TIMESTAMP WHERE processed_at IS NULL AND id <> :id"), {"id": signal_id})
+    yield signal_id
+    with get_db_session() as session:
+        session.execute(text("DELETE FROM trading.signal_outbox WHERE id = :id"), {"id": signal_id})
+
+def test_failing_signal_is_dead_lettered(signal_id, monkeypatch):
+    alerts = []
+    monkeypatch.setattr(workers, "send_alert", alerts.append)
+    consumer = workers.SignalConsumer(FailingEngine())
+
+    for attempt in range(SIGNAL_MAX_ATTEMPTS):
+        assert consumer.drain() == 1
+        # Past the visibility timeout
+        with get_db_session() as session:
+            session.execute(text("UPDATE trading.signal_outbox SET claimed_at = NULL WHERE id = :id"), {"id": signal_id})
+
+    with get_db_session() as session:
+        row = session.execute(text("SELECT processed_at, error, attempts FROM trading.signal_outbox WHERE id = :id"), {"id": signal_id}).one()
+    assert row.processed_at is not None and row.error == "cannot size the entry" and row.attempts == SIGNAL_MAX_ATTEMPTS
+    assert len(alerts) == 1 and str(signal_id) in alerts[0]
+    assert signal_id not in [claimed["id"] for claimed in claim_signals()]
@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import Indicators as indicators
+
+try:
+    # db builds its pools from DB_* (usually .env) at import
+    import src.Portfolio as portfolio_module
+    from src.Context import Context
+    from src.Types import Direction, Position
+except Exception as e:
+    pytest.skip(f"database settings unavailable: {e}", allow_module_level=True)
+
+def test_exit_plan_without_a_scan_computes_atr_from_bars(monkeypatch):
+    # A position the scan did not cover fetches its bars and computes the ATR itself
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(size=30))
+    bars = pd.DataFrame({"high": close + rng.random(30), "low": close - rng.random(30), "close": close})
+    monkeypatch.setattr(portfolio_module, "get_universe_by_symbol", lambda symbol: [SimpleNamespace(price_source_table="bars_daily")])
+    monkeypatch.setattr(portfolio_module, "get_latest_entries", lambda table_name, symbol, n: bars)
+
+    portfolio = portfolio_module.Portfolio()
+    portfolio.set_context(Context(event_sink=None, trading_client=None))
+    position = Position(symbol="AAA", quantity=10, side=Direction.LONG, entry_price=100.0, entry_time=datetime.now(timezone.utc))
+    portfolio.calculate_exit(position)
+
+    atr = indicators.atr(indicators.as_array(bars["high"]), indicators.as_array(bars["low"]), indicators.as_array(bars["close"]), 14)[-1]
+    assert position.take_profit_price == round(100.0 + atr, 2)
+    assert position.stop_loss_price == round(100.0 - 2 * atr, 2)
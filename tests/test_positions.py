@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+
+import pytest
+
+try:
+    # db builds its pools from DB_* (usually .env) at import
+    from db import bulk_update_positions, create_position, get_db_session, get_position_by_id
+    from sqlalchemy import text
+except Exception as e:
+    pytest.skip(f"database settings unavailable: {e}", allow_module_level=True)
+
+ACCOUNT = "test-positions"
+
+@pytest.fixture
+def cleanup():
+    yield
+    with get_db_session() as session:
+        session.execute(text("DELETE FROM trading.positions WHERE account = :account"), {"account": ACCOUNT})
+
+def test_bulk_update_skips_deleted_rows(direct_writes, cleanup):
+    # A position deleted between the reconciler's read and its write must not fail the batch
+    position = create_position(symbol="AAA", status="OPEN", side="LONG", open_time=datetime.now(timezone.utc),
+                               open_price=10, quantity=5, account=ACCOUNT)
+    missing = position.id + 1_000_000_000
+
+    assert bulk_update_positions([
+        {"id": missing, "status": "CLOSED", "close_time": datetime.now(timezone.utc)},
+        {"id": position.id, "quantity": 3},
+        {"id": position.id, "notes": "checked", "tags": {"source": "test"}},
+    ])
+    updated = get_position_by_id(position.id)
+    assert float(updated.quantity) == 3
+    assert updated.notes == "checked" and updated.tags == {"source": "test"}
@@ -0,0 +1,23 @@
+from datetime import date
+
+import numpy as np
+
+from src.Sweep import BarPanel, walk_forward_windows
+
+def daily_panel(first: date, last: date) -> BarPanel:
+    epoch = date(1970, 1, 1)
+    days = np.arange((first - epoch).days, (last - epoch).days + 1)
+    bars = np.ones((1, len(days)))
+    return BarPanel(np.array(["AAA"]), days, bars, bars, bars, bars)
+
+def test_walk_forward_from_a_leap_day():
+    # Anniversaries of Feb 29 fall on Feb 28 in other years
+    panel = daily_panel(date(2016, 2, 29), date(2020, 12, 31))
+    windows = walk_forward_windows(panel, train_years=2, test_years=1)
+
+    names = [name for name, _, _ in windows]
+    assert names == ["full", "train_0", "test_0", "train_1", "test_1", "train_2", "test_2"]
+    bounds = {name: (panel.date_of(start), panel.date_of(end)) for name, start, end in windows}
+    assert bounds["train_0"] == (date(2016, 2, 29), date(2018, 2, 28))
+    assert bounds["test_0"] == (date(2018, 2, 28), date(2019, 2, 28))
+    assert bounds["test_2"] == (date(2020, 2, 29), date(2020, 12, 31))